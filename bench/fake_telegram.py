@@ -0,0 +1,203 @@
+"""In-memory stand-in for the pyrogram ``Client`` methods main.py uses.
+
+Accounts built with TELEGRAM_BACKEND=fake (or ``main.telegram_client_factory =
+network.create_client``) never touch the network: channels, bots and mini-apps live
+in a shared ``FakeTelegramNetwork`` with configurable latency and FLOOD_WAIT injection.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, Optional, Set
+from urllib.parse import quote
+
+from pyrogram.errors import BotAppInvalid, FloodWait, PeerIdInvalid, UserAlreadyParticipant, UserNotParticipant
+from pyrogram.raw.functions.messages import RequestAppWebView
+from pyrogram.raw.types import InputPeerChannel, InputPeerUser
+
+VIRUS_BOT = "virus_play_bot"
+
+
+def _stable_id(value: str, base: int) -> int:
+    return base + int(hashlib.sha1(value.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class FakeTelegramNetwork:
+    """Shared Telegram state for all fake clients: users, bots, mini-apps and channel members."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        flood_rate: float = 0.0,
+        flood_seconds: int = 5,
+        default_short_name: Optional[str] = "webapp",
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.default_short_name = default_short_name
+        self.random = random.Random(seed)
+        self.bot_apps: Dict[str, Set[str]] = {VIRUS_BOT: {"app"}}
+        self.members: Dict[int, Set[int]] = {}
+        self.usernames: Dict[int, str] = {}
+        self.calls: Counter = Counter()
+        self.flood_waits: Counter = Counter()
+        self.penalties: Dict[tuple, float] = {}
+        self.messages: list = []
+
+    def create_client(self, config: dict) -> "FakeTelegramClient":
+        return FakeTelegramClient(self, config)
+
+    def register_bot_app(self, bot_username: str, *short_names: str):
+        self.bot_apps.setdefault(bot_username.lower(), set()).update(short_names)
+
+    def short_names_for(self, bot_username: str) -> Set[str]:
+        key = bot_username.lower()
+        if key not in self.bot_apps:
+            self.bot_apps[key] = {self.default_short_name} if self.default_short_name else set()
+        return self.bot_apps[key]
+
+    def user_id_for(self, username: str) -> int:
+        user_id = _stable_id(username.lower(), 5_000_000_000)
+        self.usernames[user_id] = username
+        return user_id
+
+    def chat_for(self, ref) -> SimpleNamespace:
+        """Resolve a chat id, @username or t.me invite link to one stable fake channel."""
+        if isinstance(ref, int):
+            username = self.usernames.get(ref)
+            return SimpleNamespace(id=ref, username=username, title=username or str(ref))
+        value = str(ref).strip()
+        invite_hash = None
+        if "t.me/" in value:
+            path = value.split("t.me/", 1)[1].strip("/")
+            if path.startswith("+"):
+                invite_hash = path[1:]
+            elif path.startswith("joinchat/"):
+                invite_hash = path.split("/", 1)[1]
+            else:
+                value = path.split("/")[0]
+        key = f"+{invite_hash}" if invite_hash else value.lstrip("@").lower()
+        chat_id = -_stable_id(key, 1_000_000_000_000)
+        username = None if invite_hash else key
+        self.usernames[chat_id] = username
+        return SimpleNamespace(id=chat_id, username=username, title=key, invite_hash=invite_hash)
+
+    async def before_call(self, method: str, caller: str = ""):
+        self.calls[method] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000 * (0.5 + self.random.random()))
+        # Like Telegram, repeating a method before its FLOOD_WAIT expires is refused again
+        pending = self.penalties.get((caller, method), 0.0) - time.monotonic()
+        if pending > 0:
+            self.flood_waits[method] += 1
+            raise FloodWait(value=math.ceil(pending))
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.flood_waits[method] += 1
+            self.penalties[(caller, method)] = time.monotonic() + self.flood_seconds
+            raise FloodWait(value=self.flood_seconds)
+
+
+class FakeTelegramClient:
+    """Implements the ``TelegramClientLike`` protocol from main.py against a FakeTelegramNetwork."""
+
+    def __init__(self, network: FakeTelegramNetwork, config: dict):
+        self.network = network
+        self.name = config.get("session_name") or "fake"
+        self.phone_number = config.get("phone_number")
+        self.me_username = f"fake_{self.name}"
+        self.me_id = network.user_id_for(self.me_username)
+        self.is_connected = False
+        # pyrogram keeps resolved peers in the session storage; only the first lookup is a call
+        self.peers: Set[str] = set()
+
+    async def start(self):
+        await self.network.before_call("start", self.name)
+        self.is_connected = True
+        return self
+
+    async def stop(self):
+        self.is_connected = False
+        return self
+
+    async def get_users(self, user_ids):
+        await self.network.before_call("get_users", self.name)
+        username = str(user_ids).lstrip("@")
+        user_id = self.network.user_id_for(username)
+        return SimpleNamespace(
+            id=user_id,
+            username=username,
+            is_bot=username.lower().endswith("bot"),
+            raw=SimpleNamespace(access_hash=user_id ^ 0x5A5A5A5A),
+        )
+
+    async def resolve_peer(self, peer_id):
+        value = str(peer_id).lstrip("@")
+        if value.lower() not in self.peers:
+            await self.network.before_call("resolve_peer", self.name)
+            self.peers.add(value.lower())
+        if isinstance(peer_id, int) and peer_id < 0:
+            return InputPeerChannel(channel_id=-peer_id, access_hash=peer_id ^ 0x5A5A5A5A)
+        user_id = self.network.user_id_for(value)
+        return InputPeerUser(user_id=user_id, access_hash=user_id ^ 0x5A5A5A5A)
+
+    def _init_data(self) -> str:
+        user = json.dumps({"id": self.me_id, "username": self.me_username}, separators=(",", ":"))
+        return f"query_id=fake{self.me_id}&user={quote(user)}&auth_date={int(time.time())}&hash=fake"
+
+    async def invoke(self, query):
+        await self.network.before_call(f"invoke.{type(query).__name__}", self.name)
+        if not isinstance(query, RequestAppWebView):
+            return SimpleNamespace()
+        bot_username = self.network.usernames.get(query.app.bot_id.user_id, "")
+        if query.app.short_name not in self.network.short_names_for(bot_username):
+            raise BotAppInvalid()
+        web_data = quote(self._init_data(), safe="")
+        return SimpleNamespace(url=f"https://{bot_username}.example/#tgWebAppData={web_data}&tgWebAppVersion=8.0")
+
+    async def join_chat(self, chat_id):
+        await self.network.before_call("join_chat", self.name)
+        chat = self.network.chat_for(chat_id)
+        members = self.network.members.setdefault(chat.id, set())
+        if self.me_id in members:
+            raise UserAlreadyParticipant()
+        members.add(self.me_id)
+        return chat
+
+    async def get_chat(self, chat_id):
+        await self.network.before_call("get_chat", self.name)
+        return self.network.chat_for(chat_id)
+
+    async def leave_chat(self, chat_id, delete: bool = False):
+        await self.network.before_call("leave_chat", self.name)
+        if isinstance(chat_id, str) and "t.me/" in chat_id:
+            # pyrogram cannot resolve invite links for leave_chat either
+            raise PeerIdInvalid()
+        chat = self.network.chat_for(chat_id)
+        members = self.network.members.setdefault(chat.id, set())
+        if self.me_id not in members:
+            raise UserNotParticipant()
+        members.discard(self.me_id)
+        return True
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.network.before_call("send_message", self.name)
+        self.network.messages.append((self.name, chat_id, text))
+        return SimpleNamespace(id=len(self.network.messages), chat=SimpleNamespace(id=chat_id), text=text)
+
+    async def delete_chat_history(self, chat_id, revoke: bool = False, **kwargs):
+        await self.network.before_call("delete_chat_history", self.name)
+        return 1
+
+
+default_network = FakeTelegramNetwork(
+    latency_ms=float(os.getenv("FAKE_TG_LATENCY_MS", "0")),
+    flood_rate=float(os.getenv("FAKE_TG_FLOOD_RATE", "0")),
+    flood_seconds=int(os.getenv("FAKE_TG_FLOOD_SECONDS", "5")),
+)
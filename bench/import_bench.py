@@ -0,0 +1,95 @@
+"""Measure how long ``import main`` takes and fail when it exceeds a budget.
+
+    python bench/import_bench.py --runs 5 --budget-ms 800
+
+Each run imports main.py in a fresh interpreter without BOT_TOKEN / ADMIN_ID in the
+process environment, as a config check or the benchmark harness would.
+Reports the median wall time and the slowest top-level imports (``-X importtime``), and
+exits 1 when the median is over budget or a lazily imported stack (pyrogram, aiogram)
+was loaded at import.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LAZY_MODULES = ("pyrogram", "aiogram")
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "import main\n"
+    "print(round((time.perf_counter() - started) * 1000, 1))\n"
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+)
+IMPORTTIME_RE = re.compile(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)")
+
+
+def probe_env() -> dict:
+    env = {key: value for key, value in os.environ.items() if key not in ("BOT_TOKEN", "ADMIN_ID")}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def import_once(importtime: bool = False):
+    command = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", PROBE]
+    result = subprocess.run(
+        command,
+        cwd=ROOT,
+        env=probe_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = result.stdout.strip().splitlines()
+    loaded = [name for name in lines[-1].split(",") if name] if len(lines) > 1 else []
+    return float(lines[-2] if len(lines) > 1 else lines[-1]), loaded, result.stderr
+
+
+def slowest_imports(stderr: str, limit: int) -> list:
+    totals = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        # depth 1 = modules imported directly by main (or by the interpreter startup)
+        if match and len(match.group(2)) == 3:
+            totals[match.group(3)] = int(match.group(1)) / 1000
+    return sorted(totals.items(), key=lambda kv: -kv[1])[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget for main.py")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="maximum median import time")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args(argv)
+
+    # The first run warms the OS file cache and is not counted
+    import_once()
+    timings = []
+    loaded = []
+    for _ in range(args.runs):
+        elapsed, loaded, _ = import_once()
+        timings.append(elapsed)
+    _, _, importtime = import_once(importtime=True)
+
+    median = statistics.median(timings)
+    print(f"import main: median {median:.1f} ms, min {min(timings):.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("slowest imports (cumulative ms):")
+    for module, ms in slowest_imports(importtime, args.top):
+        print(f"  {module:<40} {ms:.1f}")
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f"median {median:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+    if loaded:
+        failures.append(f"imported at module load: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+"""Local stand-in for the VirusGift GraphQL API used by main.py.
+
+Run standalone:
+    python bench/mock_server.py --port 8799 --latency-ms 80 --error-rate 0.02
+
+then point the bot at it with VIRUSGIFT_GRAPHQL_URL=http://127.0.0.1:8799/api/graphql/query
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import formatdate
+from typing import Callable, Dict, Optional, Set
+from urllib.parse import parse_qs
+
+from aiohttp import web
+
+GRAPHQL_PATH = "/api/graphql/query"
+
+CLICK_CODES = (
+    "TEST_SPIN_URL_CLICK_REQUIRED",
+    "TEST_SPIN_PORTAL_CLICK_REQUIRED",
+    "TEST_SPIN_TONNEL_CLICK_REQUIRED",
+    "TEST_SPIN_TONPLAY_CLICK_REQUIRED",
+)
+CLICK_LINKS = {
+    "TEST_SPIN_URL_CLICK_REQUIRED": "https://t.me/partner_demo_bot?startapp=vr",
+    "TEST_SPIN_PORTAL_CLICK_REQUIRED": "https://t.me/portals/market?startapp=vr",
+    "TEST_SPIN_TONNEL_CLICK_REQUIRED": "https://t.me/tonnel_network_bot/gifts?startapp=vr",
+    "TEST_SPIN_TONPLAY_CLICK_REQUIRED": "https://t.me/tonplay_bot?start=vr",
+}
+CLICK_MUTATIONS = {
+    "markTestSpinTaskClick": "TEST_SPIN_URL_CLICK_REQUIRED",
+    "markTestSpinPortalClick": "TEST_SPIN_PORTAL_CLICK_REQUIRED",
+    "markTestSpinTonnelClick": "TEST_SPIN_TONNEL_CLICK_REQUIRED",
+    "markTestSpinTonplayClick": "TEST_SPIN_TONPLAY_CLICK_REQUIRED",
+}
+SUBSCRIPTION_CHANNEL = "https://t.me/virus_demo_channel"
+PRIZES = (
+    {"id": 1, "name": "5 Stars", "exchangeCurrency": "STARS", "exchangePrice": 5, "stars": 5},
+    {"id": 2, "name": "25 Stars", "exchangeCurrency": "STARS", "exchangePrice": 25, "stars": 25},
+    {"id": 3, "name": "100 Virus", "exchangeCurrency": "VIRUS", "exchangePrice": 100, "virus": 100},
+    {"id": 4, "name": "500 Virus", "exchangeCurrency": "VIRUS", "exchangePrice": 500, "virus": 500},
+)
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 50.0
+    jitter_ms: float = 20.0
+    error_502_rate: float = 0.0
+    click_rate: float = 0.0
+    subscription_rate: float = 0.0
+    story_rate: float = 0.0
+    spin_cooldown: float = 24 * 3600
+    case_cooldown: float = 24 * 3600
+    persisted_queries: bool = True
+    clock_skew: float = 0.0
+    # One partner click for everyone (like the live campaigns) instead of a random one per spin
+    shared_requirements: bool = True
+    seed: Optional[int] = None
+
+
+@dataclass
+class MockUser:
+    user_id: int
+    username: str
+    balance: int = 0
+    stars_balance: int = 0
+    next_free_spin: float = 0.0
+    next_case_free_spin: float = 0.0
+    pending_click: Optional[str] = None
+    pending_subscription: bool = False
+    clicked: Set[str] = field(default_factory=set)
+    requirements_rolled: bool = False
+    prizes: Dict[int, dict] = field(default_factory=dict)
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def gql_error(code: str, message: str = "", **extensions) -> dict:
+    return {"errors": [{"message": message or code, "extensions": {"code": code, **extensions}}], "data": None}
+
+
+class MockVirusGift:
+    """In-memory VirusGift backend with configurable latency and error injection."""
+
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.users: Dict[str, MockUser] = {}
+        self.next_user_prize_id = 1000
+        self.http_requests = 0
+        self.http_502 = 0
+        self.request_bytes = 0
+        self.persisted_queries: Dict[str, str] = {}
+        self.operations: Dict[str, int] = {}
+        self.error_codes: Dict[str, int] = {}
+        self.latencies_ms: list = []
+        self.campaign_click = self.random.choice(CLICK_CODES)
+        # Optional membership check (telegram user id -> joined SUBSCRIPTION_CHANNEL?)
+        self.subscription_check: Optional[Callable[[int], bool]] = None
+
+    def now(self) -> float:
+        """The server's clock, ``clock_skew`` seconds ahead of this machine's."""
+        return time.time() + self.config.clock_skew
+
+    # -- HTTP -------------------------------------------------------------
+
+    async def handle(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        self.http_requests += 1
+        delay = max(0.0, self.config.latency_ms + self.random.uniform(-1, 1) * self.config.jitter_ms) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            if self.random.random() < self.config.error_502_rate:
+                self.http_502 += 1
+                return web.Response(status=502, text="Bad Gateway")
+            raw = await request.read()
+            self.request_bytes += len(raw)
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                return web.json_response(gql_error("BAD_REQUEST"), status=400)
+            token = request.headers.get("authorization", "")
+            headers = {"Date": formatdate(self.now(), usegmt=True)}
+            if isinstance(body, list):
+                return web.json_response([self.execute(item, token) for item in body], headers=headers)
+            return web.json_response(self.execute(body, token), headers=headers)
+        finally:
+            self.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(GRAPHQL_PATH, self.handle)
+        return app
+
+    # -- GraphQL ----------------------------------------------------------
+
+    def execute(self, payload: dict, token: str) -> dict:
+        result = self._execute(payload, token)
+        for error in result.get("errors") or ():
+            code = error["extensions"]["code"]
+            self.error_codes[code] = self.error_codes.get(code, 0) + 1
+        return result
+
+    def _execute(self, payload: dict, token: str) -> dict:
+        operation = str((payload or {}).get("operationName") or "")
+        variables = (payload or {}).get("variables") or {}
+        persisted = ((payload or {}).get("extensions") or {}).get("persistedQuery")
+        if persisted:
+            error = self.lookup_persisted_query(payload, persisted)
+            if error:
+                return error
+        self.operations[operation] = self.operations.get(operation, 0) + 1
+
+        if operation == "authTelegramInitData":
+            return self.op_auth(variables)
+
+        user = self.users.get(token.replace("Bearer ", "", 1)) if token else None
+        if user is None:
+            return gql_error("UNAUTHORIZED", "Unauthorized")
+
+        handler = getattr(self, f"op_{operation}", None)
+        if handler is None:
+            if operation in CLICK_MUTATIONS:
+                return self.op_click(user, operation)
+            return gql_error("UNKNOWN_OPERATION", f"Unknown operation {operation}")
+        return handler(user, variables)
+
+    def lookup_persisted_query(self, payload: dict, persisted: dict) -> Optional[dict]:
+        """APQ: register query + sha256Hash, answer a bare unknown hash with PersistedQueryNotFound."""
+        if not self.config.persisted_queries:
+            return gql_error("PERSISTED_QUERY_NOT_SUPPORTED", "PersistedQueryNotSupported")
+        sha256 = str(persisted.get("sha256Hash") or "")
+        query = payload.get("query")
+        if query:
+            if hashlib.sha256(query.encode("utf-8")).hexdigest() != sha256:
+                return gql_error("BAD_REQUEST", "provided APQ hash does not match query")
+            self.persisted_queries[sha256] = query
+            return None
+        if sha256 not in self.persisted_queries:
+            return gql_error("PERSISTED_QUERY_NOT_FOUND", "PersistedQueryNotFound")
+        return None
+
+    def op_auth(self, variables: dict) -> dict:
+        params = parse_qs(str(variables.get("initData") or ""))
+        try:
+            tg_user = json.loads(params["user"][0])
+        except (KeyError, IndexError, ValueError):
+            return {"data": {"authTelegramInitData": {"success": False, "token": None, "__typename": "AuthPayload"}}}
+        username = tg_user.get("username") or f"user{tg_user.get('id')}"
+        token = f"mock-{username}"
+        if token not in self.users:
+            self.users[token] = MockUser(user_id=int(tg_user.get("id") or 0), username=username)
+        return {"data": {"authTelegramInitData": {"success": True, "token": token, "__typename": "AuthPayload"}}}
+
+    def op_me(self, user: MockUser, variables: dict) -> dict:
+        return {"data": {"me": {
+            "balance": user.balance,
+            "starsBalance": user.stars_balance,
+            "nextFreeSpin": iso(user.next_free_spin) if user.next_free_spin else None,
+            "nextCaseFreeSpin": iso(user.next_case_free_spin) if user.next_case_free_spin else None,
+        }}}
+
+    def _roll_requirements(self, user: MockUser):
+        if user.requirements_rolled:
+            return
+        user.requirements_rolled = True
+        if self.random.random() < self.config.click_rate:
+            code = self.campaign_click if self.config.shared_requirements else self.random.choice(CLICK_CODES)
+            # A click marked before the spin already counts
+            if code not in user.clicked:
+                user.pending_click = code
+        user.pending_subscription = self.random.random() < self.config.subscription_rate
+
+    def _new_prize(self, user: MockUser) -> tuple:
+        prize = dict(self.random.choice(PRIZES))
+        user_prize_id = self.next_user_prize_id
+        self.next_user_prize_id += 1
+        user.prizes[user_prize_id] = {"prize": prize, "status": "NEW"}
+        public = {k: v for k, v in prize.items() if k not in ("stars", "virus")}
+        public.update({
+            "caption": prize["name"],
+            "animationUrl": None,
+            "photoUrl": None,
+            "prizeExchangePrice": prize["exchangePrice"],
+            "isSpinSellable": False,
+            "isClaimable": True,
+            "isExchangeable": False,
+            "storyLinkAfterWin": None,
+            "__typename": "RoulettePrize",
+        })
+        return user_prize_id, public
+
+    def op_startRouletteSpin(self, user: MockUser, variables: dict) -> dict:
+        now = self.now()
+        if now < user.next_free_spin:
+            return gql_error("INSUFFICIENT_BALANCE", "Insufficient balance")
+        self._roll_requirements(user)
+        if user.pending_click:
+            code = user.pending_click
+            extensions = {"link": CLICK_LINKS[code]}
+            if code == "TEST_SPIN_URL_CLICK_REQUIRED":
+                extensions["task_id"] = 7
+            return gql_error(code, "Partner click required", **extensions)
+        if user.pending_subscription and self.subscription_check is not None:
+            if self.subscription_check(user.user_id):
+                user.pending_subscription = False
+            else:
+                return gql_error("TELEGRAM_SUBSCRIPTION_REQUIRED", "Subscribe first", url=SUBSCRIPTION_CHANNEL)
+        if user.pending_subscription:
+            # Reported once; the bot is expected to have joined before retrying
+            user.pending_subscription = False
+            return gql_error("TELEGRAM_SUBSCRIPTION_REQUIRED", "Subscribe first", url=SUBSCRIPTION_CHANNEL)
+        user.next_free_spin = now + self.config.spin_cooldown
+        user.requirements_rolled = False
+        user.clicked.clear()
+        user_prize_id, prize = self._new_prize(user)
+        story = self.random.random() < self.config.story_rate
+        return {"data": {"startRouletteSpin": {
+            "success": True,
+            "prize": prize,
+            "userPrizeId": user_prize_id,
+            "balance": user.balance,
+            "isStoryRewardAvailable": story,
+            "storyReward": 10 if story else 0,
+            "__typename": "StartRouletteSpinPayload",
+        }}}
+
+    def op_click(self, user: MockUser, operation: str) -> dict:
+        user.clicked.add(CLICK_MUTATIONS[operation])
+        if user.pending_click == CLICK_MUTATIONS[operation]:
+            user.pending_click = None
+        return {"data": {operation: {"success": True}}}
+
+    def op_cases(self, user: MockUser, variables: dict) -> dict:
+        return {"data": {"cases": {"success": True, "cases": [{
+            "id": "1",
+            "name": "Daily",
+            "type": "FREE",
+            "starsPrice": 0,
+            "animationUrl": None,
+            "expiresAt": None,
+            "prizes": [{"id": p["id"], "animationUrl": None, "starsAmount": p.get("stars", 0)} for p in PRIZES],
+        }]}}}
+
+    def op_openCase(self, user: MockUser, variables: dict) -> dict:
+        now = self.now()
+        if now < user.next_case_free_spin:
+            return gql_error("INSUFFICIENT_BALANCE", "Case not available yet")
+        user.next_case_free_spin = now + self.config.case_cooldown
+        user_prize_id, prize = self._new_prize(user)
+        return {"data": {"openCase": {
+            "success": True,
+            "prize": prize,
+            "userPrizeId": user_prize_id,
+            "casePrizeId": prize["id"],
+            "demo": bool(variables.get("demo")),
+        }}}
+
+    def op_getRouletteInventory(self, user: MockUser, variables: dict) -> dict:
+        prizes = []
+        for user_prize_id, entry in user.prizes.items():
+            if entry["status"] != "NEW":
+                continue
+            prize = entry["prize"]
+            prizes.append({
+                "userRoulettePrizeId": user_prize_id,
+                "status": entry["status"],
+                "prize": {
+                    "id": prize["id"],
+                    "name": prize["name"],
+                    "caption": prize["name"],
+                    "exchangeCurrency": prize["exchangeCurrency"],
+                    "exchangePrice": prize["exchangePrice"],
+                    "prizeExchangePrice": prize["exchangePrice"],
+                    "isClaimable": True,
+                    "isExchangeable": False,
+                    "isSpinSellable": False,
+                },
+                "claimCost": 0,
+                "unlockAt": None,
+            })
+        limit = int(variables.get("limit") or 50)
+        return {"data": {"getRouletteInventory": {
+            "success": True,
+            "prizes": prizes[:limit],
+            "nextCursor": 0,
+            "hasNextPage": len(prizes) > limit,
+        }}}
+
+    def _take_prize(self, user: MockUser, variables: dict) -> Optional[dict]:
+        raw_id = ((variables.get("input") or {}).get("userPrizeId"))
+        try:
+            entry = user.prizes.get(int(raw_id))
+        except (TypeError, ValueError):
+            return None
+        if entry is None or entry["status"] != "NEW":
+            return None
+        entry["status"] = "CLAIMED"
+        return entry["prize"]
+
+    def op_claimRoulettePrize(self, user: MockUser, variables: dict) -> dict:
+        prize = self._take_prize(user, variables)
+        if prize is None:
+            return gql_error("PRIZE_NOT_FOUND", "Prize not found")
+        user.stars_balance += prize.get("stars", 0)
+        user.balance += prize.get("virus", 0)
+        return {"data": {"claimRoulettePrize": {"success": True, "message": None, "telegramGift": None, "__typename": "ClaimPayload"}}}
+
+    def op_exchangeRoulettePrizeToStarsBalance(self, user: MockUser, variables: dict) -> dict:
+        prize = self._take_prize(user, variables)
+        if prize is None:
+            return gql_error("PRIZE_NOT_FOUND", "Prize not found")
+        user.stars_balance += int(prize.get("exchangePrice") or 0)
+        return {"data": {"exchangeRoulettePrizeToStarsBalance": {"success": True}}}
+
+    def op_checkStoryPostRoulettePrizeWin(self, user: MockUser, variables: dict) -> dict:
+        user.stars_balance += 10
+        return {"data": {"checkStoryPostRoulettePrizeWin": {"success": True}}}
+
+
+async def start_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+    """Start the mock in the running loop; returns (backend, runner, graphql_url)."""
+    backend = MockVirusGift(config)
+    runner = web.AppRunner(backend.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return backend, runner, f"http://{host}:{bound_port}{GRAPHQL_PATH}"
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="base server latency per HTTP request")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="uniform +/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of HTTP requests answered with 502")
+    parser.add_argument("--click-rate", type=float, default=0.0, help="fraction of spins requiring a partner click")
+    parser.add_argument("--subscription-rate", type=float, default=0.0, help="fraction of spins requiring a channel join")
+    parser.add_argument("--story-rate", type=float, default=0.0, help="fraction of spins with a story bonus")
+    parser.add_argument("--clock-skew", type=float, default=0.0, help="seconds the server clock runs ahead (negative: behind)")
+    parser.add_argument("--no-persisted-queries", action="store_true", help="answer APQ requests with PersistedQueryNotSupported")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def mock_config_from_args(args) -> MockConfig:
+    return MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_502_rate=args.error_rate,
+        click_rate=args.click_rate,
+        subscription_rate=args.subscription_rate,
+        story_rate=args.story_rate,
+        persisted_queries=not args.no_persisted_queries,
+        clock_skew=args.clock_skew,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock VirusGift GraphQL server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    backend = MockVirusGift(mock_config_from_args(args))
+    print(f"Mock VirusGift GraphQL at http://{args.host}:{args.port}{GRAPHQL_PATH}")
+    web.run_app(backend.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
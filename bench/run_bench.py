@@ -0,0 +1,210 @@
+"""Drive the real roulette flows from main.py against the local mock server.
+
+    python bench/run_bench.py --accounts 50 --concurrency 10 --latency-ms 80 --click-rate 0.5
+
+Accounts are logged in through the real client/auth path with fake Telegram clients
+(bench/fake_telegram.py), so subscriptions, deep links and mini-app opens run offline.
+Reports throughput, p50/p99 flow and request latency, GraphQL requests per spin and
+MTProto calls by method.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# main.py reads this at import time
+os.environ.setdefault("TRACE_ENABLED", "false")
+
+from fake_telegram import FakeTelegramNetwork  # noqa: E402
+from mock_server import SUBSCRIPTION_CHANNEL, add_mock_arguments, mock_config_from_args, start_mock_server  # noqa: E402
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_account_config(index: int) -> dict:
+    return {
+        "session_name": f"bench{index}",
+        "api_id": 1,
+        "api_hash": "bench",
+        "phone_number": f"+1555000{index:04d}",
+    }
+
+
+async def create_bench_accounts(main, count: int) -> dict:
+    configs = {f"account{index}": bench_account_config(index) for index in range(1, count + 1)}
+    # The bench skips main.configure(): only the lease files need the sessions directory
+    main.SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    main.ACCOUNT_CONFIGS.update(configs)
+    for name, config in configs.items():
+        if not await main.initialize_account_client(name, config, main.account_manager):
+            raise RuntimeError(f"fake client start failed for {name}")
+    results = await asyncio.gather(*(
+        main.get_account_token_and_username(name, config, main.account_manager)
+        for name, config in configs.items()
+    ))
+    failed = [name for name, ok in zip(configs, results) if not ok]
+    if failed:
+        raise RuntimeError(f"mock auth failed for {', '.join(failed)}")
+    return {name: main.account_manager.accounts[name] for name in configs}
+
+
+async def run_bench(args) -> dict:
+    import main
+    from loguru import logger
+
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+
+    backend, runner, url = await start_mock_server(mock_config_from_args(args))
+    network = FakeTelegramNetwork(
+        latency_ms=args.mtproto_latency_ms,
+        flood_seconds=args.flood_seconds,
+        seed=args.seed,
+    )
+    main.graphql_url = url
+    main.telegram_client_factory = network.create_client
+    channel_id = network.chat_for(SUBSCRIPTION_CHANNEL).id
+    backend.subscription_check = lambda user_id: user_id in network.members.get(channel_id, ())
+    try:
+        accounts = await create_bench_accounts(main, args.accounts)
+
+        # Only count the flows themselves, not the setup logins
+        backend.http_requests = 0
+        backend.http_502 = 0
+        backend.request_bytes = 0
+        backend.operations.clear()
+        backend.error_codes.clear()
+        backend.latencies_ms.clear()
+        network.calls.clear()
+        network.flood_waits.clear()
+        network.flood_rate = args.flood_rate
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        flow_ms = []
+        outcomes = {"success": 0, "failure": 0}
+
+        async def one(name, account_data):
+            async with semaphore:
+                started = time.perf_counter()
+                ok = await main.process_account_roulette(name, account_data)
+                flow_ms.append((time.perf_counter() - started) * 1000)
+                outcomes["success" if ok else "failure"] += 1
+
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        await asyncio.gather(*(one(name, acc) for name, acc in accounts.items()))
+        wall = time.perf_counter() - started
+        # Story bonuses are claimed in the background after the flows return
+        await main.story_rewards.join()
+        story_drain = time.perf_counter() - started - wall
+        cpu = time.process_time() - cpu_started
+    finally:
+        await main.story_rewards.stop(timeout=0)
+        for account_data in main.account_manager.accounts.values():
+            if account_data.client:
+                await account_data.client.stop()
+        await main.close_http_session()
+        await runner.cleanup()
+
+    spins = outcomes["success"]
+    return {
+        "accounts": args.accounts,
+        "concurrency": args.concurrency,
+        "fast_runtime": main.FAST_RUNTIME,
+        "event_loop": type(asyncio.get_running_loop()).__module__.split(".")[0],
+        "orjson": main._use_orjson,
+        "wall_seconds": round(wall, 3),
+        # includes the in-process mock server, which is identical across runtimes
+        "cpu_seconds": round(cpu, 3),
+        "spins_ok": spins,
+        "spins_failed": outcomes["failure"],
+        "story_claims": backend.operations.get("checkStoryPostRoulettePrizeWin", 0),
+        "story_drain_seconds": round(story_drain, 3),
+        "spins_per_second": round(spins / wall, 3) if wall else 0.0,
+        "requests": backend.http_requests,
+        "requests_502": backend.http_502,
+        "requests_per_second": round(backend.http_requests / wall, 1) if wall else 0.0,
+        "requests_per_spin": round(backend.http_requests / spins, 2) if spins else None,
+        "persisted_queries": main.GRAPHQL_APQ,
+        "clock_offset_seconds": round(main.server_clock.offset, 3),
+        "request_bytes": backend.request_bytes,
+        "request_bytes_per_spin": round(backend.request_bytes / spins) if spins else None,
+        "flow_ms_p50": round(percentile(flow_ms, 50), 1),
+        "flow_ms_p99": round(percentile(flow_ms, 99), 1),
+        "request_ms_p50": round(percentile(backend.latencies_ms, 50), 1),
+        "request_ms_p99": round(percentile(backend.latencies_ms, 99), 1),
+        "operations": dict(sorted(backend.operations.items(), key=lambda kv: -kv[1])),
+        "graphql_errors": dict(sorted(backend.error_codes.items(), key=lambda kv: -kv[1])),
+        "mtproto_calls": sum(network.calls.values()),
+        "mtproto_flood_waits": sum(network.flood_waits.values()),
+        "mtproto_methods": dict(sorted(network.calls.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"accounts={report['accounts']} concurrency={report['concurrency']} wall={report['wall_seconds']}s "
+        f"cpu={report['cpu_seconds']}s loop={report['event_loop']} orjson={report['orjson']}"
+    )
+    print(f"spins ok/failed        {report['spins_ok']}/{report['spins_failed']}")
+    print(f"story claims           {report['story_claims']} (drained {report['story_drain_seconds']}s after the flows)")
+    print(f"throughput             {report['spins_per_second']} spins/s, {report['requests_per_second']} req/s")
+    print(f"flow latency p50/p99   {report['flow_ms_p50']} / {report['flow_ms_p99']} ms")
+    print(f"request latency p50/99 {report['request_ms_p50']} / {report['request_ms_p99']} ms")
+    print(f"requests per spin      {report['requests_per_spin']} ({report['requests']} total, {report['requests_502']} x 502)")
+    print(f"server clock offset    {report['clock_offset_seconds']:+.3f} s")
+    print(f"request bytes per spin {report['request_bytes_per_spin']} (APQ {'on' if report['persisted_queries'] else 'off'})")
+    print("requests by operation:")
+    for operation, count in report["operations"].items():
+        print(f"  {operation:<40} {count}")
+    print("graphql errors by code:")
+    for code, count in report["graphql_errors"].items():
+        print(f"  {code:<40} {count}")
+    print(f"mtproto calls          {report['mtproto_calls']} ({report['mtproto_flood_waits']} x FLOOD_WAIT)")
+    for method, count in report["mtproto_methods"].items():
+        print(f"  {method:<40} {count}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark main.py flows against the mock VirusGift server")
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--mtproto-latency-ms", type=float, default=30.0, help="mean fake MTProto call latency")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="share of MTProto calls raising FLOOD_WAIT")
+    parser.add_argument("--flood-seconds", type=int, default=5, help="FLOOD_WAIT duration reported by the fake")
+    parser.add_argument("--apq", action="store_true", help="send persisted-query hashes (GRAPHQL_APQ=true)")
+    add_mock_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.apq:
+        os.environ["GRAPHQL_APQ"] = "true"
+    from main import install_fast_runtime
+
+    install_fast_runtime()
+    report = asyncio.run(run_bench(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Compare the default runtime with FAST_RUNTIME (uvloop + orjson) on the mock server.
+
+    python bench/runtime_bench.py --accounts 200 --latency-ms 0
+
+Runs a JSON encode/decode micro-benchmark on realistic GraphQL payloads, then the full
+flow benchmark (run_bench.py) once per runtime in a fresh process, and prints both side
+by side. Missing uvloop/orjson are reported, and that runtime falls back to the stdlib.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+
+SPIN_RESPONSE = {
+    "data": {
+        "startRouletteSpin": {
+            "success": True,
+            "userPrizeId": 123456789,
+            "isStoryRewardAvailable": True,
+            "storyReward": 3,
+            "prize": {
+                "id": 42,
+                "name": "25 Stars",
+                "caption": "25 Stars",
+                "animationUrl": "https://virusgift.pro/static/prizes/25-stars.json",
+                "photoUrl": "https://virusgift.pro/static/prizes/25-stars.png",
+                "exchangeCurrency": "STARS",
+                "exchangePrice": 25,
+                "isClaimable": True,
+                "isExchangeable": True,
+                "rarity": "common",
+            },
+        }
+    }
+}
+INVENTORY_RESPONSE = {
+    "data": {
+        "getRouletteInventory": {
+            "prizes": [
+                {**SPIN_RESPONSE["data"]["startRouletteSpin"]["prize"], "userPrizeId": 1000 + i, "createdAt": "2026-10-19T12:00:00Z"}
+                for i in range(40)
+            ]
+        }
+    }
+}
+REQUEST = [{
+    "operationName": "startRouletteSpin",
+    "variables": {"input": {"mode": "FREE", "demo": False}},
+    "query": "mutation startRouletteSpin($input: StartRouletteSpinInput!) { startRouletteSpin(input: $input) { success userPrizeId prize { id name caption exchangeCurrency exchangePrice } } }",
+}]
+
+
+def time_per_op(func, arg, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def json_microbench(rounds: int) -> dict:
+    codecs = {
+        "json": (
+            lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+            json.loads,
+        ),
+    }
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        codecs["orjson"] = (orjson.dumps, orjson.loads)
+
+    results = {}
+    for name, (dumps, loads) in codecs.items():
+        results[name] = {
+            "encode_request_us": round(time_per_op(dumps, REQUEST, rounds), 2),
+            "decode_spin_us": round(time_per_op(loads, dumps(SPIN_RESPONSE), rounds), 2),
+            "decode_inventory_us": round(time_per_op(loads, dumps(INVENTORY_RESPONSE), rounds // 10 or 1), 2),
+            "encode_inventory_us": round(time_per_op(dumps, INVENTORY_RESPONSE, rounds // 10 or 1), 2),
+        }
+    return results
+
+
+def run_flow_bench(fast: bool, passthrough: list) -> dict:
+    env = {**os.environ, "FAST_RUNTIME": "true" if fast else "false"}
+    output = subprocess.run(
+        [sys.executable, str(BENCH_DIR / "run_bench.py"), "--json", *passthrough],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output[output.index("{"):])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Default vs FAST_RUNTIME (uvloop + orjson) comparison")
+    parser.add_argument("--rounds", type=int, default=20000, help="micro-benchmark iterations")
+    args, passthrough = parser.parse_known_args(argv)
+
+    print("JSON codec (µs per op):")
+    micro = json_microbench(args.rounds)
+    columns = list(next(iter(micro.values())))
+    print(f"  {'codec':<8}" + "".join(f"{col:>22}" for col in columns))
+    for codec, values in micro.items():
+        print(f"  {codec:<8}" + "".join(f"{values[col]:>22}" for col in columns))
+
+    print("\nFlow benchmark (run_bench.py " + " ".join(passthrough) + "):")
+    reports = {"default": run_flow_bench(False, passthrough), "fast": run_flow_bench(True, passthrough)}
+    rows = (
+        ("event loop", "event_loop"),
+        ("orjson", "orjson"),
+        ("wall seconds", "wall_seconds"),
+        ("cpu seconds", "cpu_seconds"),
+        ("spins/s", "spins_per_second"),
+        ("requests/s", "requests_per_second"),
+        ("flow p50 ms", "flow_ms_p50"),
+        ("flow p99 ms", "flow_ms_p99"),
+        ("request p50 ms", "request_ms_p50"),
+        ("request p99 ms", "request_ms_p99"),
+    )
+    print(f"  {'':<16}{'default':>12}{'fast':>12}")
+    for label, key in rows:
+        print(f"  {label:<16}{str(reports['default'][key]):>12}{str(reports['fast'][key]):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,7 @@ RSYNC_EXCLUDES=(
   --exclude 'account*.session'
   --exclude 'account*.session-journal'
   --exclude '*.personal.session.bak'
+  --exclude 'sessions/*.lock'
 )
 
 echo ">>> Syncing project to ${REMOTE}:${DEPLOY_REMOTE_DIR}/"
@@ -6,64 +6,206 @@ import re
 import hmac
 import hashlib
 import secrets
-from dotenv import load_dotenv
+import signal
+import sqlite3
+import tempfile
+import time
+import zlib
+import functools
+import math
+from bisect import bisect_left
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import Context, ContextVar
+from dotenv import dotenv_values, find_dotenv, load_dotenv
 from urllib.parse import parse_qs, urlparse
-from datetime import datetime, timezone
-from pyrogram import Client
-from pyrogram.raw.functions.messages import RequestAppWebView
-from pyrogram.raw.types import InputBotAppShortName, InputUser
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from loguru import logger
 import sys
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup
-from aiogram.utils.keyboard import InlineKeyboardBuilder 
+import traceback
 from aiohttp import web
 from pathlib import Path
-from dataclasses import dataclass
-from typing import Dict, Optional
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Protocol
+
+# pyrogram (raw TL schema) and aiogram take seconds to import; they are imported where
+# they are used, so `import main` stays cheap for tools, benches and one-shot commands
+if TYPE_CHECKING:
+    from aiogram import types
+    from aiogram.types import InlineKeyboardMarkup
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, leases become no-ops
+    fcntl = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 subscribed_channels = {}
 accounts_data = {}
 bot_instance = None
 dp = None
 
-logger.remove()
-logger.add(
-sys.stdout,
-format="| <magenta>{time:YYYY-MM-DD HH:mm:ss}</magenta> | <cyan><level>{level: <8}</level></cyan> | {message}",
-level="INFO",
-colorize=True,
-)
-
-load_dotenv()
-graphql_url = "https://virusgift.pro/api/graphql/query"
+DOTENV_PATH = find_dotenv()
+load_dotenv(DOTENV_PATH)
+# Keys that came from .env at startup; on reload the file is authoritative for them
+_STARTUP_DOTENV_KEYS = frozenset(dotenv_values(DOTENV_PATH)) if DOTENV_PATH else frozenset()
+graphql_url = os.getenv("VIRUSGIFT_GRAPHQL_URL", "https://virusgift.pro/api/graphql/query")
 bot_token = os.getenv("BOT_TOKEN")
-admin_id = int(os.getenv("ADMIN_ID"))
+admin_id = 0  # parsed from ADMIN_ID by configure()
 DASHBOARD_HOST = os.getenv("DASHBOARD_HOST", "127.0.0.1")
 DASHBOARD_PORT = int(os.getenv("DASHBOARD_PORT", "8765"))
 COOKIE_ON = os.getenv("COOKIE_ON", "false").strip().lower() in ("1", "true", "yes", "on")
 DASHBOARD_PASSWORD = os.getenv("PASSWORD", "")
 DASHBOARD_COOKIE_NAME = "vr_dash_auth"
 DASHBOARD_COOKIE_MAX_AGE = 10 * 365 * 24 * 3600  # ~10 years; survives script restarts
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+TRACE_DIR = Path(__file__).resolve().parent / "traces"
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", "3"))
 DASHBOARD_DIR = Path(__file__).resolve().parent / "dashboard"
 SESSIONS_DIR = Path(__file__).resolve().parent / "sessions"
-SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DB_ENABLED = os.getenv("STATE_DB_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+STATE_DB_PATH = Path(os.getenv("STATE_DB_PATH", str(Path(__file__).resolve().parent / "state.db")))
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "1"))
+ACCOUNTS_WATCH_INTERVAL = float(os.getenv("ACCOUNTS_WATCH_INTERVAL", "5"))
+WORKER_PROCESSES = max(1, int(os.getenv("WORKER_PROCESSES", "1")))
+LEASE_RETRY_INTERVAL = float(os.getenv("LEASE_RETRY_INTERVAL", "15"))
+# Seconds after a server-side unlock before the worker spins / opens a case
+SPIN_UNLOCK_MARGIN = float(os.getenv("SPIN_UNLOCK_MARGIN", "1"))
+SCHEDULER_POLL_INTERVAL = 10.0
+REQUIREMENT_CACHE_TTL = float(os.getenv("REQUIREMENT_CACHE_TTL", "3600"))
+# FLOOD_WAITs up to this many seconds are waited out inline; longer ones defer the account
+MTPROTO_FLOOD_SLEEP_THRESHOLD = float(os.getenv("MTPROTO_FLOOD_SLEEP_THRESHOLD", "10"))
+# How long a partner bot's working mini-app short name (or "has none") is remembered
+BOT_APP_MEMO_TTL = float(os.getenv("BOT_APP_MEMO_TTL", "86400"))
+# How long a satisfied requirement may take to clear before it is satisfied again
+REQUIREMENT_SETTLE_TIMEOUT = float(os.getenv("REQUIREMENT_SETTLE_TIMEOUT", "10"))
+FAST_RUNTIME = os.getenv("FAST_RUNTIME", "false").strip().lower() in ("1", "true", "yes", "on")
+GRAPHQL_APQ = os.getenv("GRAPHQL_APQ", "false").strip().lower() in ("1", "true", "yes", "on")
+# Set by the supervisor on the worker processes it spawns
+SHARD_INDEX = int(os.environ["VR_SHARD_INDEX"]) if os.getenv("VR_SHARD_INDEX") else None
+SHARD_COUNT = int(os.getenv("VR_SHARD_COUNT", "1"))
+SHARD_SOCKET = os.getenv("VR_SHARD_SOCKET", "")
+TRACE_FILE = "trace.jsonl" if SHARD_INDEX is None else f"trace-shard{SHARD_INDEX}.jsonl"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+# Per-subsystem overrides, e.g. LOG_LEVELS=mtproto=WARNING,scheduler=DEBUG
+LOG_LEVELS = {
+    name.strip().lower(): level.strip().upper()
+    for name, _, level in (item.partition("=") for item in os.getenv("LOG_LEVELS", "").split(","))
+    if name.strip() and level.strip()
+}
+# Repetitive messages (countdowns, 502 retries) are logged once per interval per account
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "60"))
+LOG_TEXT_FORMAT = "| <magenta>{time:YYYY-MM-DD HH:mm:ss}</magenta> | <cyan><level>{level: <8}</level></cyan> | {message}"
+
+
+class LogFilter:
+    """Per-subsystem levels and sampling for the stdout sink.
+
+    Records bound with ``subsystem=`` use LOG_LEVELS[subsystem] (else LOG_LEVEL). Records
+    bound with ``sample=<key>`` pass at most once per LOG_SAMPLE_INTERVAL per key and
+    account, with the number of suppressed repeats appended.
+    """
+
+    def __init__(self, level: str = LOG_LEVEL, levels: Optional[Dict[str, str]] = None,
+                 sample_interval: float = LOG_SAMPLE_INTERVAL):
+        self.default_no = logger.level(level).no
+        self.levels = {name: logger.level(value).no for name, value in (levels or {}).items()}
+        self.sample_interval = sample_interval
+        self._samples: Dict[tuple, list] = {}
+
+    @property
+    def min_level(self) -> int:
+        return min([self.default_no, *self.levels.values()])
+
+    def __call__(self, record) -> bool:
+        extra = record["extra"]
+        if record["level"].no < self.levels.get(extra.get("subsystem"), self.default_no):
+            return False
+        key = extra.get("sample")
+        if key is None or self.sample_interval <= 0:
+            return True
+        now = time.monotonic()
+        sample = self._samples.setdefault((key, extra.get("account")), [float("-inf"), 0])
+        if now - sample[0] < self.sample_interval:
+            sample[1] += 1
+            return False
+        if sample[1]:
+            record["message"] += f" (+{sample[1]} similar suppressed)"
+        sample[0], sample[1] = now, 0
+        return True
+
+
+def _json_log_format(record) -> str:
+    entry = {
+        "ts": record["time"].isoformat(),
+        "level": record["level"].name,
+        "msg": record["message"],
+        "func": record["function"],
+    }
+    entry.update((key, value) for key, value in record["extra"].items() if key not in ("sample", "_json"))
+    if record["exception"] is not None:
+        exc_type, exc_value, exc_tb = record["exception"]
+        entry["exc"] = "".join(traceback.format_exception(exc_type, exc_value, exc_tb))
+    record["extra"]["_json"] = json.dumps(entry, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
 
 
-def load_account_configs() -> Dict[str, dict]:
-    """Load ACCOUNT{N}_API_ID / API_HASH / PHONE_NUMBER from .env."""
+_logging_configured_for: Optional[tuple] = None
+
+
+def configure_logging(shard: Optional[int] = None):
+    """Install the stdout sink: colored text or JSON lines, written by loguru's background thread.
+
+    ``enqueue=True`` keeps slow consumers (journald, pipes) from blocking the event loop.
+    Called by configure() and the CLI, not at import; calling it again for the same shard is a no-op.
+    """
+    global _logging_configured_for
+    if _logging_configured_for == (shard,):
+        return
+    _logging_configured_for = (shard,)
+    log_filter = LogFilter(LOG_LEVEL, LOG_LEVELS)
+    text_format = LOG_TEXT_FORMAT
+    if shard is not None:
+        text_format = text_format.replace(" | {message}", f" | shard{shard} | {{message}}")
+    logger.remove()
+    logger.configure(extra={"shard": shard} if shard is not None else {})
+    logger.add(
+        sys.stdout,
+        format=_json_log_format if LOG_FORMAT == "json" else text_format,
+        level=log_filter.min_level,
+        filter=log_filter,
+        colorize=False if LOG_FORMAT == "json" else None,
+        enqueue=True,
+    )
+
+
+graphql_log = logger.bind(subsystem="graphql")
+mtproto_log = logger.bind(subsystem="mtproto")
+scheduler_log = logger.bind(subsystem="scheduler")
+
+
+def load_account_configs(environ=None) -> Dict[str, dict]:
+    """Load ACCOUNT{N}_API_ID / API_HASH / PHONE_NUMBER from .env (or the given mapping)."""
+    environ = os.environ if environ is None else environ
     indices = set()
-    for key in os.environ:
+    for key in environ:
         match = re.match(r"^ACCOUNT(\d+)_API_ID$", key)
         if match:
             indices.add(int(match.group(1)))
 
     configs = {}
     for index in sorted(indices):
-        api_id = os.getenv(f"ACCOUNT{index}_API_ID")
-        api_hash = os.getenv(f"ACCOUNT{index}_API_HASH")
-        phone_number = os.getenv(f"ACCOUNT{index}_PHONE_NUMBER")
+        api_id = environ.get(f"ACCOUNT{index}_API_ID")
+        api_hash = environ.get(f"ACCOUNT{index}_API_HASH")
+        phone_number = environ.get(f"ACCOUNT{index}_PHONE_NUMBER")
         if not api_id or not api_hash or not phone_number:
             logger.warning(f"Skipping ACCOUNT{index}: missing API_ID, API_HASH, or PHONE_NUMBER")
             continue
@@ -77,9 +219,379 @@ def load_account_configs() -> Dict[str, dict]:
     return configs
 
 
-ACCOUNT_CONFIGS = load_account_configs()
-if not ACCOUNT_CONFIGS:
-    logger.error("No accounts found in .env (expected ACCOUNT1_API_ID, ACCOUNT1_API_HASH, ACCOUNT1_PHONE_NUMBER, ...)")
+_use_orjson = FAST_RUNTIME and orjson is not None
+
+
+def json_dumps_bytes(obj) -> bytes:
+    """Compact UTF-8 JSON; orjson when the fast runtime is on and installed."""
+    if _use_orjson:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def json_dumps(obj) -> str:
+    return json_dumps_bytes(obj).decode("utf-8")
+
+
+def json_loads(data):
+    if _use_orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def install_fast_runtime():
+    """With FAST_RUNTIME=true, use uvloop's event loop policy when installed (call before asyncio.run)."""
+    if not FAST_RUNTIME:
+        return
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    else:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info(
+        f"Fast runtime: uvloop {'on' if uvloop else 'not installed'}, "
+        f"orjson {'on' if _use_orjson else 'not installed'}"
+    )
+
+
+def account_shard(account_name: str, count: int) -> int:
+    """Stable shard for an account: accountN round-robins by N, anything else by CRC32."""
+    match = re.search(r"\d+", account_name)
+    if match:
+        return (int(match.group()) - 1) % count
+    return zlib.crc32(account_name.encode("utf-8")) % count
+
+
+def owned_account_configs(configs: Dict[str, dict]) -> Dict[str, dict]:
+    """The accounts this process runs: all of them, or this worker's shard."""
+    if SHARD_INDEX is None:
+        return configs
+    return {name: config for name, config in configs.items() if account_shard(name, SHARD_COUNT) == SHARD_INDEX}
+
+
+# Filled by configure(); empty after a bare import
+ACCOUNT_CONFIGS: Dict[str, dict] = {}
+
+
+def configure():
+    """Load this process's accounts from the environment and create ``sessions/``.
+
+    Kept out of import so tools can ``import main`` without side effects; every entry
+    point that starts accounts calls it first.
+    """
+    global admin_id
+
+    configure_logging(shard=SHARD_INDEX)
+    raw_admin_id = os.getenv("ADMIN_ID", "").strip()
+    try:
+        admin_id = int(raw_admin_id) if raw_admin_id else 0
+    except ValueError:
+        raise SystemExit(f"ADMIN_ID must be a numeric Telegram user id, got {raw_admin_id!r}") from None
+    SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    ACCOUNT_CONFIGS.clear()
+    ACCOUNT_CONFIGS.update(owned_account_configs(load_account_configs()))
+    if not ACCOUNT_CONFIGS and SHARD_INDEX is None:
+        logger.error("No accounts found in .env (expected ACCOUNT1_API_ID, ACCOUNT1_API_HASH, ACCOUNT1_PHONE_NUMBER, ...)")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 3600.0)
+
+
+def _metric_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """In-process counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._meta: Dict[str, tuple] = {}
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, list] = {}
+        self._remote: Dict[str, dict] = {}
+
+    def counter(self, name: str, help_text: str):
+        self._meta[name] = ("counter", help_text, None)
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, tuple(buckets))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._meta[name][2]
+        hist = self._histograms.get(key)
+        if hist is None:
+            # per-bucket counts (non-cumulative), then sum, then count
+            hist = self._histograms[key] = [0] * len(buckets) + [0.0, 0]
+        index = bisect_left(buckets, value)
+        if index < len(buckets):
+            hist[index] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+    def snapshot(self) -> dict:
+        """JSON-serialisable copy of all series, for shipping to a supervisor process."""
+        return {
+            "counters": [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+            "histograms": [[name, list(map(list, labels)), hist] for (name, labels), hist in self._histograms.items()],
+        }
+
+    def set_remote(self, source: str, snapshot: dict):
+        """Replace the series last reported by ``source``; they are summed into render()."""
+        self._remote[source] = snapshot
+
+    def _merged(self) -> tuple:
+        if not self._remote:
+            return self._counters, self._histograms
+        counters = dict(self._counters)
+        histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        for snapshot in self._remote.values():
+            for name, labels, value in snapshot.get("counters", ()):
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, hist in snapshot.get("histograms", ()):
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.get(key)
+                histograms[key] = list(hist) if merged is None else [a + b for a, b in zip(merged, hist)]
+        return counters, histograms
+
+    def render(self) -> str:
+        lines = []
+        counters, histograms = self._merged()
+        by_name: Dict[str, list] = {}
+        for key in list(counters) + list(histograms):
+            by_name.setdefault(key[0], []).append(key)
+        for name in sorted(by_name):
+            kind, help_text, buckets = self._meta.get(name, ("counter", "", None))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in sorted(by_name[name]):
+                labels = ",".join(f'{k}="{_metric_label_value(v)}"' for k, v in key[1])
+                if kind == "counter":
+                    lines.append(f"{name}{{{labels}}} {counters[key]}")
+                    continue
+                hist = histograms[key]
+                sep = "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(buckets, hist):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {hist[-1]}')
+                lines.append(f"{name}_sum{{{labels}}} {hist[-2]}")
+                lines.append(f"{name}_count{{{labels}}} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram("virusroulette_graphql_request_duration_seconds", "GraphQL request latency by operation and HTTP status")
+metrics.counter("virusroulette_graphql_errors_total", "GraphQL errors by operation and error code")
+metrics.counter("virusroulette_graphql_retries_total", "GraphQL request retries by operation")
+metrics.counter("virusroulette_graphql_persisted_queries_total", "APQ lookups by operation and result (hit, miss, unsupported)")
+metrics.counter("virusroulette_rewards_total", "Spins, cases, claims, exchanges and story rewards per account")
+metrics.histogram("virusroulette_scheduler_lag_seconds", "Delay between a free reward unlocking and the worker acting on it", LAG_BUCKETS)
+metrics.histogram("virusroulette_mtproto_call_duration_seconds", "MTProto call latency by method")
+metrics.counter("virusroulette_mtproto_calls_total", "MTProto calls by method and result")
+metrics.counter("virusroulette_mtproto_flood_waits_total", "FLOOD_WAIT errors by method")
+metrics.counter("virusroulette_mtproto_deferred_total", "MTProto calls refused locally while a long FLOOD_WAIT is pending, by method")
+metrics.counter("virusroulette_bot_app_memo_total", "Mini-app short-name memo lookups by result (hit, negative, miss, stale)")
+metrics.counter("virusroulette_requirements_total", "Click / subscription requirements by code and result (learned, presatisfied, failed)")
+metrics.counter("virusroulette_action_errors_total", "GraphQL errors seen by the requirement resolver, by action and code")
+metrics.counter("virusroulette_requirement_resolutions_total", "Requirement resolutions by action, code and result (resolved, failed, exhausted)")
+metrics.histogram("virusroulette_requirement_resolve_seconds", "Time from a requirement error to the action clearing it", LAG_BUCKETS)
+
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "account", "attrs", "start", "started", "status", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], account: Optional[str], attrs: dict):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        self.span_id = secrets.token_hex(4)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.account = account or (parent.account if parent else None)
+        self.attrs = attrs
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """Context-var spans written to a rotating JSONL file and kept per account for the dashboard."""
+
+    def __init__(self, enabled: bool = TRACE_ENABLED, recent_per_account: int = 20):
+        self.enabled = enabled
+        self.recent_per_account = recent_per_account
+        self._pending: deque = deque(maxlen=20000)
+        self._open: Dict[str, list] = {}
+        self._recent: Dict[str, deque] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def span(self, name: str, account: Optional[str] = None, only_if_parent: bool = False, **attrs):
+        """Open a child of the current span; a span without a parent starts a new trace."""
+        parent = _current_span.get()
+        if not self.enabled or (only_if_parent and parent is None):
+            yield None
+            return
+        current = Span(name, parent, account, attrs)
+        if parent is None:
+            self._open[current.trace_id] = []
+        token = _current_span.set(current)
+        try:
+            yield current
+        except BaseException as e:
+            current.status = "error"
+            current.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(current)
+
+    def _finish(self, span: Span):
+        record = {
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "name": span.name,
+            "account": span.account,
+            "ts": span.start,
+            "duration_ms": round((time.perf_counter() - span.started) * 1000, 3),
+            "status": span.status,
+        }
+        if span.error:
+            record["error"] = span.error
+        if span.attrs:
+            record["attrs"] = span.attrs
+        self._pending.append(record)
+        spans = self._open.get(span.trace_id)
+        if spans is None:
+            # child of a trace whose root already finished (e.g. a detached task)
+            return
+        spans.append(record)
+        if span.parent_id is None:
+            del self._open[span.trace_id]
+            if span.account:
+                recent = self._recent.setdefault(span.account, deque(maxlen=self.recent_per_account))
+                recent.append({**record, "spans": sorted(spans, key=lambda r: r["ts"])})
+
+    def recent(self, account: str) -> list:
+        return list(reversed(self._recent.get(account, ())))
+
+    def summary(self) -> dict:
+        return {
+            account: [{k: t[k] for k in ("trace_id", "name", "ts", "duration_ms", "status")} for t in traces]
+            for account, traces in self._recent.items()
+        }
+
+    def start(self):
+        if self.enabled and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        lines = []
+        while self._pending:
+            lines.append(json_dumps(self._pending.popleft()))
+        await asyncio.to_thread(self._write, lines)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(2)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Trace flush failed: {e}")
+
+    def _write(self, lines: list):
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        path = TRACE_DIR / TRACE_FILE
+        if path.exists() and path.stat().st_size >= TRACE_MAX_BYTES:
+            for index in range(TRACE_BACKUPS - 1, 0, -1):
+                older = TRACE_DIR / f"{TRACE_FILE}.{index}"
+                if older.exists():
+                    older.replace(TRACE_DIR / f"{TRACE_FILE}.{index + 1}")
+            path.replace(TRACE_DIR / f"{TRACE_FILE}.1")
+        with path.open("a", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+
+
+tracer = Tracer()
+
+
+def traced(name: str, account_arg: Optional[int] = None):
+    """Run an async function inside a span; ``account_arg`` names the positional account-name argument."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            account = args[account_arg] if account_arg is not None and len(args) > account_arg else None
+            if account is None:
+                with tracer.span(name, only_if_parent=True):
+                    return await func(*args, **kwargs)
+            with tracer.span(name, account=account), logger.contextualize(account=account):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TelegramClientLike(Protocol):
+    """The subset of the pyrogram ``Client`` API this project uses; see bench/fake_telegram.py."""
+
+    is_connected: bool
+
+    async def start(self): ...
+    async def stop(self): ...
+    async def get_users(self, user_ids): ...
+    async def resolve_peer(self, peer_id): ...
+    async def invoke(self, query): ...
+    async def join_chat(self, chat_id): ...
+    async def get_chat(self, chat_id): ...
+    async def leave_chat(self, chat_id): ...
+    async def send_message(self, chat_id, text): ...
+    async def delete_chat_history(self, chat_id, revoke: bool = False): ...
+
+
+TELEGRAM_BACKEND = os.getenv("TELEGRAM_BACKEND", "pyrogram").strip().lower()
+telegram_client_factory: Optional[Callable[[dict], TelegramClientLike]] = None
+
+
+def create_telegram_client(config: dict) -> TelegramClientLike:
+    """Build the MTProto client for an account; TELEGRAM_BACKEND=fake swaps in the offline fake."""
+    if telegram_client_factory is not None:
+        return telegram_client_factory(config)
+    if TELEGRAM_BACKEND == "fake":
+        from bench.fake_telegram import default_network
+        return default_network.create_client(config)
+    from pyrogram import Client
+
+    return Client(
+        config["session_name"],
+        config["api_id"],
+        config["api_hash"],
+        phone_number=config["phone_number"],
+        workdir=str(SESSIONS_DIR),
+        # FLOOD_WAITs surface to tg_call, which waits out only the affected method
+        sleep_threshold=0,
+    )
+
 
 @dataclass
 class AccountData:
@@ -88,26 +600,448 @@ class AccountData:
     balance: int
     next_roulette_time: str
     bearer_token: Optional[str]
-    client: Optional[Client]
+    client: Optional[TelegramClientLike]
     subscribed_channels: set
     interacted_bots: set
     next_case_free_spin: str = "Unknown"
     virus_balance: int = 0
     last_story_reward: str = ""
+    revision: int = field(default=0, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        # Bump on every user-visible change so cached renders know to rebuild
+        if name in STATUS_FIELDS:
+            object.__setattr__(self, "revision", getattr(self, "revision", 0) + 1)
+            state_store.mark_dirty(self)
+
+
+STATUS_FIELDS = frozenset({
+    "username",
+    "balance",
+    "virus_balance",
+    "next_roulette_time",
+    "next_case_free_spin",
+    "last_story_reward",
+    "bearer_token",
+})
+
+PERSISTED_FIELDS = (
+    "username",
+    "balance",
+    "virus_balance",
+    "next_roulette_time",
+    "next_case_free_spin",
+    "last_story_reward",
+)
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    name TEXT PRIMARY KEY,
+    username TEXT,
+    balance INTEGER,
+    virus_balance INTEGER,
+    next_roulette_time TEXT,
+    next_case_free_spin TEXT,
+    last_story_reward TEXT,
+    token_fingerprint TEXT,
+    token_updated_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prize_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    account TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    result TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS prize_events_account_ts ON prize_events (account, ts);
+CREATE TABLE IF NOT EXISTS event_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    account TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    events INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    stars INTEGER NOT NULL DEFAULT 0,
+    virus INTEGER NOT NULL DEFAULT 0,
+    latency_sum REAL NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket, account, kind)
+);
+CREATE TABLE IF NOT EXISTS bot_apps (
+    bot TEXT PRIMARY KEY,
+    short_name TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+
+ROLLUP_GRANULARITIES = {"hour": "%Y-%m-%dT%H", "day": "%Y-%m-%d"}
+ROLLUP_COLUMNS = ("events", "successes", "failures", "stars", "virus", "latency_sum", "latency_count")
+PRIZE_SOURCE_KINDS = frozenset({"spin", "case"})
+PRIZE_SINK_KINDS = frozenset({"claim", "exchange"})
+
+
+def event_earnings(kind: str, result: str, detail: dict) -> tuple:
+    """(stars, virus) credited to the balance by one event."""
+    if result != "success":
+        return 0, 0
+    if kind == "story":
+        return int(detail.get("amount") or 0), 0
+    if kind == "exchange":
+        return int(detail.get("price") or 0), 0
+    if kind == "claim":
+        amount = int(detail.get("amount") or 0)
+        currency = detail.get("currency")
+        return (amount, 0) if currency == "stars" else (0, amount) if currency == "virus" else (0, 0)
+    return 0, 0
+
+
+class StateStore:
+    """SQLite (WAL) write-through store for account timers, balances, token metadata and prize events.
+
+    Changes are collected in memory and written in one transaction per flush interval, off the
+    event loop. Bearer tokens themselves are never stored, only a fingerprint and when it changed.
+    """
+
+    def __init__(self, path: Path = STATE_DB_PATH, enabled: bool = STATE_DB_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._rows: Dict[str, sqlite3.Row] = {}
+        self._tracked: Dict[str, "AccountData"] = {}
+        self._dirty: set = set()
+        self._events: list = []
+        self._rollups: Dict[tuple, list] = {}
+        self._bot_apps: Dict[str, tuple] = {}
+        self._prize_won_at: Dict[object, float] = {}
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def open(self):
+        """Open the database and load persisted account rows (call once before accounts are created)."""
+        if not self.enabled or self._conn is not None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Shard workers share the file; wait for each other's write locks
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(STATE_SCHEMA)
+            self._rows = {row["name"]: row for row in conn.execute("SELECT * FROM accounts")}
+            self._conn = conn
+            logger.info(f"State store opened: {self.path} ({len(self._rows)} accounts)")
+        except sqlite3.Error as e:
+            logger.error(f"State store disabled, cannot open {self.path}: {e}")
+            self.enabled = False
+
+    def restore(self, account_data: "AccountData") -> bool:
+        """Load persisted fields into a fresh AccountData and start tracking it; True if a row existed."""
+        if self._conn is None:
+            return False
+        row = self._rows.get(account_data.name)
+        if row is not None:
+            for name in PERSISTED_FIELDS:
+                if row[name] is not None:
+                    setattr(account_data, name, row[name])
+        self._tracked[account_data.name] = account_data
+        return row is not None
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    def has_state(self, account_name: str) -> bool:
+        return account_name in self._rows
+
+    def load_bot_apps(self) -> Dict[str, tuple]:
+        """Persisted bot -> (short_name or None, checked_at) mini-app memo entries."""
+        if self._conn is None:
+            return {}
+        try:
+            rows = self._conn.execute("SELECT bot, short_name, checked_at FROM bot_apps").fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"State store: cannot load bot apps: {e}")
+            return {}
+        return {row["bot"]: (row["short_name"], row["checked_at"]) for row in rows}
+
+    def record_bot_app(self, bot: str, short_name: Optional[str], checked_at: float):
+        if self._conn is not None:
+            self._bot_apps[bot] = (short_name, checked_at)
+
+    def forget(self, account_name: str):
+        """Stop tracking a removed account; its last flushed row stays for a later re-add."""
+        self._tracked.pop(account_name, None)
+        self._dirty.discard(account_name)
+
+    def mark_dirty(self, account_data: "AccountData"):
+        # Only accounts that went through restore(); construction-time defaults must not
+        # overwrite persisted rows.
+        if self._tracked.get(account_data.name) is account_data:
+            self._dirty.add(account_data.name)
+
+    def record_event(self, account_name: str, kind: str, result: str, detail: Optional[dict] = None):
+        """Append one event to the log and fold it into the hourly/daily rollups."""
+        if self._conn is None:
+            return
+        now = time.time()
+        detail = detail or {}
+        detail_json = json_dumps(detail) if detail else None
+        self._events.append((now, account_name, kind, result, detail_json))
+
+        stars, virus = event_earnings(kind, result, detail)
+        latency = None
+        user_prize_id = detail.get("user_prize_id")
+        if user_prize_id is not None and result == "success":
+            if kind in PRIZE_SOURCE_KINDS:
+                self._prize_won_at[user_prize_id] = now
+                if len(self._prize_won_at) > 10000:
+                    del self._prize_won_at[next(iter(self._prize_won_at))]
+            elif kind in PRIZE_SINK_KINDS and user_prize_id in self._prize_won_at:
+                latency = now - self._prize_won_at.pop(user_prize_id)
+
+        when = datetime.fromtimestamp(now, timezone.utc)
+        for granularity, fmt in ROLLUP_GRANULARITIES.items():
+            key = (granularity, when.strftime(fmt), account_name, kind)
+            delta = self._rollups.get(key)
+            if delta is None:
+                delta = self._rollups[key] = [0, 0, 0, 0, 0, 0.0, 0]
+            delta[0] += 1
+            delta[1] += result == "success"
+            delta[2] += result == "failure"
+            delta[3] += stars
+            delta[4] += virus
+            if latency is not None:
+                delta[5] += latency
+                delta[6] += 1
+
+    async def rollups(self, granularity: str = "day", since: Optional[str] = None, account: Optional[str] = None) -> list:
+        """Precomputed rollup rows (already flushed), oldest bucket first."""
+        if self._conn is None:
+            return []
+        query = f"SELECT granularity, bucket, account, kind, {', '.join(ROLLUP_COLUMNS)} FROM event_rollups WHERE granularity = ?"
+        params: list = [granularity]
+        if since:
+            query += " AND bucket >= ?"
+            params.append(since)
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        query += " ORDER BY bucket, account, kind"
+        async with self._write_lock:
+            rows = await asyncio.to_thread(lambda: self._conn.execute(query, params).fetchall())
+        return [dict(row) for row in rows]
+
+    def _snapshot(self, account_data: "AccountData", now: float) -> tuple:
+        previous = self._rows.get(account_data.name)
+        token = account_data.bearer_token
+        fingerprint = hashlib.sha256(token.encode("utf-8")).hexdigest()[:16] if token else None
+        token_updated_at = previous["token_updated_at"] if previous is not None else None
+        if previous is None or previous["token_fingerprint"] != fingerprint:
+            token_updated_at = now
+        return (
+            account_data.name,
+            *(getattr(account_data, name) for name in PERSISTED_FIELDS),
+            fingerprint,
+            token_updated_at,
+            now,
+        )
+
+    async def flush(self):
+        if self._conn is None or (not self._dirty and not self._events and not self._rollups and not self._bot_apps):
+            return
+        now = time.time()
+        dirty, events, pending_rollups, pending_bot_apps = self._dirty, self._events, self._rollups, self._bot_apps
+        rows = [self._snapshot(self._tracked[name], now) for name in dirty if name in self._tracked]
+        rollups = [(*key, *delta) for key, delta in pending_rollups.items()]
+        bot_apps = [(bot, *entry) for bot, entry in pending_bot_apps.items()]
+        self._dirty = set()
+        self._events = []
+        self._rollups = {}
+        self._bot_apps = {}
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write, rows, events, rollups, bot_apps)
+            except sqlite3.Error as e:
+                logger.error(f"State store write failed, retrying next flush: {e}")
+                self._requeue(dirty, events, pending_rollups, pending_bot_apps)
+                return
+        columns = ("name", *PERSISTED_FIELDS, "token_fingerprint", "token_updated_at", "updated_at")
+        for row in rows:
+            self._rows[row[0]] = dict(zip(columns, row))
+
+    def _requeue(self, dirty: set, events: list, rollups: Dict[tuple, list], bot_apps: Dict[str, tuple]):
+        """Merge a batch whose write failed back in front of what was recorded meanwhile."""
+        self._dirty |= dirty
+        self._events = events + self._events
+        for key, delta in rollups.items():
+            current = self._rollups.get(key)
+            if current is None:
+                self._rollups[key] = delta
+            else:
+                for index, value in enumerate(delta):
+                    current[index] += value
+        for bot, entry in bot_apps.items():
+            self._bot_apps.setdefault(bot, entry)  # a newer memo recorded meanwhile wins
+
+    def _write(self, rows: list, events: list, rollups: list, bot_apps: list):
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            if rows:
+                conn.executemany(
+                    """
+                    INSERT INTO accounts (name, username, balance, virus_balance, next_roulette_time,
+                        next_case_free_spin, last_story_reward, token_fingerprint, token_updated_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET
+                        username = excluded.username,
+                        balance = excluded.balance,
+                        virus_balance = excluded.virus_balance,
+                        next_roulette_time = excluded.next_roulette_time,
+                        next_case_free_spin = excluded.next_case_free_spin,
+                        last_story_reward = excluded.last_story_reward,
+                        token_fingerprint = excluded.token_fingerprint,
+                        token_updated_at = excluded.token_updated_at,
+                        updated_at = excluded.updated_at
+                    """,
+                    rows,
+                )
+            if events:
+                conn.executemany(
+                    "INSERT INTO prize_events (ts, account, kind, result, detail) VALUES (?, ?, ?, ?, ?)",
+                    events,
+                )
+            if rollups:
+                conn.executemany(
+                    f"""
+                    INSERT INTO event_rollups (granularity, bucket, account, kind, {', '.join(ROLLUP_COLUMNS)})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(granularity, bucket, account, kind) DO UPDATE SET
+                        {', '.join(f"{col} = {col} + excluded.{col}" for col in ROLLUP_COLUMNS)}
+                    """,
+                    rollups,
+                )
+            if bot_apps:
+                conn.executemany(
+                    """
+                    INSERT INTO bot_apps (bot, short_name, checked_at) VALUES (?, ?, ?)
+                    ON CONFLICT(bot) DO UPDATE SET
+                        short_name = excluded.short_name,
+                        checked_at = excluded.checked_at
+                    """,
+                    bot_apps,
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def start(self):
+        if self._conn is not None and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(STATE_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"State store flush failed: {e}")
+
+
+state_store = StateStore()
+
+
+class AccountLease:
+    """Exclusive flock on ``sessions/<session>.lock``; the OS drops it when the holder process dies."""
+
+    def __init__(self, session_name: str):
+        self.path = SESSIONS_DIR / f"{session_name}.lock"
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}@{os.uname().nodename} {datetime.now(timezone.utc).isoformat()}\n".encode())
+        self._fd = fd
+        return True
+
+    def holder(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8").strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
 
 class AccountManager:
     def __init__(self):
         self.accounts: Dict[str, AccountData] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._leases: Dict[str, AccountLease] = {}
+        self.lease_blocked: set = set()
+
+    def acquire_lease(self, account_name: str, session_name: str) -> bool:
+        """Take the account's session lease; False (and remembered for retry) if another process holds it."""
+        lease = self._leases.get(account_name) or AccountLease(session_name)
+        if not lease.acquire():
+            if account_name not in self.lease_blocked:
+                logger.warning(f"[{account_name}] Session is leased by another process ({lease.holder()}); skipping")
+            self.lease_blocked.add(account_name)
+            return False
+        if account_name in self.lease_blocked:
+            logger.success(f"[{account_name}] Took over session lease")
+        self.lease_blocked.discard(account_name)
+        self._leases[account_name] = lease
+        return True
+
+    def release_lease(self, account_name: str):
+        self.lease_blocked.discard(account_name)
+        lease = self._leases.pop(account_name, None)
+        if lease is not None:
+            lease.release()
+
+    def account_lock(self, account_name: str) -> asyncio.Lock:
+        """Held while the worker runs a flow for the account, so removal can wait for it."""
+        lock = self._locks.get(account_name)
+        if lock is None:
+            lock = self._locks[account_name] = asyncio.Lock()
+        return lock
         
     async def initialize_account(self, account_name: str, config: dict) -> bool:
         try:
-            client = Client(
-                config["session_name"],
-                config["api_id"],
-                config["api_hash"],
-                phone_number=config["phone_number"],
-                workdir=str(SESSIONS_DIR),
-            )
+            client = create_telegram_client(config)
             
             account_data = AccountData(
                 name=account_name,
@@ -123,6 +1057,11 @@ class AccountManager:
                 last_story_reward="",
             )
             
+            if state_store.restore(account_data):
+                logger.info(
+                    f"[{account_name}] Restored persisted timers: roulette {account_data.next_roulette_time}, "
+                    f"case {account_data.next_case_free_spin}"
+                )
             self.accounts[account_name] = account_data
             return True
             
@@ -130,6 +1069,9 @@ class AccountManager:
             return False
     
     async def get_init_data(self, account_name: str) -> Optional[str]:
+        from pyrogram.raw.functions.messages import RequestAppWebView
+        from pyrogram.raw.types import InputBotAppShortName, InputUser
+
         if account_name not in self.accounts:
             return None
             
@@ -139,11 +1081,12 @@ class AccountManager:
             return None
         
         try:
-            bot_entity = await client.get_users('virus_play_bot')
+            account_data = self.accounts[account_name]
+            bot_entity = await tg_call(account_data, "get_users", 'virus_play_bot')
             bot = InputUser(user_id=bot_entity.id, access_hash=bot_entity.raw.access_hash)
-            peer = await client.resolve_peer('virus_play_bot')
+            peer = await tg_call(account_data, "resolve_peer", 'virus_play_bot')
             bot_app = InputBotAppShortName(bot_id=bot, short_name="app")
-            web_view = await client.invoke(RequestAppWebView(peer=peer, app=bot_app, platform="android"))
+            web_view = await tg_call(account_data, "invoke", RequestAppWebView(peer=peer, app=bot_app, platform="android"))
             url_qs = urlparse(web_view.url)
             params = parse_qs(url_qs.query)
             fragment_params = parse_qs(url_qs.fragment)
@@ -156,6 +1099,503 @@ class AccountManager:
             return None
 
 
+# Sustained calls per second per account and method; FLOOD_WAITs lower them, successes restore them
+MTPROTO_RATES = {
+    "join_chat": 0.2,
+    "leave_chat": 0.5,
+    "send_message": 1.0,
+    "delete_chat_history": 1.0,
+}
+MTPROTO_DEFAULT_RATE = 3.0
+MTPROTO_BURST = 3.0
+# Lowest learned rate, as a share of the configured one
+MTPROTO_MIN_RATE_SHARE = 1 / 8
+
+
+@dataclass
+class TokenBucket:
+    rate: float
+    max_rate: float
+    tokens: float = MTPROTO_BURST
+    updated: float = 0.0
+    blocked_until: float = 0.0
+
+
+class MTProtoLimiter:
+    """Per-account, per-method token buckets that learn from FLOOD_WAIT.
+
+    A FLOOD_WAIT blocks that account's method for the server-mandated time, after which
+    one call may go through, and halves its rate (down to MTPROTO_MIN_RATE_SHARE); every
+    success wins back 5% of the configured rate. Waits longer than
+    MTPROTO_FLOOD_SLEEP_THRESHOLD are not slept through: the call fails fast with
+    FloodWait and the worker defers the account until the penalty ends.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[tuple, TokenBucket] = {}
+
+    def _bucket(self, account_name: str, method: str) -> TokenBucket:
+        key = (account_name, method)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate = MTPROTO_RATES.get(method, MTPROTO_DEFAULT_RATE)
+            bucket = self._buckets[key] = TokenBucket(rate, rate, updated=time.monotonic())
+        return bucket
+
+    async def acquire(self, account_name: str, method: str):
+        from pyrogram.errors import FloodWait
+
+        bucket = self._bucket(account_name, method)
+        while True:
+            now = time.monotonic()
+            blocked = bucket.blocked_until - now
+            if blocked > flood_wait_threshold():
+                metrics.inc("virusroulette_mtproto_deferred_total", method=method)
+                raise FloodWait(value=math.ceil(blocked))
+            bucket.tokens = min(MTPROTO_BURST, bucket.tokens + max(0.0, now - bucket.updated) * bucket.rate)
+            bucket.updated = max(now, bucket.updated)
+            if blocked <= 0 and bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return
+            await asyncio.sleep(max(blocked, (1 - bucket.tokens) / bucket.rate))
+
+    def succeeded(self, account_name: str, method: str):
+        bucket = self._bucket(account_name, method)
+        bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * 0.05)
+
+    def penalize(self, account_name: str, method: str, seconds: float):
+        bucket = self._bucket(account_name, method)
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + seconds)
+        bucket.rate = max(bucket.max_rate * MTPROTO_MIN_RATE_SHARE, bucket.rate / 2)
+        # Refill restarts when the penalty ends, with one call's worth of tokens
+        bucket.tokens = 1.0
+        bucket.updated = bucket.blocked_until
+        mtproto_log.warning(f"[{account_name}] FLOOD_WAIT {seconds:.0f}s on {method}; rate now {bucket.rate:.2f}/s")
+
+    def blocked_for(self, account_name: str) -> float:
+        """Seconds until the account's longest pending penalty (above the inline threshold) ends."""
+        now = time.monotonic()
+        longest = max(
+            (bucket.blocked_until - now for (name, _), bucket in self._buckets.items() if name == account_name),
+            default=0.0,
+        )
+        return longest if longest > MTPROTO_FLOOD_SLEEP_THRESHOLD else 0.0
+
+
+mtproto_limiter = MTProtoLimiter()
+# False for best-effort work (cleanup): any pending FLOOD_WAIT fails the call instead of being waited out
+_mtproto_wait_out_floods: ContextVar[bool] = ContextVar("mtproto_wait_out_floods", default=True)
+
+
+def flood_wait_threshold() -> float:
+    return MTPROTO_FLOOD_SLEEP_THRESHOLD if _mtproto_wait_out_floods.get() else 0.0
+
+
+async def best_effort_mtproto(aw):
+    """Await MTProto work that should fail fast on any FLOOD_WAIT instead of waiting it out."""
+    token = _mtproto_wait_out_floods.set(False)
+    try:
+        return await aw
+    finally:
+        _mtproto_wait_out_floods.reset(token)
+
+
+async def tg_call(account_data: AccountData, method: str, *args, **kwargs):
+    """Run one rate-limited MTProto client method; short FLOOD_WAITs are waited out and retried once."""
+    from pyrogram.errors import FloodWait
+
+    for attempt in range(2):
+        await mtproto_limiter.acquire(account_data.name, method)
+        try:
+            result = await _tg_call_once(account_data, method, *args, **kwargs)
+        except FloodWait as e:
+            mtproto_limiter.penalize(account_data.name, method, float(e.value or 0))
+            if attempt or (e.value or 0) > flood_wait_threshold():
+                raise
+            continue
+        mtproto_limiter.succeeded(account_data.name, method)
+        return result
+
+
+async def _tg_call_once(account_data: AccountData, method: str, *args, **kwargs):
+    """Run one MTProto client method and record its latency/outcome."""
+    from pyrogram.errors import FloodWait
+
+    started = time.perf_counter()
+    result = "ok"
+    try:
+        with tracer.span(f"mtproto.{method}", only_if_parent=True):
+            return await getattr(account_data.client, method)(*args, **kwargs)
+    except FloodWait:
+        result = "flood_wait"
+        metrics.inc("virusroulette_mtproto_flood_waits_total", method=method)
+        raise
+    except Exception:
+        result = "error"
+        raise
+    finally:
+        metrics.observe("virusroulette_mtproto_call_duration_seconds", time.perf_counter() - started, method=method)
+        metrics.inc("virusroulette_mtproto_calls_total", method=method, result=result)
+
+
+class ServerClock:
+    """Offset of the VirusGift server clock from ours, estimated from HTTP ``Date`` headers.
+
+    ``Date`` has one-second resolution, so a response sent at ``sent`` and read at ``received``
+    bounds the offset to ``[date - received, date + 1 - sent]``. The estimate is the middle of
+    the intersection of recent bounds, or the median midpoint when they disagree (clock step).
+    """
+
+    def __init__(self, window: int = 32):
+        self._bounds: deque = deque(maxlen=window)
+        self.offset = 0.0
+
+    def observe(self, date_header: Optional[str], sent: float, received: float):
+        if not date_header:
+            return
+        try:
+            server = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            return
+        self._bounds.append((server - received, server + 1 - sent))
+        low = max(bound[0] for bound in self._bounds)
+        high = min(bound[1] for bound in self._bounds)
+        if low <= high:
+            offset = (low + high) / 2
+        else:
+            midpoints = sorted((lo + hi) / 2 for lo, hi in self._bounds)
+            offset = midpoints[len(midpoints) // 2]
+        if abs(offset - self.offset) >= 1.0:
+            logger.info(f"Server clock offset is now {offset:+.2f}s (was {self.offset:+.2f}s)")
+        self.offset = offset
+
+    def now(self) -> datetime:
+        """Current time on the server's clock."""
+        return datetime.now(timezone.utc) + timedelta(seconds=self.offset)
+
+
+server_clock = ServerClock()
+
+
+class GraphQLResponse:
+    """Fully read GraphQL HTTP response; the JSON body is parsed at most once."""
+
+    __slots__ = ("status", "headers", "body", "_parsed")
+
+    def __init__(self, status: int, headers, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self._parsed = None
+
+    async def json(self):
+        if self._parsed is None:
+            self._parsed = json_loads(self.body)
+        return self._parsed
+
+    async def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+GRAPHQL_USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36"
+)
+GRAPHQL_HEADERS = {
+    "accept": "*/*",
+    "content-type": "application/json",
+    "origin": "https://virusgift.pro",
+    "referer": "https://virusgift.pro/roulette",
+    "user-agent": GRAPHQL_USER_AGENT,
+}
+# What the website adds to its batched / apollo requests
+GRAPHQL_BATCH_HEADERS = {"x-batch": "true", "x-timezone": "Europe/Warsaw"}
+GRAPHQL_BROWSER_HEADERS = {
+    "accept-language": "en-US,en;q=0.9",
+    "apollo-require-preflight": "*",
+    "priority": "u=1, i",
+    "sec-ch-ua": '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"macOS"',
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "same-origin",
+    **GRAPHQL_BATCH_HEADERS,
+}
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+PERSISTED_QUERY_NOT_SUPPORTED = "PersistedQueryNotSupported"
+
+
+class GraphQLOperation:
+    """A registered GraphQL document; request bodies are pre-encoded around the variables.
+
+    Three body heads are built once: the full query, the APQ hash alone, and query + hash
+    (which registers the document after a PersistedQueryNotFound). Documents shorter than
+    the hash extension itself are never sent as APQ.
+    """
+
+    __slots__ = ("name", "query", "sha256", "persisted", "_heads")
+
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = " ".join(query.split())
+        self.sha256 = hashlib.sha256(self.query.encode("utf-8")).hexdigest()
+        encoded_name = json_dumps_bytes(name)
+        encoded_query = json_dumps_bytes(self.query)
+        extensions = json_dumps_bytes({"persistedQuery": {"version": 1, "sha256Hash": self.sha256}})
+        self.persisted = len(encoded_query) > len(extensions)
+        self._heads = {
+            "full": b'{"operationName":' + encoded_name + b',"query":' + encoded_query + b',"variables":',
+            "persisted": b'{"operationName":' + encoded_name + b',"extensions":' + extensions + b',"variables":',
+            "register": (
+                b'{"operationName":' + encoded_name + b',"query":' + encoded_query
+                + b',"extensions":' + extensions + b',"variables":'
+            ),
+        }
+
+    def __call__(self, **variables) -> "GraphQLRequest":
+        return GraphQLRequest(self, variables)
+
+    def __repr__(self) -> str:
+        return f"GraphQLOperation({self.name!r}, sha256={self.sha256[:12]})"
+
+    def encode(self, variables: dict, mode: str = "full") -> bytes:
+        return self._heads[mode] + (json_dumps_bytes(variables) if variables else b"{}") + b"}"
+
+
+@dataclass(frozen=True)
+class GraphQLRequest:
+    operation: GraphQLOperation
+    variables: dict
+
+    def encode(self, mode: str = "full") -> bytes:
+        return self.operation.encode(self.variables, mode)
+
+
+# Selection set shared by every operation that returns a prize
+PRIZE_FIELDS = (
+    "id name caption animationUrl photoUrl exchangeCurrency exchangePrice prizeExchangePrice "
+    "isSpinSellable isClaimable isExchangeable storyLinkAfterWin __typename"
+)
+
+AUTH_TELEGRAM_INIT_DATA = GraphQLOperation("authTelegramInitData", """
+    mutation authTelegramInitData($initData: String!, $refCode: String) {
+        authTelegramInitData(initData: $initData, refCode: $refCode) { token success __typename }
+    }
+""")
+ME_FREE_TIMERS = GraphQLOperation("me", "query me { me { nextFreeSpin nextCaseFreeSpin } }")
+ME_BALANCE = GraphQLOperation("me", "query me { me { balance starsBalance } }")
+ME_VALIDATE = GraphQLOperation("me", "query me { me { starsBalance nextFreeSpin } }")
+START_ROULETTE_SPIN = GraphQLOperation("startRouletteSpin", f"""
+    mutation startRouletteSpin($input: StartRouletteSpinInput!) {{
+        startRouletteSpin(input: $input) {{
+            success prize {{ {PRIZE_FIELDS} }} userPrizeId balance isStoryRewardAvailable storyReward __typename
+        }}
+    }}
+""")
+GET_ROULETTE_INVENTORY = GraphQLOperation("getRouletteInventory", f"""
+    query getRouletteInventory($limit: Int64!, $cursor: Int64!) {{
+        getRouletteInventory(cursor: $cursor, limit: $limit) {{
+            success prizes {{ userRoulettePrizeId status prize {{ {PRIZE_FIELDS} }} claimCost unlockAt __typename }}
+            nextCursor hasNextPage __typename
+        }}
+    }}
+""")
+CLAIM_ROULETTE_PRIZE = GraphQLOperation("claimRoulettePrize", """
+    mutation claimRoulettePrize($input: ClaimRoulettePrizeInput!) {
+        claimRoulettePrize(input: $input) { success message telegramGift __typename }
+    }
+""")
+EXCHANGE_PRIZE_TO_STARS = GraphQLOperation("exchangeRoulettePrizeToStarsBalance", """
+    mutation exchangeRoulettePrizeToStarsBalance($input: ExchangeRoulettePrizeToStarsBalanceInput!) {
+        exchangeRoulettePrizeToStarsBalance(input: $input) { success }
+    }
+""")
+CASES = GraphQLOperation("cases", """
+    query cases {
+        cases { success cases { id name type starsPrice animationUrl expiresAt prizes { id animationUrl starsAmount } } }
+    }
+""")
+OPEN_CASE = GraphQLOperation("openCase", f"""
+    mutation openCase($id: ID!, $demo: Boolean!) {{
+        openCase(id: $id, demo: $demo) {{ success prize {{ {PRIZE_FIELDS} }} userPrizeId casePrizeId demo }}
+    }}
+""")
+CHECK_STORY_POST = GraphQLOperation("checkStoryPostRoulettePrizeWin", """
+    mutation checkStoryPostRoulettePrizeWin($input: CheckStoryPostRoulettePrizeWinInput!) {
+        checkStoryPostRoulettePrizeWin(input: $input) { success }
+    }
+""")
+TEST_SPIN_CLICK_OPERATIONS = {
+    "TEST_SPIN_URL_CLICK_REQUIRED": GraphQLOperation(
+        "markTestSpinTaskClick",
+        "mutation markTestSpinTaskClick($taskId: ID!) { markTestSpinTaskClick(taskId: $taskId) { success } }",
+    ),
+    "TEST_SPIN_PORTAL_CLICK_REQUIRED": GraphQLOperation(
+        "markTestSpinPortalClick", "mutation markTestSpinPortalClick { markTestSpinPortalClick { success } }",
+    ),
+    "TEST_SPIN_TONNEL_CLICK_REQUIRED": GraphQLOperation(
+        "markTestSpinTonnelClick", "mutation markTestSpinTonnelClick { markTestSpinTonnelClick { success } }",
+    ),
+    "TEST_SPIN_TONPLAY_CLICK_REQUIRED": GraphQLOperation(
+        "markTestSpinTonplayClick", "mutation markTestSpinTonplayClick { markTestSpinTonplayClick { success } }",
+    ),
+}
+
+# Cleared for the rest of the process when the server answers PersistedQueryNotSupported
+_persisted_queries = GRAPHQL_APQ
+# Hashes the server has accepted; anything else is sent with its query to register it first
+_persisted_hashes: set = set()
+
+
+def graphql_operation_name(payload) -> str:
+    if isinstance(payload, list):
+        return "+".join(graphql_operation_name(item) for item in payload)
+    if isinstance(payload, GraphQLRequest):
+        return payload.operation.name
+    return str((payload or {}).get("operationName", "unknown"))
+
+
+def encode_graphql_payload(payload, mode: str = "full") -> bytes:
+    """Request body for a registered request (or batch of them); plain dicts are JSON-encoded."""
+    if isinstance(payload, GraphQLRequest):
+        return payload.encode(mode)
+    if isinstance(payload, list) and payload and all(isinstance(item, GraphQLRequest) for item in payload):
+        return b"[" + b",".join(item.encode(mode) for item in payload) + b"]"
+    return json_dumps_bytes(payload)
+
+
+def is_persistable_payload(payload) -> bool:
+    """True when every request is registered and worth sending as an APQ hash."""
+    if isinstance(payload, list):
+        return bool(payload) and all(is_persistable_payload(item) for item in payload)
+    return isinstance(payload, GraphQLRequest) and payload.operation.persisted
+
+
+def graphql_auth_headers(bearer_token: str, referer: Optional[str] = None, extra: Optional[dict] = None) -> dict:
+    headers = {**GRAPHQL_HEADERS, **(extra or {}), "authorization": bearer_token}
+    if referer:
+        headers["referer"] = referer
+    return headers
+
+
+def record_graphql_errors(operation: str, result):
+    payloads = result if isinstance(result, list) else [result]
+    for payload in payloads:
+        for error in (payload or {}).get("errors") or []:
+            code = (error.get("extensions") or {}).get("code", "UNKNOWN")
+            metrics.inc("virusroulette_graphql_errors_total", operation=operation, code=code)
+
+
+def note_graphql_retry(operation: str):
+    metrics.inc("virusroulette_graphql_retries_total", operation=operation)
+
+
+def record_reward(account_name: str, kind: str, result: str, **detail):
+    """Count a spin/case/claim/exchange/story outcome (success, failure, not_ready) and persist it."""
+    metrics.inc("virusroulette_rewards_total", account=account_name, kind=kind, result=result)
+    state_store.record_event(account_name, kind, result, detail)
+
+
+HTTP_POOL_SIZE = 100
+_http_session: Optional[aiohttp.ClientSession] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def http_session() -> aiohttp.ClientSession:
+    """Shared keep-alive session for all outgoing HTTP (GraphQL, story links).
+
+    No cookie jar, so nothing leaks between accounts; timeouts are set per request.
+    """
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        _http_session_loop = loop
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+@asynccontextmanager
+async def graphql_call(payload, headers=None, timeout: float = 30):
+    """POST a GraphQL payload (single or batch) and yield the read response.
+
+    With GRAPHQL_APQ on, registered requests carry their sha256Hash: the first one also
+    carries the query (registering it), later ones only the hash. PersistedQueryNotFound
+    is retried once with the query attached.
+    """
+    global _persisted_queries
+    operation = graphql_operation_name(payload)
+    started = time.perf_counter()
+    status = "error"
+    try:
+        with tracer.span(f"graphql.{operation}", only_if_parent=True) as span:
+            headers = dict(headers or {})
+            if not any(key.lower() == "content-type" for key in headers):
+                headers["content-type"] = "application/json"
+            mode = "full"
+            if _persisted_queries and is_persistable_payload(payload):
+                hashes = {item.operation.sha256 for item in (payload if isinstance(payload, list) else [payload])}
+                mode = "persisted" if hashes <= _persisted_hashes else "register"
+            session = http_session()
+            while True:
+                sent = time.time()
+                async with session.post(
+                    graphql_url,
+                    headers=headers,
+                    data=encode_graphql_payload(payload, mode),
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as raw_response:
+                    server_clock.observe(raw_response.headers.get("Date"), sent, time.time())
+                    body = await raw_response.read()
+                    status = str(raw_response.status)
+                    response = GraphQLResponse(raw_response.status, raw_response.headers, body)
+                if mode == "full":
+                    break
+                if PERSISTED_QUERY_NOT_SUPPORTED.encode() in body:
+                    _persisted_queries = False
+                    logger.info("GraphQL server does not support persisted queries; sending full queries")
+                    metrics.inc("virusroulette_graphql_persisted_queries_total", operation=operation, result="unsupported")
+                    mode = "full"
+                elif mode == "persisted" and PERSISTED_QUERY_NOT_FOUND.encode() in body:
+                    metrics.inc("virusroulette_graphql_persisted_queries_total", operation=operation, result="miss")
+                    _persisted_hashes.difference_update(hashes)
+                    mode = "register"
+                else:
+                    if raw_response.status == 200:
+                        if mode == "persisted":
+                            metrics.inc("virusroulette_graphql_persisted_queries_total", operation=operation, result="hit")
+                        _persisted_hashes.update(hashes)
+                    break
+            if span is not None:
+                span.set(status=raw_response.status)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        raise
+    finally:
+        metrics.observe(
+            "virusroulette_graphql_request_duration_seconds",
+            time.perf_counter() - started,
+            operation=operation,
+            status=status,
+        )
+    yield response
+    if b'"errors"' in response.body:
+        try:
+            record_graphql_errors(operation, await response.json())
+        except ValueError:
+            pass
+
+
 async def get_next_free_spin_time(bearer_token):
     timers = await get_me_free_timers(bearer_token)
     return timers.get("next_free_spin")
@@ -163,44 +1603,19 @@ async def get_next_free_spin_time(bearer_token):
 
 async def get_me_free_timers(bearer_token) -> dict:
     """Fetch nextFreeSpin and nextCaseFreeSpin from me query."""
-    query = '''
-    query me {
-        me {
-            nextFreeSpin
-            nextCaseFreeSpin
-        }
-    }
-    '''
-
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/139.0.0.0 Safari/537.36',
-        'x-batch': 'true',
-        'x-timezone': 'Europe/Warsaw',
-    }
-
-    json_data = [{
-        'operationName': 'me',
-        'variables': {},
-        'query': query,
-    }]
+    headers = graphql_auth_headers(bearer_token, referer="https://virusgift.pro/", extra=GRAPHQL_BATCH_HEADERS)
+    json_data = [ME_FREE_TIMERS()]
 
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    payload = result[0] if isinstance(result, list) and result else result
-                    me_data = ((payload or {}).get('data') or {}).get('me') or {}
-                    return {
-                        'next_free_spin': me_data.get('nextFreeSpin'),
-                        'next_case_free_spin': me_data.get('nextCaseFreeSpin'),
-                    }
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                result = await response.json()
+                payload = result[0] if isinstance(result, list) and result else result
+                me_data = ((payload or {}).get('data') or {}).get('me') or {}
+                return {
+                    'next_free_spin': me_data.get('nextFreeSpin'),
+                    'next_case_free_spin': me_data.get('nextCaseFreeSpin'),
+                }
     except Exception:
         pass
 
@@ -214,15 +1629,31 @@ def apply_balance_to_account(account_data: AccountData, balance_data) -> None:
     account_data.virus_balance = balance_data.get('virus_balance', 0) or 0
 
 
-def is_free_reward_ready(next_time: Optional[str]) -> bool:
-    """True when timer is missing/unknown/past — reward can be claimed."""
+def reward_due_in(next_time: Optional[str], margin: float = 0.0) -> float:
+    """Seconds (server clock) until ``next_time`` + ``margin``; 0 when missing/unknown."""
     if not next_time or next_time in ("Unknown", "⏳ Unknown..."):
-        return True
+        return 0.0
     try:
         dt = datetime.fromisoformat(str(next_time).replace('Z', '+00:00'))
-        return datetime.now(timezone.utc) >= dt
     except (ValueError, TypeError):
-        return True
+        return 0.0
+    return (dt - server_clock.now()).total_seconds() + margin
+
+
+def is_free_reward_ready(next_time: Optional[str], margin: float = 0.0) -> bool:
+    """True when timer is missing/unknown/past — reward can be claimed."""
+    return reward_due_in(next_time, margin) <= 0
+
+
+def observe_scheduler_lag(kind: str, next_time: Optional[str]):
+    """Record how late the worker acts on an unlocked timer (skipped for unknown timers)."""
+    try:
+        unlock_dt = datetime.fromisoformat(str(next_time).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return
+    lag = (server_clock.now() - unlock_dt).total_seconds()
+    if lag >= 0:
+        metrics.observe("virusroulette_scheduler_lag_seconds", lag, kind=kind)
 
 
 def build_dashboard_payload() -> dict:
@@ -247,7 +1678,7 @@ def build_dashboard_payload() -> dict:
             "online": online,
         })
     return {
-        "server_time": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "server_time": server_clock.now().isoformat().replace("+00:00", "Z"),
         "accounts": accounts,
     }
 
@@ -272,6 +1703,18 @@ def _dashboard_cookie_ok(request: web.Request) -> bool:
     return secrets.compare_digest(raw, _dashboard_cookie_token())
 
 
+def _metrics_token_ok(request: web.Request) -> bool:
+    """Scrapers cannot log in; with COOKIE_ON they authenticate with `Authorization: Bearer METRICS_TOKEN`."""
+    if not METRICS_TOKEN:
+        return False
+    raw = request.headers.get("Authorization", "")
+    return secrets.compare_digest(raw, f"Bearer {METRICS_TOKEN}")
+
+
+def dashboard_json(data, status: int = 200) -> web.Response:
+    return web.json_response(data, status=status, dumps=json_dumps)
+
+
 @web.middleware
 async def dashboard_auth_middleware(request: web.Request, handler):
     if not COOKIE_ON:
@@ -280,29 +1723,115 @@ async def dashboard_auth_middleware(request: web.Request, handler):
         return await handler(request)
     if _dashboard_cookie_ok(request):
         return await handler(request)
-    if request.path.startswith("/api/"):
-        return web.json_response({"error": "Unauthorized"}, status=401)
+    if request.path == "/metrics" and _metrics_token_ok(request):
+        return await handler(request)
+    if request.path.startswith("/api/") or request.path == "/metrics":
+        return dashboard_json({"error": "Unauthorized"}, status=401)
     raise web.HTTPFound("/login")
 
 
 async def dashboard_api_accounts(request):
-    return web.json_response(build_dashboard_payload())
+    return dashboard_json(build_dashboard_payload())
+
+
+async def dashboard_api_traces(request):
+    account = request.query.get("account")
+    if shard_supervisor is not None:
+        if account:
+            traces = await shard_supervisor.request(shard_supervisor.shard_of(account), "traces", account=account)
+            return dashboard_json({"account": account, "traces": traces})
+        summary = {}
+        for shard_summary in await shard_supervisor.broadcast("traces"):
+            summary.update(shard_summary)
+        return dashboard_json({"accounts": summary})
+    if account:
+        return dashboard_json({"account": account, "traces": tracer.recent(account)})
+    return dashboard_json({"accounts": tracer.summary()})
+
+
+def summarize_rollups(rows: list) -> dict:
+    """Per-account and per-bucket fleet totals from rollup rows."""
+    per_account: Dict[str, dict] = {}
+    fleet: Dict[str, dict] = {}
+    for row in rows:
+        acc = per_account.setdefault(row["account"], {
+            "prizes": 0, "stars": 0, "virus": 0, "spins": 0, "cases": 0,
+            "claims": 0, "claim_failures": 0, "errors": 0, "_latency_sum": 0.0, "_latency_count": 0,
+        })
+        bucket = fleet.setdefault(row["bucket"], {"prizes": 0, "stars": 0, "virus": 0})
+        kind = row["kind"]
+        for target in (acc, bucket):
+            target["stars"] += row["stars"]
+            target["virus"] += row["virus"]
+            if kind in PRIZE_SOURCE_KINDS:
+                target["prizes"] += row["successes"]
+        if kind == "spin":
+            acc["spins"] += row["successes"]
+        elif kind == "case":
+            acc["cases"] += row["successes"]
+        elif kind == "error":
+            acc["errors"] += row["events"]
+        if kind in PRIZE_SINK_KINDS:
+            acc["claims"] += row["successes"] + row["failures"]
+            acc["claim_failures"] += row["failures"]
+            acc["_latency_sum"] += row["latency_sum"]
+            acc["_latency_count"] += row["latency_count"]
+    for acc in per_account.values():
+        latency_sum = acc.pop("_latency_sum")
+        latency_count = acc.pop("_latency_count")
+        acc["claim_failure_rate"] = round(acc["claim_failures"] / acc["claims"], 4) if acc["claims"] else 0.0
+        acc["avg_spin_to_claim_seconds"] = round(latency_sum / latency_count, 2) if latency_count else None
+    return {"accounts": per_account, "fleet": fleet}
+
+
+async def dashboard_api_rollups(request):
+    granularity = request.query.get("granularity", "day")
+    if granularity not in ROLLUP_GRANULARITIES:
+        return dashboard_json({"error": "granularity must be hour or day"}, status=400)
+    since = request.query.get("since")
+    if not since:
+        window = timedelta(hours=48) if granularity == "hour" else timedelta(days=30)
+        since = (datetime.now(timezone.utc) - window).strftime(ROLLUP_GRANULARITIES[granularity])
+    rows = await state_store.rollups(granularity, since, request.query.get("account"))
+    return dashboard_json({
+        "enabled": state_store.is_open,
+        "granularity": granularity,
+        "since": since,
+        **summarize_rollups(rows),
+        "rows": rows,
+    })
+
+
+async def dashboard_api_reload(request):
+    return dashboard_json(await reload_account_configs())
+
+
+async def dashboard_traces_page(request):
+    traces_path = DASHBOARD_DIR / "traces.html"
+    if not traces_path.exists():
+        return web.Response(text="Traces page not found", status=404)
+    return web.FileResponse(traces_path)
+
+
+async def dashboard_metrics(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
 
 
 async def dashboard_api_login(request: web.Request):
     if not COOKIE_ON:
-        return web.json_response({"ok": True, "auth": False})
+        return dashboard_json({"ok": True, "auth": False})
     if not DASHBOARD_PASSWORD:
-        return web.json_response({"error": "PASSWORD is not set in .env"}, status=500)
+        return dashboard_json({"error": "PASSWORD is not set in .env"}, status=500)
     try:
         body = await request.json()
     except Exception:
         body = {}
     password = str(body.get("password", ""))
     if not secrets.compare_digest(password, DASHBOARD_PASSWORD):
-        return web.json_response({"error": "Invalid password"}, status=401)
+        return dashboard_json({"error": "Invalid password"}, status=401)
 
-    resp = web.json_response({"ok": True})
+    resp = dashboard_json({"ok": True})
     forwarded = request.headers.get("X-Forwarded-Proto", request.scheme).split(",")[0].strip()
     resp.set_cookie(
         DASHBOARD_COOKIE_NAME,
@@ -357,6 +1886,11 @@ async def start_dashboard_server():
     app.router.add_get("/login", dashboard_login_page)
     app.router.add_post("/api/login", dashboard_api_login)
     app.router.add_get("/api/accounts", dashboard_api_accounts)
+    app.router.add_post("/api/accounts/reload", dashboard_api_reload)
+    app.router.add_get("/metrics", dashboard_metrics)
+    app.router.add_get("/traces", dashboard_traces_page)
+    app.router.add_get("/api/traces", dashboard_api_traces)
+    app.router.add_get("/api/rollups", dashboard_api_rollups)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, DASHBOARD_HOST, DASHBOARD_PORT)
@@ -375,6 +1909,10 @@ def get_username_from_init_data(init_data):
     return 'Unknown'
 
 async def get_init_data(account_config):
+    from pyrogram import Client
+    from pyrogram.raw.functions.messages import RequestAppWebView
+    from pyrogram.raw.types import InputBotAppShortName, InputUser
+
     client = Client(
         account_config["session_name"],
         api_id=account_config["api_id"],
@@ -397,7 +1935,26 @@ async def get_init_data(account_config):
             init_data = fragment_params.get("tgWebAppData", [None])[0]
         return init_data
 
-async def subscribe_to_channel(target, account_data: AccountData):
+# join_chat errors that mean the channel / invite itself is gone, for every account alike
+STALE_CHANNEL_ERRORS = (
+    "INVITE_HASH_EXPIRED",
+    "INVITE_HASH_INVALID",
+    "CHANNEL_INVALID",
+    "USERNAME_NOT_OCCUPIED",
+    "USERNAME_INVALID",
+)
+
+
+class StaleRequirement(Exception):
+    """A requirement's target no longer exists (expired invite, deleted channel)."""
+
+
+@traced("subscribe")
+async def subscribe_to_channel(target, account_data: AccountData, raise_stale: bool = False):
+    """Join a channel by id, @username or invite link; False if the account could not join.
+
+    With ``raise_stale``, a target that is gone for everyone raises StaleRequirement instead.
+    """
     global subscribed_channels
     max_retries = 3
     base_delay = 2
@@ -409,18 +1966,26 @@ async def subscribe_to_channel(target, account_data: AccountData):
     channel_ref = normalize_channel_ref(target)
     if not channel_ref:
         logger.error(f"[{account_data.name}] Empty channel target: {target}")
+        if raise_stale:
+            raise StaleRequirement(f"empty channel target {target!r}")
         return False
 
+    known_id = channel_cache.get(channel_ref)
+    if known_id is not None and known_id in account_data.subscribed_channels:
+        logger.debug(f"[{account_data.name}] Already subscribed to channel: {channel_ref} (id={known_id})")
+        return True
+
     for attempt in range(max_retries):
         try:
             try:
-                chat = await account_data.client.join_chat(channel_ref)
+                chat = await tg_call(account_data, "join_chat", channel_ref)
             except Exception as join_error:
                 if "USER_ALREADY_PARTICIPANT" not in str(join_error):
                     raise
                 logger.debug(f"[{account_data.name}] Already subscribed to channel: {channel_ref}")
                 try:
-                    chat = await account_data.client.get_chat(channel_ref)
+                    # Another account already resolved this ref: no get_chat round trip
+                    chat = channel_cache.chat(channel_ref) or await tg_call(account_data, "get_chat", channel_ref)
                 except Exception:
                     account_data.subscribed_channels.add(channel_ref)
                     if isinstance(subscribed_channels, dict):
@@ -433,6 +1998,7 @@ async def subscribe_to_channel(target, account_data: AccountData):
                     return True
 
             track_id = getattr(chat, "id", None) or channel_ref
+            channel_cache.remember(channel_ref, chat)
             account_data.subscribed_channels.add(track_id)
 
             if isinstance(subscribed_channels, dict):
@@ -447,8 +2013,18 @@ async def subscribe_to_channel(target, account_data: AccountData):
             return True
 
         except Exception as e:
+            if any(code in str(e) for code in STALE_CHANNEL_ERRORS):
+                logger.error(f"[{account_data.name}] Channel {channel_ref} is no longer joinable: {e}")
+                if raise_stale:
+                    raise StaleRequirement(str(e)) from e
+                return False
+            if mtproto_limiter.blocked_for(account_data.name):
+                # Long FLOOD_WAIT: the worker defers this account until it ends
+                logger.error(f"[{account_data.name}] Channel subscription deferred: {e}")
+                return False
             if attempt < max_retries - 1:
-                delay = base_delay * (2 ** attempt)
+                # After a short FLOOD_WAIT the limiter already holds the retry until it expires
+                delay = 0 if "FLOOD_WAIT" in str(e) else base_delay * (2 ** attempt)
                 logger.warning(
                     f"[{account_data.name}] Channel subscription failed: {e}, "
                     f"retrying in {delay}s (attempt {attempt + 1}/{max_retries})"
@@ -473,9 +2049,11 @@ async def unsubscribe_from_channel(account_data: AccountData, channel_ref) -> bo
     leave_target = channel_ref
     if isinstance(channel_ref, str):
         leave_target = normalize_channel_ref(channel_ref) or channel_ref
+        # Invite links cannot be left directly; use the chat id learned on join
+        leave_target = channel_cache.get(leave_target) or leave_target
 
     try:
-        await client.leave_chat(leave_target)
+        await tg_call(account_data, "leave_chat", leave_target)
         logger.success(f"[{account_data.name}] Unsubscribed from {leave_target}")
         return True
     except Exception as e:
@@ -485,8 +2063,8 @@ async def unsubscribe_from_channel(account_data: AccountData, channel_ref) -> bo
             return True
         # Fallback: resolve username/link to chat id, then leave
         try:
-            chat = await client.get_chat(leave_target)
-            await client.leave_chat(chat.id)
+            chat = await tg_call(account_data, "get_chat", leave_target)
+            await tg_call(account_data, "leave_chat", chat.id)
             logger.success(f"[{account_data.name}] Unsubscribed from {getattr(chat, 'username', chat.id)}")
             return True
         except Exception as e2:
@@ -494,6 +2072,7 @@ async def unsubscribe_from_channel(account_data: AccountData, channel_ref) -> bo
             return False
 
 
+@traced("unsubscribe")
 async def unsubscribe_from_channels(account_data, channels_set):
     if not channels_set:
         return
@@ -510,7 +2089,6 @@ async def unsubscribe_from_channels(account_data, channels_set):
                 channels_set.pop(channel_ref, None)
             elif channel_ref in channels_set:
                 channels_set.remove(channel_ref)
-        await asyncio.sleep(0.5)
 
     remaining_count = len(channels_set) if channels_set else 0
     if remaining_count > 0:
@@ -519,14 +2097,58 @@ async def unsubscribe_from_channels(account_data, channels_set):
         logger.success(f"[{account_data.name}] Successfully unsubscribed from all channels")
 
 
+@dataclass
+class CachedChat:
+    id: int
+    username: Optional[str] = None
+
+
+class ChannelRefCache:
+    """Normalized channel ref (username / invite link) -> chat, shared by all accounts.
+
+    Chat ids are global, so once one account has joined or looked up a channel the
+    others can skip the get_chat fallback and leave invite-link channels by id.
+    """
+
+    def __init__(self, limit: int = 1024):
+        self.limit = limit
+        self._chats: Dict[str, CachedChat] = {}
+
+    @staticmethod
+    def key(channel_ref) -> str:
+        return str(channel_ref).lower()
+
+    def chat(self, channel_ref) -> Optional[CachedChat]:
+        return self._chats.get(self.key(channel_ref))
+
+    def get(self, channel_ref) -> Optional[int]:
+        chat = self.chat(channel_ref)
+        return chat.id if chat is not None else None
+
+    def remember(self, channel_ref, chat):
+        chat_id = getattr(chat, "id", None)
+        if chat_id is None or isinstance(channel_ref, int):
+            return
+        self._chats[self.key(channel_ref)] = CachedChat(chat_id, getattr(chat, "username", None))
+        while len(self._chats) > self.limit:
+            del self._chats[next(iter(self._chats))]
+
+
+channel_cache = ChannelRefCache()
+
+
 def normalize_channel_ref(target: str):
     """Normalize channel url / @username / invite link for join/leave_chat."""
     if target is None:
         return None
     if isinstance(target, int):
         return target
+    return _normalize_channel_str(str(target))
 
-    value = str(target).strip()
+
+@functools.lru_cache(maxsize=1024)
+def _normalize_channel_str(value: str):
+    value = value.strip()
     if not value:
         return None
 
@@ -554,62 +2176,101 @@ def normalize_channel_ref(target: str):
     return value
 
 
-def escape_markdown_v2(text: str) -> str:
-    specials = r"_*[]()~`>#+-=|{}.!"
-    out = []
-    for ch in str(text):
-        if ch in specials:
-            out.append("\\" + ch)
-        else:
-            out.append(ch)
-    return "".join(out)
+MARKDOWN_V2_SPECIALS = "\\_*[]()~`>#+-=|{}.!"
+_MARKDOWN_V2_TABLE = str.maketrans({ch: "\\" + ch for ch in MARKDOWN_V2_SPECIALS})
+_MARKDOWN_V2_PLAIN_RE = re.compile(r"\\(.)|[*_`~|]", re.DOTALL)
+
+
+class MarkdownV2(str):
+    """Text that is already valid MarkdownV2 and must not be escaped again."""
+
+
+def escape_markdown_v2(text) -> str:
+    if isinstance(text, MarkdownV2):
+        return text
+    return str(text).translate(_MARKDOWN_V2_TABLE)
+
+
+def md(template: str, *args, **kwargs) -> MarkdownV2:
+    """Fill a MarkdownV2 template; only the interpolated values are escaped.
+
+    The template itself is written in MarkdownV2 (literal specials escaped by hand),
+    values are converted to str, so format specs must be applied before passing them.
+    """
+    return MarkdownV2(template.format(
+        *(escape_markdown_v2(value) for value in args),
+        **{key: escape_markdown_v2(value) for key, value in kwargs.items()},
+    ))
+
+
+def markdown_v2_to_plain(text: str) -> str:
+    """Strip MarkdownV2 markup and escapes for plain-text fallbacks."""
+    return _MARKDOWN_V2_PLAIN_RE.sub(lambda m: m.group(1) or "", text)
+
+
+def truncate_markdown_v2(text: str, limit: int) -> MarkdownV2:
+    """Shorten a MarkdownV2 message to ``limit`` chars; the result is always valid MarkdownV2.
+
+    Cutting the markup could leave an entity open, so an oversized message is cut as plain
+    text and re-escaped (it loses its formatting).
+    """
+    if len(text) <= limit:
+        return MarkdownV2(text)
+    plain = markdown_v2_to_plain(text)
+    size = limit
+    while True:
+        shortened = md("{text}…", text=plain[:size].rstrip())
+        if len(shortened) <= limit or size <= 0:
+            return shortened
+        size -= len(shortened) - limit
 
 async def get_bearer_token(init_data, account_name=None, ref_code=None):
-    json_data = {'operationName': 'authTelegramInitData', 'variables': {'initData': init_data, 'refCode': ref_code}, 'query': 'mutation authTelegramInitData($initData: String!, $refCode: String) { authTelegramInitData(initData: $initData, refCode: $refCode) { token success __typename } }'}
+    json_data = AUTH_TELEGRAM_INIT_DATA(initData=init_data, refCode=ref_code)
     
     max_retries = 3
     base_delay = 2
     
     for attempt in range(max_retries):
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(graphql_url, json=json_data) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if 'data' in data and 'authTelegramInitData' in data['data']:
-                            auth_data = data['data']['authTelegramInitData']
-                            if auth_data.get('success') and 'token' in auth_data:
-                                return f"Bearer {auth_data['token']}"
-                    elif response.status == 502:
-                        if attempt < max_retries - 1:
-                            delay = base_delay * (2 ** attempt)
-                            if account_name:
-                                logger.warning(f"[{account_name}] 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
-                            else:
-                                logger.warning(f"502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
-                            await asyncio.sleep(delay)
-                            continue
+            async with graphql_call(json_data) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if 'data' in data and 'authTelegramInitData' in data['data']:
+                        auth_data = data['data']['authTelegramInitData']
+                        if auth_data.get('success') and 'token' in auth_data:
+                            return f"Bearer {auth_data['token']}"
+                elif response.status == 502:
+                    if attempt < max_retries - 1:
+                        delay = base_delay * (2 ** attempt)
+                        note_graphql_retry("authTelegramInitData")
+                        if account_name:
+                            graphql_log.bind(sample="http_502").warning(f"[{account_name}] 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                        else:
+                            graphql_log.bind(sample="http_502").warning(f"502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                        await asyncio.sleep(delay)
+                        continue
                     
-                    if account_name:
-                        logger.error(f"Failed to get bearer token for {account_name}. Status: {response.status}")
-                    else:
-                        logger.error(f"Failed to get bearer token. Status: {response.status}")
+                if account_name:
+                    logger.error(f"Failed to get bearer token for {account_name}. Status: {response.status}")
+                else:
+                    logger.error(f"Failed to get bearer token. Status: {response.status}")
                     
-                    if response.status != 502:
-                        break
+                if response.status != 502:
+                    break
                         
         except asyncio.TimeoutError:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("authTelegramInitData")
+                graphql_log.warning(f"Request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error("Request timeout after all retries")
         except Exception as e:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("authTelegramInitData")
+                graphql_log.warning(f"Request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Request failed after all retries: {e}")
@@ -617,74 +2278,53 @@ async def get_bearer_token(init_data, account_name=None, ref_code=None):
     return None
 
 async def get_account_balance(bearer_token):
-    headers = {
-        'accept': '*/*',
-        'accept-language': 'en-US,en;q=0.9',
-        'apollo-require-preflight': '*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'priority': 'u=1, i',
-        'referer': 'https://virusgift.pro/roulette',
-        'sec-ch-ua': '"Chromium";v="140", "Not=A?Brand";v="24", "Google Chrome";v="140"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"macOS"',
-        'sec-fetch-dest': 'empty',
-        'sec-fetch-mode': 'cors',
-        'sec-fetch-site': 'same-origin',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
-        'x-batch': 'true',
-        'x-timezone': 'Europe/Warsaw',
-    }
-    
-    json_data = {
-        'operationName': 'me',
-        'variables': {},
-        'query': 'query me { me { balance starsBalance } }',
-    }
+    headers = graphql_auth_headers(bearer_token, extra=GRAPHQL_BROWSER_HEADERS)
+    json_data = ME_BALANCE()
     
     max_retries = 3
     base_delay = 1
     
     for attempt in range(max_retries):
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post('https://virusgift.pro/api/graphql/query', headers=headers, json=json_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        payload = result[0] if isinstance(result, list) else result
-                        if payload and 'data' in payload and payload['data'] and 'me' in payload['data'] and payload['data']['me']:
-                            balance_data = payload['data']['me']
-                            return {
-                                'virus_balance': balance_data.get('balance', 0),
-                                'stars_balance': balance_data.get('starsBalance', 0)
-                            }
-                        else:
-                            logger.warning(f"Invalid balance response structure, attempt {attempt + 1}/{max_retries}")
-                    elif response.status == 502:
-                        if attempt < max_retries - 1:
-                            delay = base_delay * (2 ** attempt)
-                            logger.warning(f"Balance 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
-                            await asyncio.sleep(delay)
-                            continue
+            async with graphql_call(json_data, headers) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    payload = result[0] if isinstance(result, list) else result
+                    if payload and 'data' in payload and payload['data'] and 'me' in payload['data'] and payload['data']['me']:
+                        balance_data = payload['data']['me']
+                        return {
+                            'virus_balance': balance_data.get('balance', 0),
+                            'stars_balance': balance_data.get('starsBalance', 0)
+                        }
                     else:
-                        logger.warning(f"Balance API returned status {response.status}, attempt {attempt + 1}/{max_retries}")
+                        logger.warning(f"Invalid balance response structure, attempt {attempt + 1}/{max_retries}")
+                elif response.status == 502:
+                    if attempt < max_retries - 1:
+                        delay = base_delay * (2 ** attempt)
+                        note_graphql_retry("me")
+                        graphql_log.bind(sample="http_502").warning(f"Balance 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                        await asyncio.sleep(delay)
+                        continue
+                else:
+                    logger.warning(f"Balance API returned status {response.status}, attempt {attempt + 1}/{max_retries}")
                     
-                    if response.status != 502 and attempt < max_retries - 1:
-                        await asyncio.sleep(base_delay * (2 ** attempt))
+                if response.status != 502 and attempt < max_retries - 1:
+                    note_graphql_retry("me")
+                    await asyncio.sleep(base_delay * (2 ** attempt))
                         
         except asyncio.TimeoutError:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Balance request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("me")
+                graphql_log.warning(f"Balance request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error("Balance request timeout after all retries")
         except Exception as e:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Balance request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("me")
+                graphql_log.warning(f"Balance request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Error getting balance after all retries: {e}")
@@ -699,13 +2339,13 @@ async def visit_story_link(link):
     if not link:
         return False
     try:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-            async with session.get(link, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                return response.status == 200
+        async with http_session().get(link, timeout=aiohttp.ClientTimeout(total=10)) as response:
+            return response.status == 200
     except Exception:
         return False
 
 
+@traced("story_bonus")
 async def check_story_post_roulette_prize_win(bearer_token: str, user_prize_id) -> bool:
     """Claim story bonus after a spin. Frontend only opens share UI then calls this —
     actual story publish is not verified by the backend.
@@ -717,31 +2357,15 @@ async def check_story_post_roulette_prize_win(bearer_token: str, user_prize_id)
     except (TypeError, ValueError):
         uid = user_prize_id
 
-    headers = {
-        "accept": "*/*",
-        "authorization": bearer_token,
-        "content-type": "application/json",
-        "origin": "https://virusgift.pro",
-        "referer": "https://virusgift.pro/roulette",
-        "user-agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36",
-    }
-    json_data = {
-        "operationName": "checkStoryPostRoulettePrizeWin",
-        "variables": {"input": {"userPrizeId": uid}},
-        "query": (
-            "mutation checkStoryPostRoulettePrizeWin($input: CheckStoryPostRoulettePrizeWinInput!) { "
-            "checkStoryPostRoulettePrizeWin(input: $input) { success } }"
-        ),
-    }
+    headers = graphql_auth_headers(bearer_token)
+    json_data = CHECK_STORY_POST(input={"userPrizeId": uid})
 
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status != 200:
-                    logger.error(f"checkStoryPostRoulettePrizeWin HTTP {response.status}")
-                    return False
-                result = await response.json()
+        async with graphql_call(json_data, headers) as response:
+            if response.status != 200:
+                logger.error(f"checkStoryPostRoulettePrizeWin HTTP {response.status}")
+                return False
+            result = await response.json()
     except Exception as e:
         logger.error(f"checkStoryPostRoulettePrizeWin failed: {e}")
         return False
@@ -809,17 +2433,6 @@ def infer_test_spin_click_code(link: str = "", message: str = "", error_code: st
     return 'TEST_SPIN_URL_CLICK_REQUIRED'
 
 
-def graphql_auth_headers(bearer_token: str) -> dict:
-    return {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36',
-    }
-
-
 def extract_task_id(extensions: dict):
     """Read task id from GraphQL error extensions (snake or camel)."""
     if not extensions:
@@ -838,6 +2451,11 @@ async def mark_test_spin_click(bearer_token: str, error_code: str, task_id=None)
     """
     headers = graphql_auth_headers(bearer_token)
     error_code = infer_test_spin_click_code(error_code=error_code)
+    operation = TEST_SPIN_CLICK_OPERATIONS.get(error_code)
+    if operation is None:
+        logger.error(f"Unsupported test spin click code: {error_code}")
+        return False
+    result_key = operation.name
 
     if error_code == 'TEST_SPIN_URL_CLICK_REQUIRED':
         if task_id is None:
@@ -845,65 +2463,99 @@ async def mark_test_spin_click(bearer_token: str, error_code: str, task_id=None)
             logger.info("TEST_SPIN_URL_CLICK_REQUIRED without task_id — skip mark, open link")
             return True
         normalized_task_id = int(task_id) if str(task_id).isdigit() else task_id
-        payload = {
-            'operationName': 'markTestSpinTaskClick',
-            'variables': {'taskId': normalized_task_id},
-            'query': (
-                'mutation markTestSpinTaskClick($taskId: ID!) { '
-                'markTestSpinTaskClick(taskId: $taskId) { success } }'
-            ),
-        }
-        result_key = 'markTestSpinTaskClick'
-    elif error_code == 'TEST_SPIN_PORTAL_CLICK_REQUIRED':
-        payload = {
-            'operationName': 'markTestSpinPortalClick',
-            'variables': {},
-            'query': 'mutation markTestSpinPortalClick { markTestSpinPortalClick { success } }',
-        }
-        result_key = 'markTestSpinPortalClick'
-    elif error_code == 'TEST_SPIN_TONNEL_CLICK_REQUIRED':
-        payload = {
-            'operationName': 'markTestSpinTonnelClick',
-            'variables': {},
-            'query': 'mutation markTestSpinTonnelClick { markTestSpinTonnelClick { success } }',
-        }
-        result_key = 'markTestSpinTonnelClick'
-    elif error_code == 'TEST_SPIN_TONPLAY_CLICK_REQUIRED':
-        payload = {
-            'operationName': 'markTestSpinTonplayClick',
-            'variables': {},
-            'query': 'mutation markTestSpinTonplayClick { markTestSpinTonplayClick { success } }',
-        }
-        result_key = 'markTestSpinTonplayClick'
+        payload = operation(taskId=normalized_task_id)
     else:
-        logger.error(f"Unsupported test spin click code: {error_code}")
-        return False
+        payload = operation()
 
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(graphql_url, headers=headers, json=payload) as response:
-                result = await response.json()
-                if response.status != 200:
-                    logger.error(f"{result_key} HTTP {response.status}: {result}")
-                    return False
-                if result.get('errors'):
-                    logger.error(f"{result_key} errors: {result['errors']}")
-                    return False
-                data = (result.get('data') or {}).get(result_key) or {}
-                success = bool(data.get('success'))
-                if success:
-                    logger.success(f"{result_key} succeeded")
-                else:
-                    logger.error(f"{result_key} returned success=false: {result}")
-                return success
+        async with graphql_call(payload, headers) as response:
+            result = await response.json()
+            if response.status != 200:
+                logger.error(f"{result_key} HTTP {response.status}: {result}")
+                return False
+            if result.get('errors'):
+                logger.error(f"{result_key} errors: {result['errors']}")
+                return False
+            data = (result.get('data') or {}).get(result_key) or {}
+            success = bool(data.get('success'))
+            if success:
+                logger.success(f"{result_key} succeeded")
+            else:
+                logger.error(f"{result_key} returned success=false: {result}")
+            return success
     except Exception as e:
         logger.error(f"{result_key} request failed: {e}")
         return False
 
 
+async def first_true(aws) -> bool:
+    """Run awaitables concurrently; True as soon as one returns truthy (the others are cancelled)."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            if await next_done:
+                return True
+        return False
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+MINI_APP_SHORT_NAMES = ("app", "start", "game", "webapp")
+
+
+class BotAppMemo:
+    """Working mini-app short name per partner bot, shared by all accounts.
+
+    A bot's short name never changes, so it is probed once and remembered for
+    BOT_APP_MEMO_TTL seconds; bots where no candidate opens are remembered as None
+    (straight to /start). Entries are persisted in the state store.
+    """
+
+    def __init__(self, ttl: float = BOT_APP_MEMO_TTL):
+        self.ttl = ttl
+        self._entries: Optional[Dict[str, tuple]] = None
+        self._probe_locks: Dict[str, asyncio.Lock] = {}
+
+    def probing(self, bot_username: str) -> asyncio.Lock:
+        """Held while one account probes a bot, so concurrent misses don't all probe."""
+        return self._probe_locks.setdefault(bot_username.lower(), asyncio.Lock())
+
+    def _load(self) -> Dict[str, tuple]:
+        if self._entries is None:
+            self._entries = state_store.load_bot_apps() if self.ttl > 0 else {}
+        return self._entries
+
+    def get(self, bot_username: str) -> tuple:
+        """(known, short_name): known is False when the bot must be probed."""
+        entry = self._load().get(bot_username.lower())
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return False, None
+        return True, entry[0]
+
+    def remember(self, bot_username: str, short_name: Optional[str]):
+        if self.ttl <= 0:
+            return
+        key = bot_username.lower()
+        entry = (short_name, time.time())
+        self._load()[key] = entry
+        state_store.record_bot_app(key, *entry)
+
+    def forget(self, bot_username: str):
+        key = bot_username.lower()
+        if self._load().pop(key, None) is not None:
+            state_store.record_bot_app(key, None, 0.0)
+
+
+bot_app_memo = BotAppMemo()
+
+
+@traced("open_deep_link")
 async def open_telegram_deep_link(account_data, click_link: str) -> bool:
     """Open any t.me mini-app / bot deep link via the logged-in Telegram client."""
+    from pyrogram.raw.functions.messages import RequestAppWebView
+    from pyrogram.raw.types import InputBotAppShortName, InputUser
+
     if not account_data or not account_data.client:
         return False
 
@@ -917,23 +2569,18 @@ async def open_telegram_deep_link(account_data, click_link: str) -> bool:
         return False
 
     try:
-        bot_entity = await account_data.client.get_users(bot_username)
-        bot = InputUser(user_id=bot_entity.id, access_hash=bot_entity.raw.access_hash)
-        bot_peer = await account_data.client.resolve_peer(bot_username)
+        # resolve_peer is served from the session's peer cache after the first lookup
+        bot_peer = await tg_call(account_data, "resolve_peer", bot_username)
+        bot = InputUser(user_id=bot_peer.user_id, access_hash=bot_peer.access_hash)
         account_data.interacted_bots.add(bot_username)
 
-        # Mini-app only for /bot/app or ?startapp= — never for plain ?start=
-        # (guessing short names can "succeed" and skip the partner /start track)
-        short_names_to_try = []
-        is_startapp = bool(re.search(r'[?&]startapp=', click_link, re.IGNORECASE))
-        if short_name:
-            short_names_to_try.append(short_name)
-        elif is_startapp and start_param:
-            short_names_to_try.extend(["app", "start", "game", "webapp"])
+        rejected = set()
 
-        for sn in short_names_to_try:
+        async def open_app(sn: str, remember: bool = False) -> bool:
             try:
-                web_view = await account_data.client.invoke(
+                web_view = await tg_call(
+                    account_data,
+                    "invoke",
                     RequestAppWebView(
                         peer=bot_peer,
                         app=InputBotAppShortName(bot_id=bot, short_name=sn),
@@ -942,15 +2589,57 @@ async def open_telegram_deep_link(account_data, click_link: str) -> bool:
                         write_allowed=True,
                     )
                 )
-                if web_view and getattr(web_view, "url", None):
-                    logger.info(f"Opened mini-app @{bot_username}/{sn} (start_param={start_param})")
-                    return True
             except Exception as e:
+                if "BOT_APP_INVALID" in str(e):
+                    rejected.add(sn)
                 logger.debug(f"RequestAppWebView @{bot_username}/{sn} failed: {e}")
+                return False
+            if web_view and getattr(web_view, "url", None):
+                logger.info(f"Opened mini-app @{bot_username}/{sn} (start_param={start_param})")
+                if remember:
+                    bot_app_memo.remember(bot_username, sn)
+                return True
+            return False
+
+        async def probe() -> bool:
+            metrics.inc("virusroulette_bot_app_memo_total", result="miss")
+            # Candidates are probed concurrently; the first that opens wins, the rest are cancelled.
+            # Other accounts wait on this probe, so a FLOOD_WAIT fails it instead of stalling them all.
+            if await best_effort_mtproto(first_true(open_app(sn, remember=True) for sn in MINI_APP_SHORT_NAMES)):
+                return True
+            if len(rejected) == len(MINI_APP_SHORT_NAMES):
+                # Only a definitive "no such app" for every candidate, not a network error
+                bot_app_memo.remember(bot_username, None)
+            return False
+
+        # Mini-app only for /bot/app or ?startapp= — never for plain ?start=
+        # (guessing short names can "succeed" and skip the partner /start track)
+        is_startapp = bool(re.search(r'[?&]startapp=', click_link, re.IGNORECASE))
+        if short_name:
+            if await open_app(short_name):
+                return True
+        elif is_startapp and start_param:
+            known, memo_name = bot_app_memo.get(bot_username)
+            if not known:
+                # One account probes a new bot; the others wait and reuse its result
+                async with bot_app_memo.probing(bot_username):
+                    known, memo_name = bot_app_memo.get(bot_username)
+                    if not known and await probe():
+                        return True
+            if known:
+                metrics.inc("virusroulette_bot_app_memo_total", result="hit" if memo_name else "negative")
+            if memo_name:
+                if await open_app(memo_name):
+                    return True
+                if rejected:
+                    # Remembered name stopped working: probe all candidates again
+                    metrics.inc("virusroulette_bot_app_memo_total", result="stale")
+                    bot_app_memo.forget(bot_username)
+                    return await open_telegram_deep_link(account_data, click_link)
 
         # Regular bot deep link / fallback: /start <param>
         start_command = f"/start {start_param}" if start_param else "/start"
-        await account_data.client.send_message(bot_username, start_command)
+        await tg_call(account_data, "send_message", bot_username, start_command)
         logger.info(f"Sent to @{bot_username}: {start_command}")
         return True
     except Exception as e:
@@ -958,6 +2647,7 @@ async def open_telegram_deep_link(account_data, click_link: str) -> bool:
         return False
 
 
+@traced("click_requirement")
 async def handle_test_spin_click_requirement(
     bearer_token: str,
     error_code: str,
@@ -966,7 +2656,11 @@ async def handle_test_spin_click_requirement(
     task_id=None,
     error_message: str = "",
 ) -> bool:
-    """Mirror website flow: mark click via GraphQL, then open the Telegram link."""
+    """Mirror website flow: mark click via GraphQL and open the Telegram link (concurrently).
+
+    No settle delay here: the caller's RequirementResolver re-issues the action until the
+    click has registered.
+    """
     click_link = (click_link or "").strip().strip("`").strip()
     resolved_code = infer_test_spin_click_code(click_link, error_message, error_code)
     logger.info(
@@ -974,17 +2668,21 @@ async def handle_test_spin_click_requirement(
         + (f" task_id={task_id}" if task_id is not None else "")
     )
 
-    marked = await mark_test_spin_click(bearer_token, resolved_code, task_id=task_id)
+    open_link = open_telegram_deep_link(account_data, click_link)
+    if not (resolved_code == 'TEST_SPIN_URL_CLICK_REQUIRED' and task_id is None):
+        # The mark alone counts the click here, so the open never waits out a FLOOD_WAIT
+        open_link = best_effort_mtproto(open_link)
+    marked, opened = await asyncio.gather(
+        mark_test_spin_click(bearer_token, resolved_code, task_id=task_id),
+        open_link,
+    )
     if not marked:
         # URL click with task_id must mark successfully (same as website)
         if resolved_code == 'TEST_SPIN_URL_CLICK_REQUIRED' and task_id is not None:
             return False
-
-    opened = await open_telegram_deep_link(account_data, click_link)
     if not opened:
         logger.warning("Mark/open: Telegram deep link open failed; continuing if mark succeeded")
 
-    await asyncio.sleep(2)
     # Website always opens the link after an optional mark; open alone is enough without task_id
     if resolved_code == 'TEST_SPIN_URL_CLICK_REQUIRED' and task_id is None:
         return bool(opened)
@@ -1032,87 +2730,88 @@ async def auto_visit_telegram_link(
 
 
 async def get_roulette_inventory(bearer_token, user_prize_id):
-    headers = {'accept': '*/*', 'authorization': bearer_token, 'content-type': 'application/json', 'origin': 'https://virusgift.pro', 'referer': 'https://virusgift.pro/roulette', 'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
+    headers = graphql_auth_headers(bearer_token)
     json_data = [
-        {'operationName': 'claimRoulettePrize', 'variables': {'input': {'userPrizeId': user_prize_id}}, 'query': 'mutation claimRoulettePrize($input: ClaimRoulettePrizeInput!) { claimRoulettePrize(input: $input) { success message telegramGift __typename } }'},
-        {'operationName': 'getRouletteInventory', 'variables': {'limit': 10, 'cursor': user_prize_id}, 'query': 'query getRouletteInventory($limit: Int64!, $cursor: Int64!) { getRouletteInventory(cursor: $cursor, limit: $limit) { success prizes { userRoulettePrizeId status prize { id name caption animationUrl photoUrl exchangeCurrency exchangePrice prizeExchangePrice isSpinSellable isClaimable isExchangeable storyLinkAfterWin __typename } claimCost unlockAt __typename } nextCursor hasNextPage __typename } }'}
+        CLAIM_ROULETTE_PRIZE(input={'userPrizeId': user_prize_id}),
+        GET_ROULETTE_INVENTORY(limit=10, cursor=user_prize_id),
     ]
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        try:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if isinstance(data, list) and len(data) > 0:
-                        claim_result = data[0]
-                        if 'data' in claim_result and 'claimRoulettePrize' in claim_result['data']:
-                            claim_data = claim_result['data']['claimRoulettePrize']
-                            if claim_data.get('success'):
-                                return {'success': True, 'message': 'Stars claimed successfully'}
-                        elif 'errors' in claim_result:
-                            return {'success': False, 'errors': claim_result['errors']}
-                    return data
-        except Exception:
-            pass
+    try:
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                data = await response.json()
+                if isinstance(data, list) and len(data) > 0:
+                    claim_result = data[0]
+                    if 'data' in claim_result and 'claimRoulettePrize' in claim_result['data']:
+                        claim_data = claim_result['data']['claimRoulettePrize']
+                        if claim_data.get('success'):
+                            return {'success': True, 'message': 'Stars claimed successfully'}
+                    elif 'errors' in claim_result:
+                        return {'success': False, 'errors': claim_result['errors']}
+                return data
+    except Exception:
+        pass
     return None
 
+@traced("spin")
 async def start_roulette_spin(bearer_token):
-    headers = {'accept': '*/*', 'authorization': bearer_token, 'content-type': 'application/json', 'origin': 'https://virusgift.pro', 'referer': 'https://virusgift.pro/roulette', 'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
-    json_data = {'operationName': 'startRouletteSpin', 'variables': {'input': {'type': 'X1'}}, 'query': 'mutation startRouletteSpin($input: StartRouletteSpinInput!) { startRouletteSpin(input: $input) { success prize { id name caption animationUrl photoUrl exchangeCurrency exchangePrice prizeExchangePrice isSpinSellable isClaimable isExchangeable storyLinkAfterWin __typename } userPrizeId balance isStoryRewardAvailable storyReward __typename } }'}
+    headers = graphql_auth_headers(bearer_token)
+    json_data = START_ROULETTE_SPIN(input={'type': 'X1'})
     
     max_retries = 3
     base_delay = 2
     
     for attempt in range(max_retries):
         try:
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                    if response.status == 200:
-                        result = await response.json()
+            async with graphql_call(json_data, headers) as response:
+                if response.status == 200:
+                    result = await response.json()
                         
-                        if 'errors' in result:
-                            for error in result['errors']:
-                                error_code = error.get('extensions', {}).get('code', 'UNKNOWN')
-                                error_message = error.get('message', 'Unknown error')
-                                logger.error(f"Roulette API error [{error_code}]: {error_message}")
-                                return result
+                    if 'errors' in result:
+                        for error in result['errors']:
+                            error_code = error.get('extensions', {}).get('code', 'UNKNOWN')
+                            error_message = error.get('message', 'Unknown error')
+                            logger.error(f"Roulette API error [{error_code}]: {error_message}")
+                            return result
                         
-                        if 'data' in result and result['data'] and 'startRouletteSpin' in result['data']:
-                            spin_data = result['data']['startRouletteSpin']
-                            if spin_data and spin_data.get('success', False):
-                                logger.debug("Roulette spin successful")
-                                return result
-                            else:
-                                logger.warning("Roulette spin not successful")
-                                return result
+                    if 'data' in result and result['data'] and 'startRouletteSpin' in result['data']:
+                        spin_data = result['data']['startRouletteSpin']
+                        if spin_data and spin_data.get('success', False):
+                            logger.debug("Roulette spin successful")
+                            return result
                         else:
-                            logger.warning("Invalid roulette response structure")
+                            logger.warning("Roulette spin not successful")
                             return result
-                            
-                    elif response.status == 502:
-                        if attempt < max_retries - 1:
-                            delay = base_delay * (2 ** attempt)
-                            logger.warning(f"Roulette 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
-                            await asyncio.sleep(delay)
-                            continue
                     else:
-                        response_text = await response.text()
-                        logger.error(f"Roulette API returned status {response.status}: {response_text}")
+                        logger.warning("Invalid roulette response structure")
+                        return result
+                            
+                elif response.status == 502:
+                    if attempt < max_retries - 1:
+                        delay = base_delay * (2 ** attempt)
+                        note_graphql_retry("startRouletteSpin")
+                        graphql_log.bind(sample="http_502").warning(f"Roulette 502 error, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                        await asyncio.sleep(delay)
+                        continue
+                else:
+                    response_text = await response.text()
+                    logger.error(f"Roulette API returned status {response.status}: {response_text}")
                     
-                    if response.status != 502:
-                        break
+                if response.status != 502:
+                    break
                         
         except asyncio.TimeoutError:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Roulette request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("startRouletteSpin")
+                graphql_log.warning(f"Roulette request timeout, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error("Roulette request timeout after all retries")
         except Exception as e:
             if attempt < max_retries - 1:
                 delay = base_delay * (2 ** attempt)
-                logger.warning(f"Roulette request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
+                note_graphql_retry("startRouletteSpin")
+                graphql_log.warning(f"Roulette request error: {e}, retrying in {delay}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Error in roulette spin request: {e}")
@@ -1122,137 +2821,277 @@ async def start_roulette_spin(bearer_token):
 
 
 async def get_free_cases(bearer_token):
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette/cases',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-    }
-    json_data = {
-        'operationName': 'cases',
-        'variables': {},
-        'query': (
-            'query cases { cases { success cases { id name type starsPrice animationUrl expiresAt '
-            'prizes { id animationUrl starsAmount } } } }'
-        ),
-    }
+    headers = graphql_auth_headers(bearer_token, referer='https://virusgift.pro/roulette/cases')
+    json_data = CASES()
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status != 200:
-                    return []
-                result = await response.json()
-                cases = (((result or {}).get('data') or {}).get('cases') or {}).get('cases') or []
-                return [c for c in cases if str(c.get('type', '')).upper() == 'FREE']
+        async with graphql_call(json_data, headers) as response:
+            if response.status != 200:
+                return []
+            result = await response.json()
+            cases = (((result or {}).get('data') or {}).get('cases') or {}).get('cases') or []
+            return [c for c in cases if str(c.get('type', '')).upper() == 'FREE']
     except Exception as e:
         logger.error(f"Failed to fetch cases: {e}")
         return []
 
 
+@traced("open_case")
 async def open_case(bearer_token, case_id, demo: bool = False):
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette/cases',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-    }
-    json_data = {
-        'operationName': 'openCase',
-        'variables': {'id': str(case_id), 'demo': bool(demo)},
-        'query': (
-            'mutation openCase($id: ID!, $demo: Boolean!) { openCase(id: $id, demo: $demo) { '
-            'success prize { id name caption animationUrl photoUrl exchangeCurrency exchangePrice '
-            'prizeExchangePrice isSpinSellable isClaimable isExchangeable } '
-            'userPrizeId casePrizeId demo } }'
-        ),
-    }
+    headers = graphql_auth_headers(bearer_token, referer='https://virusgift.pro/roulette/cases')
+    json_data = OPEN_CASE(id=str(case_id), demo=bool(demo))
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    return await response.json()
-                logger.error(f"openCase HTTP {response.status}: {await response.text()}")
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                return await response.json()
+            logger.error(f"openCase HTTP {response.status}: {await response.text()}")
     except Exception as e:
         logger.error(f"openCase request failed: {e}")
     return None
 
 
-async def resolve_action_errors(account_name: str, account_data: AccountData, result, retry_callable):
-    """Handle click / subscription errors and retry the GraphQL action."""
-    click_codes = {
-        'TEST_SPIN_URL_CLICK_REQUIRED',
-        'TEST_SPIN_PORTAL_CLICK_REQUIRED',
-        'TEST_SPIN_TONNEL_CLICK_REQUIRED',
-        'TEST_SPIN_TONPLAY_CLICK_REQUIRED',
-    }
+CLICK_REQUIREMENT_CODES = frozenset(TEST_SPIN_CLICK_OPERATIONS)
 
-    for _attempt in range(5):
-        if not result or 'errors' not in result:
-            return result, None
 
-        handled = False
-        for error in result['errors']:
-            error_code = error.get('extensions', {}).get('code', 'UNKNOWN')
-            error_message = error.get('message', 'Unknown error')
-            extensions = error.get('extensions', {}) or {}
-
-            if error_code == 'INSUFFICIENT_BALANCE':
-                return result, 'INSUFFICIENT_BALANCE'
-
-            if error_code in click_codes:
-                click_link = extensions.get('link')
-                task_id = extract_task_id(extensions)
-                if not click_link:
-                    logger.error(f"[{account_name}] {error_code} without link; extensions={extensions}")
-                    return result, error_code
-                click_link = click_link.strip().strip('`').strip()
-                logger.info(
-                    f"[{account_name}] Click required ({error_code}): {click_link}"
-                    + (f" task_id={task_id}" if task_id is not None else f" extensions={extensions}")
-                )
-                click_success = await handle_test_spin_click_requirement(
-                    account_data.bearer_token,
-                    error_code,
-                    click_link,
-                    account_data=account_data,
-                    task_id=task_id,
-                    error_message=error_message,
-                )
-                if not click_success:
-                    return result, error_code
-                await asyncio.sleep(3)
-                result = await retry_callable()
-                handled = True
-                break
+@dataclass
+class Requirement:
+    code: str
+    target: str
+    task_id: Optional[object] = None
+    message: str = ""
+    seen_at: float = 0.0
+
+
+class RequirementCache:
+    """Click / subscription requirements recently returned to any account.
+
+    The server tends to ask every account for the same partner clicks and channels at
+    the same time, so the other accounts satisfy them before their first spin attempt
+    instead of failing, fixing and retrying. An entry lives REQUIREMENT_CACHE_TTL seconds
+    after an account last hit it, and is dropped when pre-satisfying shows it is stale.
+    """
+
+    def __init__(self, ttl: float = REQUIREMENT_CACHE_TTL, limit: int = 8):
+        self.ttl = ttl
+        self.limit = limit
+        self._entries: Dict[tuple, Requirement] = {}
+
+    @staticmethod
+    def key(code: str, target) -> tuple:
+        if code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+            return code, str(normalize_channel_ref(target)).lower()
+        return code, target
+
+    def learn(self, code: str, target, task_id=None, message: str = ""):
+        if self.ttl <= 0 or not target:
+            return
+        key = self.key(code, target)
+        if key not in self._entries:
+            metrics.inc("virusroulette_requirements_total", code=code, result="learned")
+            logger.info(f"Learned requirement {code}: {target}")
+        self._entries[key] = Requirement(code, target, task_id, message, time.monotonic())
+        while len(self._entries) > self.limit:
+            oldest = min(self._entries, key=lambda k: self._entries[k].seen_at)
+            del self._entries[oldest]
+
+    def forget(self, requirement: Requirement):
+        self._entries.pop(self.key(requirement.code, requirement.target), None)
+
+    def active(self) -> list:
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, entry in self._entries.items() if entry.seen_at < cutoff]:
+            del self._entries[key]
+        return list(self._entries.values())
+
+
+requirement_cache = RequirementCache()
+
+
+def learn_requirement(error_code: str, extensions: dict, error_message: str = ""):
+    if error_code in CLICK_REQUIREMENT_CODES:
+        link = (extensions.get('link') or '').strip().strip('`').strip()
+        requirement_cache.learn(error_code, link, extract_task_id(extensions), error_message)
+    elif error_code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+        requirement_cache.learn(error_code, extensions.get('url') or extensions.get('username'))
+
+
+async def presatisfy_requirements(account_name: str, account_data: AccountData) -> int:
+    """Mark clicks / join channels other accounts were recently asked for; returns how many succeeded.
+
+    A requirement is dropped from the shared cache only when it is stale for everyone (an
+    expired invite, a deleted channel); throttling or other per-account failures only skip it
+    for this account.
+    """
+    requirements = requirement_cache.active()
+    if not requirements:
+        return 0
+
+    async def satisfy(requirement: Requirement) -> bool:
+        if requirement.code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+            return await subscribe_to_channel(requirement.target, account_data, raise_stale=True)
+        return await handle_test_spin_click_requirement(
+            account_data.bearer_token,
+            requirement.code,
+            requirement.target,
+            account_data=account_data,
+            task_id=requirement.task_id,
+            error_message=requirement.message,
+        )
+
+    logger.info(f"[{account_name}] Pre-satisfying {len(requirements)} known requirement(s)")
+    results = await asyncio.gather(*(satisfy(r) for r in requirements), return_exceptions=True)
+    satisfied = 0
+    for requirement, ok in zip(requirements, results):
+        if ok is True:
+            satisfied += 1
+            metrics.inc("virusroulette_requirements_total", code=requirement.code, result="presatisfied")
+        elif isinstance(ok, StaleRequirement):
+            metrics.inc("virusroulette_requirements_total", code=requirement.code, result="failed")
+            requirement_cache.forget(requirement)
+            logger.warning(f"[{account_name}] {requirement.code} ({requirement.target}) is stale ({ok}); dropped")
+        else:
+            metrics.inc("virusroulette_requirements_total", code=requirement.code, result="failed")
+            logger.warning(f"[{account_name}] Could not pre-satisfy {requirement.code} ({requirement.target}); skipped")
+    return satisfied
 
-            if error_code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
-                target = extensions.get('url') or extensions.get('username')
-                if not target:
-                    logger.error(f"[{account_name}] Subscription required but no channel provided")
-                    return result, error_code
-                ok = await subscribe_to_channel(target, account_data)
-                if not ok:
-                    return result, error_code
-                logger.success(f"[{account_name}] Successfully subscribed to {target}")
-                await asyncio.sleep(2)
-                result = await retry_callable()
-                handled = True
-                break
 
-            logger.error(f"[{account_name}] API error [{error_code}]: {error_message}")
+class RequirementResolver:
+    """Drive one GraphQL action (spin, openCase, claim, exchange) through its requirements.
 
-        if not handled:
-            return result, 'UNHANDLED'
+    ``ATTEMPT`` calls the action, ``CLASSIFY`` picks the first actionable error, ``SATISFY``
+    marks the click / joins the channel and ``SETTLE`` re-issues the action on a short backoff
+    until that requirement clears or REQUIREMENT_SETTLE_TIMEOUT passes. ``run`` returns
+    ``(result, stop_reason)``: ``None`` when no errors are left, ``INSUFFICIENT_BALANCE``,
+    the requirement code that could not be satisfied, ``UNHANDLED`` or ``RETRIES_EXHAUSTED``.
+    """
 
-    return result, 'RETRIES_EXHAUSTED'
+    ATTEMPT, CLASSIFY, SATISFY, SETTLE = "attempt", "classify", "satisfy", "settle"
+    SETTLE_FIRST_DELAY = 0.5
+    SETTLE_MAX_DELAY = 4.0
+
+    def __init__(self, action: str, account_name: str, account_data: AccountData, call, max_rounds: int = 5):
+        self.action = action
+        self.account_name = account_name
+        self.account_data = account_data
+        self.call = call
+        self.max_rounds = max_rounds
+        self.result = None
+
+    def classify(self):
+        """Return ``(stop_reason, requirement)``; the requirement is ``(code, message, extensions)``."""
+        result = self.result
+        if not result or 'errors' not in result:
+            return None, None
+        for error in result['errors']:
+            extensions = error.get('extensions') or {}
+            code = extensions.get('code', 'UNKNOWN')
+            message = error.get('message', 'Unknown error')
+            metrics.inc("virusroulette_action_errors_total", action=self.action, code=code)
+            if code == 'INSUFFICIENT_BALANCE':
+                return code, None
+            if code in CLICK_REQUIREMENT_CODES or code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+                return None, (code, message, extensions)
+            logger.error(f"[{self.account_name}] {self.action} API error [{code}]: {message}")
+            state_store.record_event(self.account_name, "error", code, {"message": message})
+        return 'UNHANDLED', None
+
+    def has_error(self, code: str) -> bool:
+        return any(
+            (error.get('extensions') or {}).get('code') == code
+            for error in (self.result or {}).get('errors') or ()
+        )
 
+    async def satisfy(self, code: str, message: str, extensions: dict) -> bool:
+        name = self.account_name
+        if code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+            target = extensions.get('url') or extensions.get('username')
+            if not target:
+                logger.error(f"[{name}] Subscription required but no channel provided")
+                return False
+            learn_requirement(code, extensions)
+            if not await subscribe_to_channel(target, self.account_data):
+                logger.error(f"[{name}] Failed to subscribe to {target}")
+                return False
+            logger.success(f"[{name}] Successfully subscribed to {target}")
+            return True
 
+        click_link = extensions.get('link')
+        task_id = extract_task_id(extensions)
+        if not click_link:
+            logger.error(f"[{name}] {code} without link; extensions={extensions}")
+            return False
+        learn_requirement(code, extensions, message)
+        click_link = click_link.strip().strip('`').strip()
+        logger.info(
+            f"[{name}] Click required ({code}): {click_link}"
+            + (f" task_id={task_id}" if task_id is not None else f" extensions={extensions}")
+        )
+        ok = await handle_test_spin_click_requirement(
+            self.account_data.bearer_token,
+            code,
+            click_link,
+            account_data=self.account_data,
+            task_id=task_id,
+            error_message=message,
+        )
+        if not ok:
+            logger.error(f"[{name}] Test spin click mark failed")
+        return ok
+
+    async def settle(self, code: str):
+        """Re-issue the action until ``code`` is gone or the settle deadline passes."""
+        deadline = time.monotonic() + REQUIREMENT_SETTLE_TIMEOUT
+        delay = self.SETTLE_FIRST_DELAY
+        while True:
+            self.result = await self.call()
+            if not self.has_error(code) or time.monotonic() + delay > deadline:
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.SETTLE_MAX_DELAY)
+
+    @traced("resolve_requirements")
+    async def run(self):
+        state = self.ATTEMPT
+        rounds = 0
+        requirement = None
+        started = 0.0
+        while True:
+            if state == self.ATTEMPT:
+                self.result = await self.call()
+                state = self.CLASSIFY
+            elif state == self.CLASSIFY:
+                if requirement is not None and not self.has_error(requirement[0]):
+                    metrics.inc("virusroulette_requirement_resolutions_total", action=self.action, code=requirement[0], result="resolved")
+                    metrics.observe(
+                        "virusroulette_requirement_resolve_seconds", time.monotonic() - started,
+                        action=self.action, code=requirement[0],
+                    )
+                stop_reason, next_requirement = self.classify()
+                if next_requirement is None:
+                    return self.result, stop_reason
+                if rounds >= self.max_rounds:
+                    metrics.inc("virusroulette_requirement_resolutions_total", action=self.action, code=next_requirement[0], result="exhausted")
+                    return self.result, 'RETRIES_EXHAUSTED'
+                if requirement is None or requirement[0] != next_requirement[0]:
+                    started = time.monotonic()
+                requirement = next_requirement
+                rounds += 1
+                state = self.SATISFY
+            elif state == self.SATISFY:
+                if not await self.satisfy(*requirement):
+                    metrics.inc("virusroulette_requirement_resolutions_total", action=self.action, code=requirement[0], result="failed")
+                    return self.result, requirement[0]
+                state = self.SETTLE
+            elif state == self.SETTLE:
+                await self.settle(requirement[0])
+                state = self.CLASSIFY
+
+
+async def resolve_action(action: str, account_name: str, account_data: AccountData, call):
+    """Run ``call`` and resolve its click / subscription requirements; see RequirementResolver."""
+    return await RequirementResolver(action, account_name, account_data, call).run()
+
+
+@traced("free_case", account_arg=0)
 async def process_account_free_case(account_name: str, account_data: AccountData) -> bool:
     """Open the daily FREE case when nextCaseFreeSpin allows it."""
     try:
@@ -1273,19 +3112,20 @@ async def process_account_free_case(account_name: str, account_data: AccountData
         case_name = case.get('name') or case_id
         logger.info(f"[{account_name}] Opening free case: {case_name} (id={case_id})")
 
-        result = await open_case(account_data.bearer_token, case_id, demo=False)
-        result, stop_reason = await resolve_action_errors(
+        result, stop_reason = await resolve_action(
+            "open_case",
             account_name,
             account_data,
-            result,
             lambda: open_case(account_data.bearer_token, case_id, demo=False),
         )
 
         open_data = ((result or {}).get('data') or {}).get('openCase') or {}
         if not open_data.get('success'):
             if stop_reason == 'INSUFFICIENT_BALANCE':
+                record_reward(account_name, "case", "not_ready")
                 logger.info(f"[{account_name}] Free case not available yet (balance/cooldown)")
             else:
+                record_reward(account_name, "case", "failure")
                 logger.error(f"[{account_name}] Free case failed ({stop_reason}): {(result or {}).get('errors')}")
             timers = await get_me_free_timers(account_data.bearer_token)
             if timers.get('next_case_free_spin') is not None:
@@ -1296,6 +3136,7 @@ async def process_account_free_case(account_name: str, account_data: AccountData
         prize_info = prize.get('name') or prize.get('caption') or 'Unknown prize'
         user_prize_id = open_data.get('userPrizeId')
         logger.success(f"[{account_name}] Free case opened: {prize_info}")
+        record_reward(account_name, "case", "success", prize=prize_info, user_prize_id=user_prize_id)
 
         timers = await get_me_free_timers(account_data.bearer_token)
         if timers.get('next_case_free_spin') is not None:
@@ -1326,12 +3167,18 @@ async def process_account_free_case(account_name: str, account_data: AccountData
         if isinstance(balance_result, dict):
             apply_balance_to_account(account_data, balance_result)
 
-        message = (
-            f"> @{account_data.username} opened free case\n"
-            f"🎁 Case: {case_name}\n"
-            f"⭐ Prize: {prize_info}{claim_note}\n"
-            f"💰 Stars Balance: {await format_number_with_spaces(stars_balance)}\n"
-            f"💰 Virus Balance: {await format_number_with_spaces(virus_balance)}"
+        message = md(
+            "\\> @{username} opened free case\n"
+            "🎁 Case: {case}\n"
+            "⭐ Prize: {prize}{note}\n"
+            "💰 Stars Balance: {stars}\n"
+            "💰 Virus Balance: {virus}",
+            username=account_data.username,
+            case=case_name,
+            prize=prize_info,
+            note=claim_note,
+            stars=await format_number_with_spaces(stars_balance),
+            virus=await format_number_with_spaces(virus_balance),
         )
         await send_notification(message)
 
@@ -1347,78 +3194,56 @@ async def process_account_free_case(account_name: str, account_data: AccountData
 
 
 async def get_inventory_prizes(bearer_token):
-    headers = {'accept': '*/*', 'authorization': bearer_token, 'content-type': 'application/json', 'origin': 'https://virusgift.pro', 'referer': 'https://virusgift.pro/roulette', 'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
-    json_data = {'operationName': 'getRouletteInventory', 'variables': {'limit': 50, 'cursor': 0}, 'query': 'query getRouletteInventory($limit: Int64!, $cursor: Int64!) { getRouletteInventory(cursor: $cursor, limit: $limit) { success prizes { userRoulettePrizeId status prize { id name caption animationUrl photoUrl exchangeCurrency exchangePrice prizeExchangePrice isSpinSellable isClaimable isExchangeable storyLinkAfterWin __typename } claimCost unlockAt __typename } nextCursor hasNextPage __typename } }'}
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        try:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    return await response.json()
-        except Exception:
-            pass
+    headers = graphql_auth_headers(bearer_token)
+    json_data = GET_ROULETTE_INVENTORY(limit=50, cursor=0)
+    try:
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                return await response.json()
+    except Exception:
+        pass
     return None
 
 async def claim_prize(bearer_token, user_prize_id):
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-    }
+    headers = graphql_auth_headers(bearer_token)
     uid = int(user_prize_id) if str(user_prize_id).isdigit() else user_prize_id
-    json_data = {
-        'operationName': 'claimRoulettePrize',
-        'variables': {'input': {'userPrizeId': uid}},
-        'query': (
-            'mutation claimRoulettePrize($input: ClaimRoulettePrizeInput!) { '
-            'claimRoulettePrize(input: $input) { success message telegramGift __typename } }'
-        ),
-    }
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        try:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    return await response.json()
-                logger.error(f"claimRoulettePrize HTTP {response.status}: {await response.text()}")
-        except Exception as e:
-            logger.error(f"claimRoulettePrize request failed: {e}")
+    json_data = CLAIM_ROULETTE_PRIZE(input={'userPrizeId': uid})
+    try:
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                return await response.json()
+            logger.error(f"claimRoulettePrize HTTP {response.status}: {await response.text()}")
+    except Exception as e:
+        logger.error(f"claimRoulettePrize request failed: {e}")
     return None
 
 
 async def exchange_prize_to_stars(bearer_token, user_prize_id, price=None):
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36',
-    }
+    headers = graphql_auth_headers(bearer_token)
     uid = int(user_prize_id) if str(user_prize_id).isdigit() else user_prize_id
     inp = {'userPrizeId': uid}
     if price is not None:
         inp['price'] = price
-    json_data = {
-        'operationName': 'exchangeRoulettePrizeToStarsBalance',
-        'variables': {'input': inp},
-        'query': (
-            'mutation exchangeRoulettePrizeToStarsBalance($input: ExchangeRoulettePrizeToStarsBalanceInput!) { '
-            'exchangeRoulettePrizeToStarsBalance(input: $input) { success } }'
-        ),
-    }
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30)) as session:
-        try:
-            async with session.post(graphql_url, headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    return await response.json()
-                logger.error(f"exchangeRoulettePrizeToStarsBalance HTTP {response.status}: {await response.text()}")
-        except Exception as e:
-            logger.error(f"exchangeRoulettePrizeToStarsBalance request failed: {e}")
+    json_data = EXCHANGE_PRIZE_TO_STARS(input=inp)
+    try:
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                return await response.json()
+            logger.error(f"exchangeRoulettePrizeToStarsBalance HTTP {response.status}: {await response.text()}")
+    except Exception as e:
+        logger.error(f"exchangeRoulettePrizeToStarsBalance request failed: {e}")
     return None
 
 
+def prize_currency_amount(prize: dict) -> int:
+    """Amount credited by a Virus/Stars prize: the number in its name, else its exchange price."""
+    prize = prize or {}
+    match = re.search(r"\d+", str(prize.get('name') or prize.get('caption') or ''))
+    if match:
+        return int(match.group())
+    return int(prize.get('prizeExchangePrice') or prize.get('exchangePrice') or 0)
+
+
 def prize_currency_kind(prize: dict) -> Optional[str]:
     """Return 'virus', 'stars', or None for non-currency (gift) prizes."""
     prize = prize or {}
@@ -1435,6 +3260,7 @@ def prize_currency_kind(prize: dict) -> Optional[str]:
     return None
 
 
+@traced("claim")
 async def collect_currency_prize(
     bearer_token,
     user_prize_id,
@@ -1456,14 +3282,20 @@ async def collect_currency_prize(
         async def do_claim():
             return await claim_prize(bearer_token, user_prize_id)
 
-        result = await do_claim()
         if account_data is not None:
-            result, _stop = await resolve_action_errors(label, account_data, result, do_claim)
+            result, _stop = await resolve_action("claim", label, account_data, do_claim)
+        else:
+            result = await do_claim()
 
         payload = ((result or {}).get('data') or {}).get('claimRoulettePrize') or {}
         if payload.get('success'):
             logger.success(f"[{label}] Prize claimed to balance (userPrizeId={user_prize_id})")
+            record_reward(
+                label, "claim", "success",
+                user_prize_id=user_prize_id, currency=kind, amount=prize_currency_amount(prize),
+            )
             return True
+        record_reward(label, "claim", "failure")
 
         errors = (result or {}).get('errors') or []
         if errors:
@@ -1484,13 +3316,15 @@ async def collect_currency_prize(
         async def do_exchange():
             return await exchange_prize_to_stars(bearer_token, user_prize_id, price=price)
 
-        result = await do_exchange()
         if account_data is not None:
-            result, _stop = await resolve_action_errors(label, account_data, result, do_exchange)
+            result, _stop = await resolve_action("exchange", label, account_data, do_exchange)
+        else:
+            result = await do_exchange()
 
         payload = ((result or {}).get('data') or {}).get('exchangeRoulettePrizeToStarsBalance') or {}
         if payload.get('success'):
             logger.success(f"[{label}] Prize exchanged to stars (userPrizeId={user_prize_id})")
+            record_reward(label, "exchange", "success", user_prize_id=user_prize_id, price=price)
             return True
 
         errors = (result or {}).get('errors') or []
@@ -1505,11 +3339,14 @@ async def collect_currency_prize(
                     payload = ((result or {}).get('data') or {}).get('exchangeRoulettePrizeToStarsBalance') or {}
                     if payload.get('success'):
                         logger.success(f"[{label}] Prize exchanged to stars after price update")
+                        record_reward(label, "exchange", "success", user_prize_id=user_prize_id, price=new_price)
                         return True
+        record_reward(label, "exchange", "failure")
 
     return False
 
 
+@traced("inventory_sweep")
 async def check_and_claim_rewards(bearer_token, account_data=None):
     """Claim all Virus/Stars currency prizes sitting in roulette inventory."""
     inventory_result = await get_inventory_prizes(bearer_token)
@@ -1544,7 +3381,7 @@ async def check_and_claim_rewards(bearer_token, account_data=None):
         if unlock_at:
             try:
                 unlock_dt = datetime.fromisoformat(str(unlock_at).replace('Z', '+00:00'))
-                if unlock_dt > datetime.now(timezone.utc):
+                if unlock_dt > server_clock.now():
                     logger.info(f"[{account_name}] Prize {prize_name} locked until {unlock_at}")
                     continue
             except (ValueError, TypeError):
@@ -1570,10 +3407,16 @@ async def check_and_claim_rewards(bearer_token, account_data=None):
 
     return rewards_found
 
+@traced("cleanup")
 async def cleanup_after_reward(account_data: AccountData):
     if not account_data or not account_data.client:
         return
 
+    # Whatever hits a FLOOD_WAIT stays tracked and is retried by the next cleanup
+    await best_effort_mtproto(_cleanup_after_reward(account_data))
+
+
+async def _cleanup_after_reward(account_data: AccountData):
     if account_data.subscribed_channels:
         logger.info(
             f"[{account_data.name}] Unsubscribing from {len(account_data.subscribed_channels)} channel(s) after spin..."
@@ -1584,14 +3427,17 @@ async def cleanup_after_reward(account_data: AccountData):
         logger.info(f"[{account_data.name}] Deleting {len(account_data.interacted_bots)} bot chats...")
         for bot_username in list(account_data.interacted_bots):
             try:
-                await account_data.client.delete_chat_history(bot_username, revoke=True)
+                await tg_call(account_data, "delete_chat_history", bot_username, revoke=True)
                 logger.success(f"Deleted chat history with bot: {bot_username}")
                 account_data.interacted_bots.discard(bot_username)
-                await asyncio.sleep(0.5)
             except Exception as e:
                 logger.warning(f"Failed to delete chat with {bot_username}: {e}")
 
+@traced("refresh_token")
 async def refresh_bearer_token(account_config, account_data=None):
+    from pyrogram.raw.functions.messages import RequestAppWebView
+    from pyrogram.raw.types import InputBotAppShortName, InputUser
+
     max_retries = 3
     
     if not account_data or not getattr(account_data, "client", None):
@@ -1605,11 +3451,11 @@ async def refresh_bearer_token(account_config, account_data=None):
     
     for attempt in range(max_retries):
         try:
-            bot_entity = await client.get_users('virus_play_bot')
+            bot_entity = await tg_call(account_data, "get_users", 'virus_play_bot')
             bot = InputUser(user_id=bot_entity.id, access_hash=bot_entity.raw.access_hash)
-            peer = await client.resolve_peer('virus_play_bot')
+            peer = await tg_call(account_data, "resolve_peer", 'virus_play_bot')
             bot_app = InputBotAppShortName(bot_id=bot, short_name="app")
-            web_view = await client.invoke(RequestAppWebView(peer=peer, app=bot_app, platform="android"))
+            web_view = await tg_call(account_data, "invoke", RequestAppWebView(peer=peer, app=bot_app, platform="android"))
             url_qs = urlparse(web_view.url)
             params = parse_qs(url_qs.query)
             fragment_params = parse_qs(url_qs.fragment)
@@ -1665,59 +3511,46 @@ async def handle_token_refresh_and_retry(bearer_token, func, *args, **kwargs):
     return bearer_token, result
 
 
+@traced("validate_token")
 async def validate_bearer_token(bearer_token, account_name="Unknown"):
-    headers = {
-        'accept': '*/*',
-        'authorization': bearer_token,
-        'content-type': 'application/json',
-        'origin': 'https://virusgift.pro',
-        'referer': 'https://virusgift.pro/roulette',
-        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-    }
-    
-    json_data = {
-        'operationName': 'me',
-        'variables': {},
-        'query': 'query me { me { starsBalance nextFreeSpin } }'
-    }
+    headers = graphql_auth_headers(bearer_token)
+    json_data = ME_VALIDATE()
     
     try:
-        timeout = aiohttp.ClientTimeout(total=30)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post('https://virusgift.pro/api/graphql/query', headers=headers, json=json_data) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    
-                    if 'errors' in result:
-                        for error in result.get('errors', []):
-                            if error.get('extensions', {}).get('code') == 'UNAUTHORIZED':
-                                logger.error(f"[{account_name}] Bearer token is INVALID - UNAUTHORIZED")
-                                return False
-                            else:
-                                logger.warning(f"[{account_name}] API error: {error}")
-                        return False
+        async with graphql_call(json_data, headers) as response:
+            if response.status == 200:
+                result = await response.json()
                     
-                    if 'data' in result and result['data'] and 'me' in result['data']:
-                        me_data = result['data']['me']
-                        if me_data is not None:
-                            balance = me_data.get('starsBalance', 'Unknown')
-                            next_spin = me_data.get('nextFreeSpin', 'Unknown')
-                            logger.debug(f"[{account_name}] Bearer token is VALID - Balance: {balance}, Next spin: {next_spin}")
-                            return True
-                        else:
-                            logger.error(f"[{account_name}] Bearer token is INVALID - null user data")
+                if 'errors' in result:
+                    for error in result.get('errors', []):
+                        if error.get('extensions', {}).get('code') == 'UNAUTHORIZED':
+                            logger.error(f"[{account_name}] Bearer token is INVALID - UNAUTHORIZED")
                             return False
+                        else:
+                            logger.warning(f"[{account_name}] API error: {error}")
+                    return False
+                    
+                if 'data' in result and result['data'] and 'me' in result['data']:
+                    me_data = result['data']['me']
+                    if me_data is not None:
+                        balance = me_data.get('starsBalance', 'Unknown')
+                        next_spin = me_data.get('nextFreeSpin', 'Unknown')
+                        logger.debug(f"[{account_name}] Bearer token is VALID - Balance: {balance}, Next spin: {next_spin}")
+                        return True
                     else:
-                        logger.error(f"[{account_name}] Bearer token is INVALID - no user data")
+                        logger.error(f"[{account_name}] Bearer token is INVALID - null user data")
                         return False
-                        
-                elif response.status == 401:
-                    logger.error(f"[{account_name}] Bearer token is INVALID - 401 Unauthorized")
-                    return False
                 else:
-                    response_text = await response.text()
-                    logger.error(f"[{account_name}] Token validation failed - Status {response.status}: {response_text}")
+                    logger.error(f"[{account_name}] Bearer token is INVALID - no user data")
                     return False
+                        
+            elif response.status == 401:
+                logger.error(f"[{account_name}] Bearer token is INVALID - 401 Unauthorized")
+                return False
+            else:
+                response_text = await response.text()
+                logger.error(f"[{account_name}] Token validation failed - Status {response.status}: {response_text}")
+                return False
                     
     except asyncio.TimeoutError:
         logger.error(f"[{account_name}] Token validation timeout")
@@ -1732,7 +3565,7 @@ async def validate_all_tokens_from_accounts(account_manager):
     invalid_tokens = []
     valid_tokens = []
     
-    for account_name, account_data in account_manager.accounts.items():
+    for account_name, account_data in list(account_manager.accounts.items()):
         if account_data.bearer_token:
             is_valid = await validate_bearer_token(account_data.bearer_token, account_name)
             if is_valid:
@@ -1761,7 +3594,7 @@ async def wait_for_next_spin(next_spin_time):
         target_time = datetime.fromisoformat(next_spin_time.replace('Z', '+00:00'))
         
         while True:
-            current_time = datetime.now(timezone.utc)
+            current_time = server_clock.now()
             
             if current_time >= target_time:
                 logger.info("Free spin time reached, waiting 1 second...")
@@ -1773,11 +3606,12 @@ async def wait_for_next_spin(next_spin_time):
             minutes = int((time_diff % 3600) // 60)
             seconds = int(time_diff % 60)
             
+            countdown_log = scheduler_log.bind(sample="spin_countdown")
             if time_diff > 60:
-                logger.info(f"Next free spin in {hours:02d}:{minutes:02d}:{seconds:02d}")
+                countdown_log.info(f"Next free spin in {hours:02d}:{minutes:02d}:{seconds:02d}")
                 await asyncio.sleep(30)
             else:
-                logger.info(f"Next free spin in {hours:02d}:{minutes:02d}:{seconds:02d}")
+                countdown_log.info(f"Next free spin in {hours:02d}:{minutes:02d}:{seconds:02d}")
                 await asyncio.sleep(min(time_diff, 10))
                 
     except Exception as e:
@@ -1785,78 +3619,163 @@ async def wait_for_next_spin(next_spin_time):
         return False
 
 
-async def get_main_menu_text(account_manager: AccountManager) -> str:
-    text = "*🦠 VIRUS ROULETTE SPINNER 🦠*\n\n"
+STATUS_PAGE_SIZE = max(1, int(os.getenv("STATUS_PAGE_SIZE", "25")))
 
-    if not account_manager.accounts:
-        text += escape_markdown_v2("No accounts loaded.")
-        return text
 
-    for account_name, account_data in account_manager.accounts.items():
-        balance = account_data.balance if account_data.balance else 0
-        formatted_balance = await format_number_with_spaces(balance)
-        username = account_data.username if account_data.username else account_name
+def format_status_countdown(next_time, now: datetime) -> str:
+    if not next_time or next_time in ("Unknown", "⏳ Unknown..."):
+        return "unknown"
+    try:
+        dt = datetime.fromisoformat(str(next_time).replace('Z', '+00:00'))
+    except (ValueError, TypeError):
+        return "unknown"
+    seconds = (dt - now).total_seconds()
+    if seconds <= 0:
+        return "Ready"
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
+
+
+def render_account_status_line(account_name: str, account_data: AccountData, now: datetime) -> MarkdownV2:
+    case_time = getattr(account_data, "next_case_free_spin", None)
+    case_display = "Ready" if is_free_reward_ready(case_time) else format_status_countdown(case_time, now)
+    return md(
+        "`@{user}` \\- ⭐️*{balance}* \\- 🕐 `{time}` \\- 🎁 `{case}`\n",
+        user=account_data.username or account_name,
+        balance=format_number(account_data.balance or 0),
+        time=format_status_countdown(account_data.next_roulette_time, now),
+        case=case_display,
+    )
 
-        next_time = account_data.next_roulette_time
-        if next_time and next_time != "Unknown" and next_time != "⏳ Unknown...":
-            try:
-                dt = datetime.fromisoformat(next_time.replace('Z', '+00:00'))
-                now = datetime.now(timezone.utc)
-                diff = dt - now
 
-                if diff.total_seconds() <= 0:
-                    time_display = "Ready"
-                else:
-                    hours = int(diff.total_seconds() // 3600)
-                    minutes = int((diff.total_seconds() % 3600) // 60)
+class StatusRenderCache:
+    """Per-account /start lines, rebuilt only when the account changes or the minute ticks."""
 
-                    if hours > 0:
-                        time_display = f"{hours}h {minutes}m"
-                    else:
-                        time_display = f"{minutes}m"
-            except (ValueError, TypeError):
-                time_display = "unknown"
+    def __init__(self):
+        self._lines: Dict[str, tuple] = {}
+
+    def line(self, account_name: str, account_data: AccountData, now: datetime) -> MarkdownV2:
+        key = (account_data.revision, int(now.timestamp() // 60))
+        cached = self._lines.get(account_name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        rendered = render_account_status_line(account_name, account_data, now)
+        self._lines[account_name] = (key, rendered)
+        return rendered
+
+    def invalidate(self, account_name: Optional[str] = None):
+        if account_name is None:
+            self._lines.clear()
         else:
-            time_display = "unknown"
+            self._lines.pop(account_name, None)
 
-        safe_user = str(username).replace("`", "")
-        safe_balance = escape_markdown_v2(str(formatted_balance))
-        safe_time = str(time_display).replace("`", "")
 
-        case_time = getattr(account_data, "next_case_free_spin", None)
-        if is_free_reward_ready(case_time):
-            case_display = "Ready"
-        elif case_time and case_time != "Unknown":
-            try:
-                dt = datetime.fromisoformat(str(case_time).replace('Z', '+00:00'))
-                diff = dt - datetime.now(timezone.utc)
-                if diff.total_seconds() <= 0:
-                    case_display = "Ready"
-                else:
-                    hours = int(diff.total_seconds() // 3600)
-                    minutes = int((diff.total_seconds() % 3600) // 60)
-                    case_display = f"{hours}h {minutes}m" if hours > 0 else f"{minutes}m"
-            except (ValueError, TypeError):
-                case_display = "unknown"
-        else:
-            case_display = "unknown"
-        safe_case = str(case_display).replace("`", "")
+status_render_cache = StatusRenderCache()
 
-        text += (
-            f"`@{safe_user}` \\- ⭐️*{safe_balance}* \\- 🕐 `{safe_time}` "
-            f"\\- 🎁 `{safe_case}`\n"
-        )
 
+def status_page_count(account_manager: AccountManager) -> int:
+    return max(1, -(-len(account_manager.accounts) // STATUS_PAGE_SIZE))
+
+
+async def get_main_menu_text(account_manager: AccountManager, page: int = 0) -> str:
+    text = "*🦠 VIRUS ROULETTE SPINNER 🦠*\n\n"
+
+    if not account_manager.accounts:
+        text += escape_markdown_v2("No accounts loaded.")
+        return text
+
+    pages = status_page_count(account_manager)
+    page = min(max(page, 0), pages - 1)
+    names = list(account_manager.accounts)[page * STATUS_PAGE_SIZE:(page + 1) * STATUS_PAGE_SIZE]
+    now = server_clock.now()
+    for account_name in names:
+        account_data = account_manager.accounts.get(account_name)
+        if account_data is not None:
+            text += status_render_cache.line(account_name, account_data, now)
+
+    if pages > 1:
+        text += md("\n_Page {page}/{pages} · {total} accounts_", page=page + 1, pages=pages, total=len(account_manager.accounts))
 
     return text
 
-async def get_main_menu_keyboard() -> InlineKeyboardMarkup:
+async def get_main_menu_keyboard(page: int = 0, pages: int = 1) -> "InlineKeyboardMarkup":
+    from aiogram.utils.keyboard import InlineKeyboardBuilder
 
     builder = InlineKeyboardBuilder()
+    if pages > 1:
+        builder.button(text="◀️", callback_data=f"status:page:{(page - 1) % pages}")
+        builder.button(text=f"{page + 1}/{pages}", callback_data=f"status:page:{page}")
+        builder.button(text="▶️", callback_data=f"status:page:{(page + 1) % pages}")
+    builder.button(text="🔄 Refresh", callback_data=f"status:refresh:{page}")
+    builder.adjust(3 if pages > 1 else 1, 1)
     return builder.as_markup()
 
 
+_status_refresh_task: Optional[asyncio.Task] = None
+# /start re-renders running in the background; held here until done (the loop keeps weak refs)
+_status_message_refreshes: set = set()
+
+
+def _status_message_refresh_done(task: asyncio.Task):
+    _status_message_refreshes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Status message refresh failed: {task.exception()}")
+
+
+async def refresh_all_account_status():
+    """Refresh balances/timers for every authenticated account, sharing one in-flight run."""
+    global _status_refresh_task
+    if _status_refresh_task is None or _status_refresh_task.done():
+        if shard_supervisor is not None:
+            _status_refresh_task = asyncio.ensure_future(shard_supervisor.broadcast("refresh"))
+            await asyncio.shield(_status_refresh_task)
+            return
+        update_tasks = [
+            update_single_account_status(account_name, account_data)
+            for account_name, account_data in list(account_manager.accounts.items())
+            if account_data.bearer_token
+        ]
+        _status_refresh_task = asyncio.ensure_future(asyncio.gather(*update_tasks, return_exceptions=True))
+    await asyncio.shield(_status_refresh_task)
+
+
+async def show_status_page(message: "types.Message", page: int = 0, edit: bool = False):
+    pages = status_page_count(account_manager)
+    page = min(max(page, 0), pages - 1)
+    text = await get_main_menu_text(account_manager, page)
+    keyboard = await get_main_menu_keyboard(page, pages)
+    try:
+        if edit:
+            await message.edit_text(text, reply_markup=keyboard, parse_mode="MarkdownV2")
+            return message
+        return await message.answer(text, reply_markup=keyboard, parse_mode="MarkdownV2")
+    except Exception as parse_error:
+        if "message is not modified" in str(parse_error):
+            return message
+        logger.warning(f"MarkdownV2 send failed, fallback to plain text: {parse_error}")
+        plain = markdown_v2_to_plain(text)
+        if edit:
+            await message.edit_text(plain, reply_markup=keyboard)
+            return message
+        return await message.answer(plain, reply_markup=keyboard)
+
+
+async def refresh_status_message(message: "types.Message", page: int = 0):
+    """Re-render an already sent status page once fresh balances/timers arrive."""
+    try:
+        before = {name: acc.revision for name, acc in account_manager.accounts.items()}
+        await refresh_all_account_status()
+        after = {name: acc.revision for name, acc in account_manager.accounts.items()}
+        if before != after:
+            await show_status_page(message, page, edit=True)
+    except Exception as e:
+        logger.error(f"Status refresh failed: {e}")
+
+
 async def setup_bot_handlers():
+    from aiogram import F, types
+    from aiogram.filters import Command
 
     @dp.message(Command("start"))
     async def start_command(message: types.Message):
@@ -1870,22 +3789,12 @@ async def setup_bot_handlers():
             first_name = message.from_user.first_name or "No Name"
             logger.success(f"Sent welcome message to user {user_id} | @{username} | {first_name}")
 
-            update_tasks = []
-            for account_name, account_data in account_manager.accounts.items():
-                if account_data.bearer_token:
-                    update_tasks.append(update_single_account_status(account_name, account_data))
-
-            if update_tasks:
-                await asyncio.gather(*update_tasks, return_exceptions=True)
-
-            text = await get_main_menu_text(account_manager)
-            keyboard = await get_main_menu_keyboard()
-            try:
-                await message.answer(text, reply_markup=keyboard, parse_mode="MarkdownV2")
-            except Exception as parse_error:
-                logger.warning(f"MarkdownV2 send failed, fallback to plain text: {parse_error}")
-                plain = re.sub(r"[\\*_`]", "", text)
-                await message.answer(plain, reply_markup=keyboard)
+            # Answer from cached state right away, then edit in fresh numbers
+            sent = await show_status_page(message, 0)
+            if sent is not None:
+                task = asyncio.create_task(refresh_status_message(sent, 0))
+                _status_message_refreshes.add(task)
+                task.add_done_callback(_status_message_refresh_done)
         except Exception as e:
             logger.error(f"/start handler error: {e}")
             try:
@@ -1893,6 +3802,40 @@ async def setup_bot_handlers():
             except Exception:
                 pass
 
+    @dp.message(Command("reload"))
+    async def reload_command(message: types.Message):
+        if message.from_user.id != admin_id:
+            await message.answer("Access denied")
+            return
+        try:
+            summary = await reload_account_configs()
+            await message.answer(format_reload_summary(summary), parse_mode="MarkdownV2")
+        except Exception as e:
+            logger.error(f"/reload handler error: {e}")
+            await message.answer("Account reload failed. Check logs.")
+
+    @dp.callback_query(F.data.startswith("status:"))
+    async def status_callback(callback: types.CallbackQuery):
+        if callback.from_user.id != admin_id:
+            await callback.answer("Access denied")
+            return
+        try:
+            _prefix, action, raw_page = callback.data.split(":", 2)
+            page = int(raw_page)
+        except ValueError:
+            await callback.answer()
+            return
+        try:
+            if action == "refresh":
+                await callback.answer("Refreshing…")
+                await refresh_all_account_status()
+            else:
+                await callback.answer()
+            if callback.message is not None:
+                await show_status_page(callback.message, page, edit=True)
+        except Exception as e:
+            logger.error(f"Status page callback error: {e}")
+
 async def update_single_account_status(account_name, account_data):
     try:
         balance_data = await get_account_balance(account_data.bearer_token)
@@ -1910,7 +3853,7 @@ async def update_single_account_status(account_name, account_data):
 account_manager = AccountManager()
 
 async def update_all_accounts_status():
-    for account_name, account_data in account_manager.accounts.items():
+    for account_name, account_data in list(account_manager.accounts.items()):
         if account_data.bearer_token:
             try:
                 balance_data = await get_account_balance(account_data.bearer_token)
@@ -1924,6 +3867,7 @@ async def update_all_accounts_status():
             except Exception as e:
                 logger.error(f"Failed to update {account_name}: {e}")
 
+@traced("roulette_run", account_arg=0)
 async def process_account_roulette(account_name: str, account_data: AccountData):
     try:
         logger.info(f"[{account_name}] Starting roulette spin...")
@@ -1946,90 +3890,27 @@ async def process_account_roulette(account_name: str, account_data: AccountData)
                 await process_account_free_case(account_name, account_data)
             except Exception as e:
                 logger.error(f"[{account_name}] Free case during roulette run failed: {e}")
-        
-        result = await start_roulette_spin(account_data.bearer_token)
-
-        click_codes = {
-            'TEST_SPIN_URL_CLICK_REQUIRED',
-            'TEST_SPIN_PORTAL_CLICK_REQUIRED',
-            'TEST_SPIN_TONNEL_CLICK_REQUIRED',
-            'TEST_SPIN_TONPLAY_CLICK_REQUIRED',
-        }
-
-        for _attempt in range(5):
-            if not result or 'errors' not in result:
-                break
 
-            handled = False
-            for error in result['errors']:
-                error_code = error.get('extensions', {}).get('code', 'UNKNOWN')
-                error_message = error.get('message', 'Unknown error')
-                extensions = error.get('extensions', {}) or {}
-
-                if error_code == 'INSUFFICIENT_BALANCE':
-                    logger.error(f"[{account_name}] Roulette spin failed - insufficient balance")
-                    next_time = await get_next_free_spin_time(account_data.bearer_token)
-                    if next_time:
-                        account_data.next_roulette_time = next_time
-                        logger.info(f"[{account_name}] Updated next roulette time to: {next_time}")
-                    else:
-                        from datetime import timedelta
-                        next_time = (datetime.now(timezone.utc) + timedelta(hours=24)).isoformat().replace('+00:00', 'Z')
-                        account_data.next_roulette_time = next_time
-                        logger.info(f"[{account_name}] Set next roulette time to 24h from now: {next_time}")
-                    return False
-
-                if error_code in click_codes:
-                    click_link = extensions.get('link')
-                    task_id = extract_task_id(extensions)
-                    if not click_link:
-                        logger.error(f"[{account_name}] {error_code} without link; extensions={extensions}")
-                        return False
-                    click_link = click_link.strip().strip('`').strip()
-                    logger.info(
-                        f"[{account_name}] Click required ({error_code}): {click_link}"
-                        + (f" task_id={task_id}" if task_id is not None else f" extensions={extensions}")
-                    )
-                    click_success = await handle_test_spin_click_requirement(
-                        account_data.bearer_token,
-                        error_code,
-                        click_link,
-                        account_data=account_data,
-                        task_id=task_id,
-                        error_message=error_message,
-                    )
-                    if not click_success:
-                        logger.error(f"[{account_name}] Test spin click mark failed")
-                        return False
-                    logger.info(f"[{account_name}] Waiting 3 seconds after click mark...")
-                    await asyncio.sleep(3)
-                    result = await start_roulette_spin(account_data.bearer_token)
-                    handled = True
-                    break
-
-                if error_code == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
-                    username = extensions.get('username')
-                    url = extensions.get('url')
-                    target = url or username
-                    if not target:
-                        logger.error(f"[{account_name}] Subscription required but no channel provided")
-                        return False
-                    subscription_success = await subscribe_to_channel(target, account_data)
-                    if not subscription_success:
-                        logger.error(f"[{account_name}] Failed to subscribe to {target}")
-                        return False
-                    logger.success(f"[{account_name}] Successfully subscribed to {target}")
-                    await asyncio.sleep(2)
-                    result = await start_roulette_spin(account_data.bearer_token)
-                    handled = True
-                    break
+        await presatisfy_requirements(account_name, account_data)
+        result, stop_reason = await resolve_action(
+            "spin", account_name, account_data, lambda: start_roulette_spin(account_data.bearer_token)
+        )
 
-                if error_code != 'TELEGRAM_SUBSCRIPTION_REQUIRED':
-                    logger.error(f"Roulette API error [{error_code}]: {error_message}")
+        if stop_reason == 'INSUFFICIENT_BALANCE':
+            logger.error(f"[{account_name}] Roulette spin failed - insufficient balance")
+            record_reward(account_name, "spin", "not_ready")
+            next_time = await get_next_free_spin_time(account_data.bearer_token)
+            if next_time:
+                account_data.next_roulette_time = next_time
+                logger.info(f"[{account_name}] Updated next roulette time to: {next_time}")
+            else:
+                next_time = (server_clock.now() + timedelta(hours=24)).isoformat().replace('+00:00', 'Z')
+                account_data.next_roulette_time = next_time
+                logger.info(f"[{account_name}] Set next roulette time to 24h from now: {next_time}")
+            return False
+        if stop_reason in CLICK_REQUIREMENT_CODES or stop_reason == 'TELEGRAM_SUBSCRIPTION_REQUIRED':
+            return False
 
-            if not handled:
-                break
-        
         if result is None:
             config = ACCOUNT_CONFIGS[account_name]
             new_bearer_token = await refresh_bearer_token(config, account_data)
@@ -2043,6 +3924,7 @@ async def process_account_roulette(account_name: str, account_data: AccountData)
             spin_data = result['data']['startRouletteSpin']
             if spin_data and spin_data.get('success', False):
                 logger.success(f"[{account_name}] Roulette spin completed successfully")
+                record_reward(account_name, "spin", "success", user_prize_id=spin_data.get('userPrizeId'))
 
                 # Lock next free-spin time immediately so a post-spin crash
                 # cannot make the worker pay for another spin.
@@ -2089,63 +3971,46 @@ async def process_account_roulette(account_name: str, account_data: AccountData)
                             stars_balance = balance_result.get('stars_balance', 'Unknown') if isinstance(balance_result, dict) else 'Unknown'
                             formatted_virus_balance = await format_number_with_spaces(virus_balance)
                             formatted_stars_balance = await format_number_with_spaces(stars_balance)
-                            success_message = (
-                                f"> @{account_data.username} successfully spun and claimed the roulette\n"
-                                f"⭐ Prize: {prize_info}\n"
-                                f"💰 Stars Balance: {formatted_stars_balance}\n"
-                                f"💰 Virus Balance: {formatted_virus_balance}"
+                            success_message = md(
+                                "\\> @{username} successfully spun and claimed the roulette\n"
+                                "⭐ Prize: {prize}\n"
+                                "💰 Stars Balance: {stars}\n"
+                                "💰 Virus Balance: {virus}",
+                                username=account_data.username,
+                                prize=prize_info,
+                                stars=formatted_stars_balance,
+                                virus=formatted_virus_balance,
                             )
                             logger.success(
                                 f"[{account_name}] Prize claimed: {prize_info} | Stars: {stars_balance} | Virus: {virus_balance}"
                             )
                         else:
-                            success_message = (
-                                f"> @{account_data.username} successfully spun the roulette\n"
-                                f"⭐ Prize: {prize_info} (failed to claim)\n"
-                                f"💰 Stars Balance: {formatted_stars_balance}\n"
-                                f"💰 Virus Balance: {formatted_virus_balance}"
+                            success_message = md(
+                                "\\> @{username} successfully spun the roulette\n"
+                                "⭐ Prize: {prize} \\(failed to claim\\)\n"
+                                "💰 Stars Balance: {stars}\n"
+                                "💰 Virus Balance: {virus}",
+                                username=account_data.username,
+                                prize=prize_info,
+                                stars=formatted_stars_balance,
+                                virus=formatted_virus_balance,
                             )
                     else:
-                        success_message = (
-                            f"> @{account_data.username} received a prize\n"
-                            f"🎁 Prize: {prize_info}\n"
-                            f"💰 Stars Balance: {formatted_stars_balance}\n"
-                            f"💰 Virus Balance: {formatted_virus_balance}"
+                        success_message = md(
+                            "\\> @{username} received a prize\n"
+                            "🎁 Prize: {prize}\n"
+                            "💰 Stars Balance: {stars}\n"
+                            "💰 Virus Balance: {virus}",
+                            username=account_data.username,
+                            prize=prize_info,
+                            stars=formatted_stars_balance,
+                            virus=formatted_virus_balance,
                         )
 
-                    # Story bonus: site opens share UI then calls this mutation (~5s later).
+                    # Story bonus: claimed in the background so the spin turnaround doesn't wait on it.
                     # Backend does not require an actual Telegram story post.
                     if user_prize_id and spin_data.get("isStoryRewardAvailable"):
-                        story_amount = spin_data.get("storyReward") or 0
-                        logger.info(
-                            f"[{account_name}] Story reward available ({story_amount}) — claiming via checkStoryPostRoulettePrizeWin"
-                        )
-                        await asyncio.sleep(2)
-                        story_ok = await check_story_post_roulette_prize_win(
-                            account_data.bearer_token, user_prize_id
-                        )
-                        if not story_ok:
-                            await asyncio.sleep(4)
-                            story_ok = await check_story_post_roulette_prize_win(
-                                account_data.bearer_token, user_prize_id
-                            )
-                        if story_ok:
-                            story_reward_text = f"{story_amount} Stars"
-                            account_data.last_story_reward = story_reward_text
-                            logger.success(
-                                f"[{account_name}] Story reward claimed (userPrizeId={user_prize_id}, amount={story_amount})"
-                            )
-                            balance_result = await get_account_balance(account_data.bearer_token)
-                            if isinstance(balance_result, dict):
-                                apply_balance_to_account(account_data, balance_result)
-                            await check_and_claim_rewards(account_data.bearer_token, account_data)
-                            username = f"@{account_data.username}" if account_data.username else account_name
-                            await send_notification(
-                                f"🎬 Story reward claimed\n\n"
-                                f"User {username} claimed a story reward and received {story_reward_text}."
-                            )
-                        else:
-                            logger.warning(f"[{account_name}] Story reward claim failed")
+                        story_rewards.put(account_name, account_data, user_prize_id, spin_data.get("storyReward") or 0)
 
                     # Collect any leftover Virus/Stars from inventory
                     await check_and_claim_rewards(account_data.bearer_token, account_data)
@@ -2169,8 +4034,10 @@ async def process_account_roulette(account_name: str, account_data: AccountData)
                 return True
             else:
                 logger.warning(f"[{account_name}] Roulette spin failed or not ready yet")
+                record_reward(account_name, "spin", "failure")
                 return False
         else:
+            record_reward(account_name, "spin", "failure")
             if result and 'errors' in result:
                 logger.error(f"[{account_name}] Roulette spin failed with errors: {result['errors']}")
             else:
@@ -2181,38 +4048,318 @@ async def process_account_roulette(account_name: str, account_data: AccountData)
         logger.error(f"[{account_name}] Error in roulette process: {e}")
         return False
 
+NOTIFY_BATCH_WINDOW = float(os.getenv("NOTIFY_BATCH_WINDOW", "3"))
+NOTIFY_MIN_INTERVAL = float(os.getenv("NOTIFY_MIN_INTERVAL", "1.1"))
+NOTIFY_MAX_ATTEMPTS = 5
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class NotificationQueue:
+    """Background admin notifications: batches events into digests and respects Bot API limits."""
+
+    def __init__(self, batch_window: float = NOTIFY_BATCH_WINDOW, min_interval: float = NOTIFY_MIN_INTERVAL):
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self._last_sent = 0.0
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def put(self, message: str):
+        self.queue.put_nowait(message)
+
+    async def stop(self, timeout: float = 15):
+        """Flush everything still queued, then stop the worker."""
+        if self.task is None:
+            return
+        self.queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self.task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notification queue drain timed out; {self.queue.qsize()} message(s) dropped")
+            self.task.cancel()
+        self.task = None
+
+    async def _collect_batch(self):
+        """Wait for the first message, then gather whatever arrives within the batch window."""
+        first = await self.queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _build_digests(self, batch) -> list:
+        """Pack messages into as few Telegram messages as the 4096-char limit allows.
+
+        Each digest is the list of its entries, so a rejected digest can be resent entry by entry.
+        """
+        digests = []
+        current: list = []
+        size = 0
+        for message in batch:
+            text = truncate_markdown_v2(message, TELEGRAM_MESSAGE_LIMIT)
+            if current and size + 2 + len(text) > TELEGRAM_MESSAGE_LIMIT:
+                digests.append(current)
+                current, size = [], 0
+            size += (2 if current else 0) + len(text)
+            current.append(text)
+        if current:
+            digests.append(current)
+        return digests
+
+    async def _deliver(self, text: str, parse_mode: Optional[str] = "MarkdownV2") -> bool:
+        """Send one message, retrying only rate limits and network / server errors.
+
+        TelegramBadRequest (e.g. a MarkdownV2 parse error) never succeeds on retry and is raised.
+        """
+        from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(NOTIFY_MAX_ATTEMPTS):
+            wait = self._last_sent + self.min_interval - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await bot_instance.send_message(admin_id, text, parse_mode=parse_mode)
+                self._last_sent = loop.time()
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Bot API rate limit, retrying notification in {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                delay = 2 ** attempt
+                logger.error(f"Failed to send notification: {e} (attempt {attempt + 1}/{NOTIFY_MAX_ATTEMPTS})")
+                await asyncio.sleep(delay)
+            except TelegramBadRequest:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to send notification: {e}")
+                return False
+        return False
+
+    async def _send_digest(self, entries: list):
+        """Send a digest; if Telegram rejects it, send its entries one by one, plain text as the last resort."""
+        from aiogram.exceptions import TelegramBadRequest
+
+        try:
+            if not await self._deliver("\n\n".join(entries)):
+                logger.error(f"Notification digest lost ({len(entries)} event(s)): {entries[0][:50]}...")
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f"Notification rejected ({e}); resending {len(entries)} event(s) one by one")
+        for entry in entries:
+            delivered = None
+            if len(entries) > 1:
+                try:
+                    delivered = await self._deliver(entry)
+                except TelegramBadRequest as e:
+                    logger.warning(f"Notification rejected ({e}); sending it as plain text")
+            if delivered is None:
+                try:
+                    delivered = await self._deliver(markdown_v2_to_plain(entry), parse_mode=None)
+                except TelegramBadRequest as e:
+                    logger.error(f"Notification rejected as plain text too: {e}")
+                    delivered = False
+            if not delivered:
+                logger.error(f"Notification lost: {entry[:50]}...")
+
+    async def _run(self):
+        while True:
+            stop = False
+            try:
+                batch, stop = await self._collect_batch()
+                if batch:
+                    if len(batch) > 1:
+                        logger.info(f"Sending notification digest with {len(batch)} event(s)")
+                    for digest in self._build_digests(batch):
+                        if bot_instance is None:
+                            logger.error(f"Notification lost: {digest[0][:50]}...")
+                        else:
+                            await self._send_digest(digest)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in notification queue: {e}")
+            if stop:
+                return
+
+
+notification_queue = NotificationQueue()
+
+
+STORY_CLAIM_DELAY = 2.0
+STORY_CONCURRENCY = int(os.getenv("STORY_CONCURRENCY", "4"))
+STORY_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class StoryJob:
+    account_name: str
+    account_data: AccountData
+    user_prize_id: object
+    amount: int
+    attempt: int = 0
+
+
+class StoryRewardPipeline:
+    """Background story-bonus claims fed by spin results.
+
+    The site calls checkStoryPostRoulettePrizeWin a few seconds after the spin, so each
+    job becomes due STORY_CLAIM_DELAY seconds later; up to STORY_CONCURRENCY claims run at
+    once and a failed claim is retried after 4, then 8 seconds. Workers start on first use,
+    in a fresh context so they do not inherit the spin's trace span or log binding.
+    """
+
+    def __init__(self, concurrency: int = STORY_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.tasks: list = []
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._outstanding = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self):
+        self.tasks = [task for task in self.tasks if not task.done()]
+        while len(self.tasks) < self.concurrency:
+            self.tasks.append(asyncio.create_task(self._run(), context=Context()))
+
+    def put(self, account_name: str, account_data: AccountData, user_prize_id, amount: int):
+        logger.info(f"[{account_name}] Story reward available ({amount}) — queued for checkStoryPostRoulettePrizeWin")
+        self.start()
+        self._outstanding += 1
+        self._idle.clear()
+        self._schedule(StoryJob(account_name, account_data, user_prize_id, amount), STORY_CLAIM_DELAY)
+
+    def _schedule(self, job: StoryJob, delay: float):
+        self._timers[id(job)] = asyncio.get_running_loop().call_later(delay, self._due, job)
+
+    def _due(self, job: StoryJob):
+        self._timers.pop(id(job), None)
+        self.queue.put_nowait(job)
+
+    def _done(self):
+        self._outstanding -= 1
+        if self._outstanding <= 0:
+            self._outstanding = 0
+            self._idle.set()
+
+    async def join(self):
+        """Wait until every queued claim (including retries) has finished."""
+        await self._idle.wait()
+
+    async def stop(self, timeout: float = 30):
+        """Let pending claims finish (up to ``timeout``), then drop the rest and stop the workers."""
+        if self._outstanding and timeout > 0:
+            try:
+                await asyncio.wait_for(self.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self._outstanding:
+            logger.warning(f"Story reward pipeline stopped with {self._outstanding} claim(s) pending")
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self._outstanding = 0
+        self._idle.set()
+
+    async def _run(self):
+        while True:
+            job = await self.queue.get()
+            rescheduled = False
+            try:
+                with logger.contextualize(account=job.account_name):
+                    rescheduled = await self._claim(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{job.account_name}] Story reward pipeline error: {e}")
+            finally:
+                # The one place a job is marked done; a retry stays outstanding
+                if not rescheduled:
+                    self._done()
+
+    async def _claim(self, job: StoryJob) -> bool:
+        """Claim one story reward; True if it was rescheduled for another attempt."""
+        account_data = job.account_data
+        ok = await check_story_post_roulette_prize_win(account_data.bearer_token, job.user_prize_id)
+        if not ok and job.attempt + 1 < STORY_MAX_ATTEMPTS:
+            job.attempt += 1
+            self._schedule(job, STORY_CLAIM_DELAY * 2 ** job.attempt)
+            return True
+
+        record_reward(
+            job.account_name, "story", "success" if ok else "failure",
+            user_prize_id=job.user_prize_id, amount=job.amount,
+        )
+        if not ok:
+            logger.warning(f"[{job.account_name}] Story reward claim failed after {STORY_MAX_ATTEMPTS} attempts")
+            return False
+
+        story_reward_text = f"{job.amount} Stars"
+        account_data.last_story_reward = story_reward_text
+        logger.success(
+            f"[{job.account_name}] Story reward claimed (userPrizeId={job.user_prize_id}, amount={job.amount})"
+        )
+        balance_result = await get_account_balance(account_data.bearer_token)
+        if isinstance(balance_result, dict):
+            apply_balance_to_account(account_data, balance_result)
+        await check_and_claim_rewards(account_data.bearer_token, account_data)
+        username = f"@{account_data.username}" if account_data.username else job.account_name
+        await send_notification(md(
+            "🎬 Story reward claimed\n\n"
+            "User {username} claimed a story reward and received {reward}\\.",
+            username=username,
+            reward=story_reward_text,
+        ))
+        return False
+
+
+story_rewards = StoryRewardPipeline()
+
+
 async def send_notification(message: str):
+    """Queue an admin notification; delivery happens in the background.
+
+    Plain strings are escaped as a whole; pass an ``md()`` result to keep formatting.
+    """
     try:
         logger.info(f"Sending notification: {message[:50]}...")
-        escaped_message = message.replace('.', '\\.')
-        escaped_message = escaped_message.replace('-', '\\-')
-        escaped_message = escaped_message.replace('!', '\\!')
-        escaped_message = escaped_message.replace('(', '\\(')
-        escaped_message = escaped_message.replace(')', '\\)')
-        escaped_message = escaped_message.replace('_', '\\_')
-        escaped_message = escaped_message.replace('*', '\\*')
-        escaped_message = escaped_message.replace('[', '\\[')
-        escaped_message = escaped_message.replace(']', '\\]')
-        escaped_message = escaped_message.replace('~', '\\~')
-        escaped_message = escaped_message.replace('`', '\\`')
-        escaped_message = escaped_message.replace('>', '\\>')
-        escaped_message = escaped_message.replace('#', '\\#')
-        escaped_message = escaped_message.replace('+', '\\+')
-        escaped_message = escaped_message.replace('=', '\\=')
-        escaped_message = escaped_message.replace('|', '\\|')
-        escaped_message = escaped_message.replace('{', '\\{')
-        escaped_message = escaped_message.replace('}', '\\}')
-        await bot_instance.send_message(admin_id, escaped_message, parse_mode="MarkdownV2")
+        if shard_link is not None:
+            shard_link.notify(escape_markdown_v2(message))
+        else:
+            notification_queue.put(escape_markdown_v2(message))
         return True
     except Exception as e:
-        logger.error(f"Failed to send notification: {e}")
+        logger.error(f"Failed to queue notification: {e}")
         return False
 
 async def calculate_hours_until_roulette(next_roulette_time: str) -> int:
     try:
         if next_roulette_time and next_roulette_time != "Unknown":
             dt = datetime.fromisoformat(next_roulette_time.replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
+            now = server_clock.now()
             diff = dt - now
             return max(0, int(diff.total_seconds() / 3600))
     except (ValueError, TypeError):
@@ -2223,20 +4370,24 @@ async def calculate_minutes_until_roulette(next_roulette_time: str) -> int:
     try:
         if next_roulette_time and next_roulette_time != "Unknown":
             dt = datetime.fromisoformat(next_roulette_time.replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
+            now = server_clock.now()
             diff = dt - now
             return max(0, int(diff.total_seconds() / 60))
     except (ValueError, TypeError):
         pass
     return 0
 
-async def format_number_with_spaces(number):
+def format_number(number) -> str:
     if isinstance(number, str) and number.isdigit():
         number = int(number)
     if isinstance(number, (int, float)):
         return f"{number:,}".replace(",", " ")
     return str(number)
 
+
+async def format_number_with_spaces(number):
+    return format_number(number)
+
 async def notification_scheduler():
     last_notified_hours = {}
     
@@ -2245,7 +4396,7 @@ async def notification_scheduler():
             current_time = datetime.now(timezone.utc)
         
             if current_time.minute == 0 and current_time.second < 60:
-                for account_name, account_data in account_manager.accounts.items():
+                for account_name, account_data in list(account_manager.accounts.items()):
                     if account_data.next_roulette_time and account_data.next_roulette_time != "Unknown":
                         hours_left = await calculate_hours_until_roulette(account_data.next_roulette_time)
                         minutes_left = await calculate_minutes_until_roulette(account_data.next_roulette_time)
@@ -2254,7 +4405,11 @@ async def notification_scheduler():
                         if hours_left >= 1 and hours_left <= 23:
                             key = f"{account_name}_{hours_left}h"
                             if key not in last_notified_hours:
-                                message = f"⏰ *Countdown Alert*\n\n`@{account_data.username}` \- {hours_left} hours left until next roulette\!"
+                                message = md(
+                                    "⏰ *Countdown Alert*\n\n`@{username}` \\- {hours} hours left until next roulette\\!",
+                                    username=account_data.username,
+                                    hours=hours_left,
+                                )
                                 await send_notification(message)
                                 last_notified_hours[key] = True
                         
@@ -2266,7 +4421,7 @@ async def notification_scheduler():
             
         
             elif current_time.second < 60:
-                for account_name, account_data in account_manager.accounts.items():
+                for account_name, account_data in list(account_manager.accounts.items()):
                     if account_data.next_roulette_time and account_data.next_roulette_time != "Unknown":
                         minutes_left = await calculate_minutes_until_roulette(account_data.next_roulette_time)
                         
@@ -2274,7 +4429,10 @@ async def notification_scheduler():
                         if minutes_left == 30 and current_time.second == 0:
                             key = f"{account_name}_30m"
                             if key not in last_notified_hours:
-                                message = f"⏰ *Final Countdown*\n\n`@{account_data.username}` \- 30 minutes left until roulette\!"
+                                message = md(
+                                    "⏰ *Final Countdown*\n\n`@{username}` \\- 30 minutes left until roulette\\!",
+                                    username=account_data.username,
+                                )
                                 await send_notification(message)
                                 last_notified_hours[key] = True
                         
@@ -2282,7 +4440,10 @@ async def notification_scheduler():
                         elif minutes_left == 5 and current_time.second == 0:
                             key = f"{account_name}_5m"
                             if key not in last_notified_hours:
-                                message = f"🚨 *Last Call*\n\n`@{account_data.username}` \- Only 5 minutes left\!"
+                                message = md(
+                                    "🚨 *Last Call*\n\n`@{username}` \\- Only 5 minutes left\\!",
+                                    username=account_data.username,
+                                )
                                 await send_notification(message)
                                 last_notified_hours[key] = True
             
@@ -2291,19 +4452,195 @@ async def notification_scheduler():
             logger.error(f"Error in notification scheduler: {e}")
             await asyncio.sleep(60)
 
-async def main():
-    global bot_instance, dp
-    
-    logger.success("Account initializing started...")
-    
+_account_reload_lock = asyncio.Lock()
 
-    bot_instance = Bot(token=bot_token)
-    dp = Dispatcher()
-    
 
-    await setup_bot_handlers()
-    
+def read_account_configs() -> Dict[str, dict]:
+    """Re-read account sets: .env is authoritative for its keys, the process environment for the rest."""
+    environ = {key: value for key, value in os.environ.items() if key not in _STARTUP_DOTENV_KEYS}
+    if DOTENV_PATH:
+        environ.update({key: value for key, value in dotenv_values(DOTENV_PATH).items() if value is not None})
+    return owned_account_configs(load_account_configs(environ))
+
 
+async def start_account(account_name: str, config: dict) -> bool:
+    """Start, authenticate and schedule one account added at runtime."""
+    ACCOUNT_CONFIGS[account_name] = config
+    if not await initialize_account_client(account_name, config, account_manager):
+        return False
+    if not await get_account_token_and_username(account_name, config, account_manager):
+        return False
+    account_data = account_manager.accounts[account_name]
+    if state_store.has_state(account_name):
+        reconcile_in_background(account_name, {account_name: account_data})
+    else:
+        await reconcile_accounts_on_startup({account_name: account_data})
+    return True
+
+
+async def drain_account(account_name: str):
+    """Remove an account once its in-flight spin / case flow (if any) has finished."""
+    await cancel_reconciles(account_name)
+    async with account_manager.account_lock(account_name):
+        account_data = account_manager.accounts.pop(account_name, None)
+        ACCOUNT_CONFIGS.pop(account_name, None)
+    await state_store.flush()
+    state_store.forget(account_name)
+    status_render_cache.invalidate(account_name)
+    if account_data is not None and account_data.client is not None:
+        try:
+            await account_data.client.stop()
+        except Exception as e:
+            logger.warning(f"[{account_name}] Client stop failed: {e}")
+    account_manager.release_lease(account_name)
+    logger.info(f"[{account_name}] Removed from the account set")
+
+
+async def reload_account_configs() -> dict:
+    """Diff .env accounts against the running set; start new ones, drain removed ones.
+
+    An account whose credentials changed is drained and started again; untouched accounts
+    keep their clients, tokens and timers.
+    """
+    if shard_supervisor is not None:
+        return await shard_supervisor.reload()
+    async with _account_reload_lock:
+        configs = read_account_configs()
+        added = [name for name in configs if name not in ACCOUNT_CONFIGS]
+        removed = [name for name in ACCOUNT_CONFIGS if name not in configs]
+        changed = [name for name in configs if name in ACCOUNT_CONFIGS and configs[name] != ACCOUNT_CONFIGS[name]]
+        if not (added or removed or changed):
+            return {"added": [], "removed": [], "changed": [], "failed": []}
+
+        logger.info(f"Account config changed: +{added} -{removed} ~{changed}")
+        await asyncio.gather(*(drain_account(name) for name in removed + changed))
+        results = await asyncio.gather(*(start_account(name, configs[name]) for name in changed + added))
+        failed = [name for name, ok in zip(changed + added, results) if not ok]
+        return {"added": added, "removed": removed, "changed": changed, "failed": failed}
+
+
+async def watch_account_configs():
+    """Poll the .env mtime and reload the account set when it changes."""
+    if not DOTENV_PATH or ACCOUNTS_WATCH_INTERVAL <= 0 or SHARD_INDEX is not None:
+        return
+    path = Path(DOTENV_PATH)
+    last_mtime = path.stat().st_mtime if path.exists() else None
+    while True:
+        await asyncio.sleep(ACCOUNTS_WATCH_INTERVAL)
+        try:
+            mtime = path.stat().st_mtime if path.exists() else None
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            summary = await reload_account_configs()
+            if any(summary.values()):
+                await send_notification(format_reload_summary(summary))
+        except Exception as e:
+            logger.error(f"Account config watcher error: {e}")
+
+
+async def watch_account_leases():
+    """Retry accounts skipped because another process held their session; take over once it is gone."""
+    if fcntl is None or LEASE_RETRY_INTERVAL <= 0:
+        return
+    while True:
+        await asyncio.sleep(LEASE_RETRY_INTERVAL)
+        for account_name in sorted(account_manager.lease_blocked):
+            config = ACCOUNT_CONFIGS.get(account_name)
+            if config is None:
+                account_manager.lease_blocked.discard(account_name)
+                continue
+            try:
+                async with _account_reload_lock:
+                    if account_name in account_manager.accounts or account_name not in account_manager.lease_blocked:
+                        continue
+                    if await start_account(account_name, config):
+                        await send_notification(f"🔓 {account_name}: session lease taken over, account running")
+            except Exception as e:
+                logger.error(f"[{account_name}] Lease takeover failed: {e}")
+
+
+def format_reload_summary(summary: dict) -> MarkdownV2:
+    if not any(summary.values()):
+        return md("🔄 *Accounts reloaded*\n\nNo changes")
+    lines = [md("🔄 *Accounts reloaded*\n")]
+    for key, label in (("added", "Added"), ("removed", "Removed"), ("changed", "Restarted"), ("failed", "Failed")):
+        if summary[key]:
+            lines.append(md("{label}: `{names}`", label=label, names=", ".join(summary[key])))
+    return MarkdownV2("\n".join(lines))
+
+
+async def reconcile_accounts_on_startup(accounts: Dict[str, AccountData]):
+    """Refresh timers/balances from the API and collect Virus/Stars left in inventory.
+
+    Each step holds the account's lock and skips accounts drained meanwhile, so a reload
+    removing an account waits for its step instead of racing the client shutdown.
+    """
+    async def update(account_name: str, account_data: AccountData):
+        async with account_manager.account_lock(account_name):
+            if account_manager.accounts.get(account_name) is account_data:
+                await update_single_account_status(account_name, account_data)
+
+    update_tasks = [update(account_name, account_data) for account_name, account_data in accounts.items()]
+    if update_tasks:
+        await asyncio.gather(*update_tasks, return_exceptions=True)
+
+    # On startup: collect Virus/Stars prizes left in inventory
+    for account_name, account_data in accounts.items():
+        async with account_manager.account_lock(account_name):
+            if account_manager.accounts.get(account_name) is account_data and account_data.bearer_token:
+                await sweep_account_inventory(account_name, account_data)
+
+
+async def sweep_account_inventory(account_name: str, account_data: AccountData) -> bool:
+    """Claim Virus/Stars left in the account's inventory and refresh its balance; True if anything was claimed."""
+    try:
+        logger.info(f"[{account_name}] Checking inventory for unclaimed Virus/Stars...")
+        claimed = await check_and_claim_rewards(account_data.bearer_token, account_data)
+        if claimed:
+            balance_data = await get_account_balance(account_data.bearer_token)
+            if isinstance(balance_data, dict):
+                apply_balance_to_account(account_data, balance_data)
+                logger.success(
+                    f"[{account_name}] Inventory collected | Stars: {balance_data.get('stars_balance')} | "
+                    f"Virus: {balance_data.get('virus_balance')}"
+                )
+            return True
+        logger.info(f"[{account_name}] No claimable Virus/Stars in inventory")
+    except Exception as e:
+        logger.error(f"[{account_name}] Inventory claim failed: {e}")
+    return False
+
+
+# Background reconciles of restored accounts, keyed by account name ("*" for the startup batch);
+# the loop only holds weak references, so they are kept here until done and cancelled on shutdown.
+_reconcile_tasks: Dict[str, asyncio.Task] = {}
+
+
+def reconcile_in_background(key: str, accounts: Dict[str, AccountData]) -> asyncio.Task:
+    task = asyncio.create_task(reconcile_accounts_on_startup(accounts))
+    _reconcile_tasks[key] = task
+    task.add_done_callback(functools.partial(_reconcile_done, key))
+    return task
+
+
+def _reconcile_done(key: str, task: asyncio.Task):
+    if _reconcile_tasks.get(key) is task:
+        del _reconcile_tasks[key]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background reconcile ({key}) failed: {task.exception()}")
+
+
+async def cancel_reconciles(key: Optional[str] = None):
+    """Cancel the background reconcile for ``key``, or all of them, and wait for them to stop."""
+    tasks = list(_reconcile_tasks.values()) if key is None else [t for t in (_reconcile_tasks.get(key),) if t]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def start_accounts():
+    """Start clients, authenticate and bring every configured account up to date."""
     token_tasks = []
     
     for account_name, config in ACCOUNT_CONFIGS.items():
@@ -2314,75 +4651,495 @@ async def main():
             token_tasks.append(get_account_token_and_username(account_name, config, account_manager))
     
     await asyncio.gather(*token_tasks)
-    
-    update_tasks = []
+
+    # Accounts with persisted deadlines are scheduled right away and reconciled with the API
+    # in the background; accounts seen for the first time are fetched before the worker starts.
+    fresh = {}
+    restored = {}
     for account_name, account_data in account_manager.accounts.items():
         if account_data.bearer_token:
-            update_tasks.append(update_single_account_status(account_name, account_data))
-    
-    if update_tasks:
-        await asyncio.gather(*update_tasks, return_exceptions=True)
+            (restored if state_store.has_state(account_name) else fresh)[account_name] = account_data
 
-    # On startup: collect Virus/Stars prizes left in inventory
+    await reconcile_accounts_on_startup(fresh)
+    if restored:
+        logger.info(f"Resuming {len(restored)} account(s) from persisted timers; reconciling in background")
+        reconcile_in_background("*", restored)
+
+
+async def run_account_flow(account_name: str, account_data: AccountData, roulette_ready: bool):
+    async with account_manager.account_lock(account_name):
+        if account_manager.accounts.get(account_name) is not account_data:
+            return  # removed by a config reload while we waited
+        if roulette_ready:
+            observe_scheduler_lag("roulette", account_data.next_roulette_time)
+            success = await process_account_roulette(account_name, account_data)
+            timers = await get_me_free_timers(account_data.bearer_token)
+            if timers.get('next_free_spin') is not None:
+                account_data.next_roulette_time = timers['next_free_spin']
+            if timers.get('next_case_free_spin') is not None:
+                account_data.next_case_free_spin = timers['next_case_free_spin']
+            if success is False and timers.get('next_free_spin'):
+                account_data.next_roulette_time = timers['next_free_spin']
+        else:
+            observe_scheduler_lag("case", account_data.next_case_free_spin)
+            await process_account_free_case(account_name, account_data)
+            timers = await get_me_free_timers(account_data.bearer_token)
+            if timers.get('next_case_free_spin') is not None:
+                account_data.next_case_free_spin = timers['next_case_free_spin']
+
+
+def scheduler_sleep_seconds(attempted: set) -> float:
+    """Sleep until the next unlock (+ SPIN_UNLOCK_MARGIN), polling at least every SCHEDULER_POLL_INTERVAL.
+
+    Accounts that were already run this pass and are still due (failed flows) wait for the
+    regular poll instead of being retried in a tight loop.
+    """
+    delay = SCHEDULER_POLL_INTERVAL
     for account_name, account_data in account_manager.accounts.items():
         if not account_data.bearer_token:
             continue
+        blocked = mtproto_limiter.blocked_for(account_name)
+        for next_time in (account_data.next_roulette_time, getattr(account_data, 'next_case_free_spin', None)):
+            due = max(reward_due_in(next_time, SPIN_UNLOCK_MARGIN), blocked)
+            if due > 0 or account_name not in attempted:
+                delay = min(delay, max(due, 0.0))
+    return delay
+
+
+async def roulette_worker():
+    while True:
         try:
-            logger.info(f"[{account_name}] Checking inventory for unclaimed Virus/Stars...")
-            claimed = await check_and_claim_rewards(account_data.bearer_token, account_data)
-            if claimed:
-                balance_data = await get_account_balance(account_data.bearer_token)
-                if isinstance(balance_data, dict):
-                    apply_balance_to_account(account_data, balance_data)
-                    logger.success(
-                        f"[{account_name}] Inventory collected | Stars: {balance_data.get('stars_balance')} | "
-                        f"Virus: {balance_data.get('virus_balance')}"
-                    )
-            else:
-                logger.info(f"[{account_name}] No claimable Virus/Stars in inventory")
+            attempted = set()
+            for account_name, account_data in list(account_manager.accounts.items()):
+                if not account_data.bearer_token:
+                    continue
+                if mtproto_limiter.blocked_for(account_name):
+                    # Long FLOOD_WAIT pending: scheduler_sleep_seconds wakes up when it ends
+                    continue
+                try:
+                    roulette_ready = is_free_reward_ready(account_data.next_roulette_time, SPIN_UNLOCK_MARGIN)
+                    case_ready = is_free_reward_ready(getattr(account_data, 'next_case_free_spin', None), SPIN_UNLOCK_MARGIN)
+                    if roulette_ready or case_ready:
+                        attempted.add(account_name)
+                        await run_account_flow(account_name, account_data, roulette_ready)
+                except Exception as e:
+                    logger.error(f"[{account_name}] Error in roulette worker: {e}")
+
+            await asyncio.sleep(scheduler_sleep_seconds(attempted))
         except Exception as e:
-            logger.error(f"[{account_name}] Startup inventory claim failed: {e}")
+            logger.error(f"Error in roulette worker: {e}")
+            await asyncio.sleep(20)
+
+
+# Sharded mode: WORKER_PROCESSES > 1 runs a supervisor (admin bot, dashboard, notification queue)
+# and one worker process per shard (clients, scheduler, state store writes). They talk over a
+# unix socket with newline-delimited JSON messages.
+
+SHARD_STATE_INTERVAL = 1.0
+SHARD_METRICS_EVERY = 5  # state intervals between metrics snapshots
+SHARD_FULL_STATE_EVERY = 30  # state intervals between full (not just changed) pushes
+SHARD_STREAM_LIMIT = 16 * 1024 * 1024
+REMOTE_TOKEN = "<shard>"  # mirrors only need to know that the worker holds a token
+
+shard_link: Optional["ShardWorkerLink"] = None
+shard_supervisor: Optional["ShardSupervisor"] = None
+
+
+async def write_shard_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json_dumps_bytes(message) + b"\n")
+    await writer.drain()
 
-    await start_dashboard_server()
 
-    async def roulette_worker():
+class RemoteClient:
+    """Client placeholder on supervisor mirrors; reports the owning shard's connection state."""
+
+    def __init__(self, shard: int, is_connected: bool = False):
+        self.shard = shard
+        self.is_connected = is_connected
+
+
+def account_state_record(account_name: str, account_data: AccountData) -> dict:
+    client = account_data.client
+    record = {name: getattr(account_data, name) for name in PERSISTED_FIELDS}
+    record.update(
+        name=account_name,
+        authenticated=bool(account_data.bearer_token),
+        online=bool(client and getattr(client, "is_connected", False)),
+    )
+    return record
+
+
+class ShardWorkerLink:
+    """Worker side of the IPC: pushes account state and metrics, forwards notifications, answers commands."""
+
+    def __init__(self, index: int, socket_path: str):
+        self.index = index
+        self.socket_path = socket_path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._write_lock = asyncio.Lock()
+        self._sent_revisions: Dict[str, int] = {}
+        # Notification sends and command handlers; the loop keeps only weak references
+        self._tasks: set = set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Shard {self.index} background task failed: {task.exception()}")
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=SHARD_STREAM_LIMIT)
+        await self.send({"type": "hello", "shard": self.index, "pid": os.getpid()})
+
+    async def send(self, message: dict):
+        async with self._write_lock:
+            await write_shard_message(self._writer, message)
+
+    def notify(self, text: str):
+        self._spawn(self.send({"type": "notify", "text": text}))
+
+    async def publish_state(self, full: bool = False):
+        accounts = []
+        for account_name, account_data in list(account_manager.accounts.items()):
+            if full or self._sent_revisions.get(account_name) != account_data.revision:
+                self._sent_revisions[account_name] = account_data.revision
+                accounts.append(account_state_record(account_name, account_data))
+        for account_name in set(self._sent_revisions) - set(account_manager.accounts):
+            del self._sent_revisions[account_name]
+        await self.send({
+            "type": "state",
+            "shard": self.index,
+            "accounts": accounts,
+            "names": list(account_manager.accounts),
+            "clock_offset": server_clock.offset,
+        })
+
+    async def serve(self):
+        """Handle supervisor commands until the connection closes."""
+        publisher = asyncio.create_task(self._publish_loop())
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                message = json_loads(line)
+                if message.get("type") == "command":
+                    self._spawn(self._handle_command(message))
+        finally:
+            publisher.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+
+    async def _publish_loop(self):
+        tick = 0
+        await self.publish_state(full=True)
         while True:
+            await asyncio.sleep(SHARD_STATE_INTERVAL)
+            tick += 1
             try:
-                for account_name, account_data in account_manager.accounts.items():
-                    if not account_data.bearer_token:
-                        continue
-                    try:
-                        roulette_ready = is_free_reward_ready(account_data.next_roulette_time)
-                        case_ready = is_free_reward_ready(getattr(account_data, 'next_case_free_spin', None))
-
-                        if roulette_ready:
-                            success = await process_account_roulette(account_name, account_data)
-                            timers = await get_me_free_timers(account_data.bearer_token)
-                            if timers.get('next_free_spin') is not None:
-                                account_data.next_roulette_time = timers['next_free_spin']
-                            if timers.get('next_case_free_spin') is not None:
-                                account_data.next_case_free_spin = timers['next_case_free_spin']
-                            if success is False and timers.get('next_free_spin'):
-                                account_data.next_roulette_time = timers['next_free_spin']
-                        elif case_ready:
-                            await process_account_free_case(account_name, account_data)
-                            timers = await get_me_free_timers(account_data.bearer_token)
-                            if timers.get('next_case_free_spin') is not None:
-                                account_data.next_case_free_spin = timers['next_case_free_spin']
-                    except Exception as e:
-                        logger.error(f"[{account_name}] Error in roulette worker: {e}")
-
-                await asyncio.sleep(10)
+                await self.publish_state(full=tick % SHARD_FULL_STATE_EVERY == 0)
+                if tick % SHARD_METRICS_EVERY == 0:
+                    await self.send({"type": "metrics", "shard": self.index, "metrics": metrics.snapshot()})
             except Exception as e:
-                logger.error(f"Error in roulette worker: {e}")
-                await asyncio.sleep(20)
-    
-    
-    asyncio.create_task(roulette_worker())
+                logger.error(f"Shard {self.index} state push failed: {e}")
+
+    async def _handle_command(self, message: dict):
+        command = message.get("command")
+        args = message.get("args") or {}
+        try:
+            if command == "refresh":
+                await refresh_all_account_status()
+                result = True
+            elif command == "reload":
+                result = await reload_account_configs()
+            elif command == "traces":
+                account = args.get("account")
+                result = tracer.recent(account) if account else tracer.summary()
+            else:
+                raise ValueError(f"unknown command {command!r}")
+            await self.publish_state()
+            reply = {"type": "reply", "id": message.get("id"), "result": result}
+        except Exception as e:
+            reply = {"type": "reply", "id": message.get("id"), "error": str(e) or type(e).__name__}
+        await self.send(reply)
+
+
+class ShardSupervisor:
+    """Runs one worker process per shard, restarts crashed ones and mirrors their accounts locally."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.socket_path = str(Path(tempfile.gettempdir()) / f"virusroulette-{os.getpid()}.sock")
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self._runners: list = []
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._write_locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._stopping = False
+
+    def shard_of(self, account_name: str) -> int:
+        return account_shard(account_name, self.count)
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path, limit=SHARD_STREAM_LIMIT)
+        self._runners = [asyncio.create_task(self._run_worker(index)) for index in range(self.count)]
+        logger.success(f"Supervisor started {self.count} shard workers for {len(ACCOUNT_CONFIGS)} accounts")
+
+    async def _run_worker(self, index: int):
+        backoff = 1
+        while not self._stopping:
+            env = {
+                **os.environ,
+                "VR_SHARD_INDEX": str(index),
+                "VR_SHARD_COUNT": str(self.count),
+                "VR_SHARD_SOCKET": self.socket_path,
+            }
+            started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(sys.executable, str(Path(__file__).resolve()), env=env)
+            self._processes[index] = process
+            logger.info(f"Shard {index} running as pid {process.pid}")
+            code = await process.wait()
+            if self._stopping:
+                return
+            if time.monotonic() - started > 60:
+                backoff = 1
+            logger.error(f"Shard {index} exited with code {code}; restarting in {backoff}s")
+            await send_notification(f"⚠️ Shard {index} exited with code {code}, restarting")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        shard = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json_loads(line)
+                kind = message.get("type")
+                if kind == "hello":
+                    shard = message["shard"]
+                    self._writers[shard] = writer
+                    self._write_locks[shard] = asyncio.Lock()
+                elif kind == "state":
+                    self._apply_state(message)
+                elif kind == "notify":
+                    notification_queue.put(MarkdownV2(message["text"]))
+                elif kind == "metrics":
+                    metrics.set_remote(f"shard{message['shard']}", message["metrics"])
+                elif kind == "reply":
+                    future = self._pending.pop(message.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(message)
+        except Exception as e:
+            logger.error(f"Shard {shard} connection error: {e}")
+        finally:
+            if shard is not None and self._writers.get(shard) is writer:
+                del self._writers[shard]
+                for account_data in account_manager.accounts.values():
+                    client = account_data.client
+                    if isinstance(client, RemoteClient) and client.shard == shard:
+                        client.is_connected = False
+            writer.close()
+
+    def _apply_state(self, message: dict):
+        shard = message["shard"]
+        # The supervisor makes no GraphQL calls; show timers on the workers' server clock
+        server_clock.offset = message.get("clock_offset", server_clock.offset)
+        for record in message["accounts"]:
+            account_name = record["name"]
+            account_data = account_manager.accounts.get(account_name)
+            if account_data is None:
+                account_data = AccountData(
+                    name=account_name,
+                    username="",
+                    balance=0,
+                    next_roulette_time="Unknown",
+                    bearer_token=None,
+                    client=RemoteClient(shard),
+                    subscribed_channels=set(),
+                    interacted_bots=set(),
+                )
+                account_manager.accounts[account_name] = account_data
+            # Only assign what changed so mirror revisions (and cached /start lines) stay put
+            for name in PERSISTED_FIELDS:
+                if getattr(account_data, name) != record[name]:
+                    setattr(account_data, name, record[name])
+            token = REMOTE_TOKEN if record["authenticated"] else None
+            if account_data.bearer_token != token:
+                account_data.bearer_token = token
+            account_data.client.shard = shard
+            account_data.client.is_connected = record["online"]
+        names = set(message["names"])
+        for account_name, account_data in list(account_manager.accounts.items()):
+            client = account_data.client
+            if isinstance(client, RemoteClient) and client.shard == shard and account_name not in names:
+                del account_manager.accounts[account_name]
+                status_render_cache.invalidate(account_name)
+
+    async def request(self, shard: int, command: str, timeout: float = 120, **args):
+        writer = self._writers.get(shard)
+        if writer is None:
+            raise RuntimeError(f"shard {shard} is not connected")
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_locks[shard]:
+                await write_shard_message(writer, {"type": "command", "id": request_id, "command": command, "args": args})
+            reply = await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in reply:
+            raise RuntimeError(f"shard {shard}: {reply['error']}")
+        return reply.get("result")
+
+    async def broadcast(self, command: str, timeout: float = 120, **args) -> list:
+        shards = sorted(self._writers)
+        results = await asyncio.gather(
+            *(self.request(shard, command, timeout, **args) for shard in shards),
+            return_exceptions=True,
+        )
+        for shard, result in zip(shards, results):
+            if isinstance(result, Exception):
+                logger.error(f"Shard {shard} {command} failed: {result}")
+        return [result for result in results if not isinstance(result, Exception)]
+
+    async def reload(self) -> dict:
+        """Reload .env in every shard (each applies its own slice) and merge their summaries."""
+        ACCOUNT_CONFIGS.clear()
+        ACCOUNT_CONFIGS.update(read_account_configs())
+        summary = {"added": [], "removed": [], "changed": [], "failed": []}
+        for shard_summary in await self.broadcast("reload"):
+            for key in summary:
+                summary[key].extend(shard_summary.get(key) or [])
+        return summary
+
+    async def stop(self):
+        self._stopping = True
+        for runner in self._runners:
+            runner.cancel()
+        running = [process for process in self._processes.values() if process.returncode is None]
+        for process in running:
+            process.terminate()
+        for process in running:
+            try:
+                await asyncio.wait_for(process.wait(), 20)
+            except asyncio.TimeoutError:
+                process.kill()
+        if self._server is not None:
+            self._server.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+async def run_shard_worker():
+    """Worker process: owns its shard's clients, scheduler and state store writes; no bot, no dashboard."""
+    global shard_link
+
+    configure()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    shard_link = ShardWorkerLink(SHARD_INDEX, SHARD_SOCKET)
+    await shard_link.connect()
+    tracer.start()
+    state_store.open()
+    state_store.start()
+    logger.success(f"Shard {SHARD_INDEX}/{SHARD_COUNT} starting {len(ACCOUNT_CONFIGS)} accounts...")
+    background_tasks = []
+    try:
+        await start_accounts()
+        background_tasks.append(asyncio.create_task(roulette_worker()))
+        background_tasks.append(asyncio.create_task(watch_account_leases()))
+        await shard_link.serve()
+        logger.warning(f"Shard {SHARD_INDEX}: supervisor connection closed, shutting down")
+    except asyncio.CancelledError:
+        logger.info(f"Shard {SHARD_INDEX} stopping")
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        await cancel_reconciles()
+        for account_name, account_data in list(account_manager.accounts.items()):
+            try:
+                if account_data.client:
+                    await account_data.client.stop()
+            except Exception:
+                pass
+        await story_rewards.stop()
+        await close_http_session()
+        await tracer.stop()
+        await state_store.stop()
+
+
+async def create_app():
+    """Load the accounts and build the admin bot with its handlers; nothing is started yet."""
+    global bot_instance, dp
+
+    configure()
+    if not bot_token or not admin_id:
+        raise SystemExit("BOT_TOKEN and ADMIN_ID must be set in .env")
+    from aiogram import Bot, Dispatcher
+
+    bot_instance = Bot(token=bot_token)
+    dp = Dispatcher()
+    await setup_bot_handlers()
+    return bot_instance, dp
+
+
+async def main():
+    global shard_supervisor
+
+    if SHARD_INDEX is not None:
+        await run_shard_worker()
+        return
     
+    logger.success("Account initializing started...")
+    await create_app()
+    notification_queue.start()
+    state_store.open()
+    state_store.start()
+
+    if WORKER_PROCESSES > 1:
+        shard_supervisor = ShardSupervisor(WORKER_PROCESSES)
+        await shard_supervisor.start()
+    else:
+        tracer.start()
+        await start_accounts()
+
+    await start_dashboard_server()
+
+    background_tasks = [asyncio.create_task(watch_account_configs())]
+    if shard_supervisor is None:
+        background_tasks.append(asyncio.create_task(roulette_worker()))
+        background_tasks.append(asyncio.create_task(watch_account_leases()))
 
     logger.success("TG Bot started successfully...")
-    await dp.start_polling(bot_instance)
+    try:
+        await dp.start_polling(bot_instance)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        if shard_supervisor is not None:
+            await shard_supervisor.stop()
+        await cancel_reconciles()
+        await story_rewards.stop()
+        await notification_queue.stop()
+        await close_http_session()
+        await tracer.stop()
+        await state_store.stop()
 
 async def initialize_account_client(account_name, config, account_manager):
     try:
@@ -2402,9 +5159,13 @@ async def initialize_account_client(account_name, config, account_manager):
             )
             return False
 
+        if not account_manager.acquire_lease(account_name, session_name):
+            return False
+
         success = await account_manager.initialize_account(account_name, config)
         if not success:
             logger.error(f"[{account_name}] Failed to initialize account")
+            account_manager.release_lease(account_name)
             return False
 
         try:
@@ -2417,6 +5178,7 @@ async def initialize_account_client(account_name, config, account_manager):
                 del account_manager.accounts[account_name]
             except Exception:
                 pass
+            account_manager.release_lease(account_name)
             return False
     except Exception as e:
         logger.error(f"[{account_name}] Unexpected error during initialization: {e}")
@@ -2451,7 +5213,9 @@ async def get_account_token_and_username(account_name, config, account_manager):
         logger.error(f"[{account_name}] Error during authentication: {e}")
     return False
 
-if __name__ == "__main__":
+def run_service():
+    """``python main.py run``: the long-running bot, dashboard and scheduler."""
+    install_fast_runtime()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -2459,7 +5223,7 @@ if __name__ == "__main__":
         try:
             async def shutdown():
                 try:
-                    for account_name, account_data in account_manager.accounts.items():
+                    for account_name, account_data in list(account_manager.accounts.items()):
                         try:
                             if account_data.client:
                                 await account_data.client.stop()
@@ -2476,3 +5240,199 @@ if __name__ == "__main__":
             asyncio.run(shutdown())
         except Exception:
             pass
+
+
+def select_accounts(names: Optional[list]) -> list:
+    """Configured account names to work on: all of them, or the ones named on the command line."""
+    if not names:
+        return list(ACCOUNT_CONFIGS)
+    unknown = [name for name in names if name not in ACCOUNT_CONFIGS]
+    if unknown:
+        raise SystemExit(f"Unknown account(s): {', '.join(unknown)} (configured: {', '.join(ACCOUNT_CONFIGS) or 'none'})")
+    return list(dict.fromkeys(names))
+
+
+async def start_selected_accounts(names: list, concurrency: int) -> Dict[str, AccountData]:
+    """Start and authenticate only ``names``, at most ``concurrency`` at a time; returns the ready ones.
+
+    Accounts leased by a running bot are skipped, so a one-shot command never races the service.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def start(account_name: str):
+        async with semaphore:
+            config = ACCOUNT_CONFIGS[account_name]
+            if await initialize_account_client(account_name, config, account_manager):
+                await get_account_token_and_username(account_name, config, account_manager)
+
+    await asyncio.gather(*(start(name) for name in names))
+    return {
+        name: account_data
+        for name, account_data in account_manager.accounts.items()
+        if name in names and account_data.bearer_token
+    }
+
+
+@asynccontextmanager
+async def one_shot():
+    """State store and teardown for commands that exit when done (no bot, dashboard or scheduler).
+
+    Admin notifications are not sent; outcomes are logged and recorded in the state store.
+    """
+    configure()
+    state_store.open()
+    state_store.start()
+    try:
+        yield
+    finally:
+        await story_rewards.stop()
+        for account_name, account_data in list(account_manager.accounts.items()):
+            try:
+                if account_data.client:
+                    await account_data.client.stop()
+            except Exception:
+                pass
+            account_manager.release_lease(account_name)
+        await close_http_session()
+        await state_store.stop()
+        await logger.complete()
+
+
+async def run_sweep(names: Optional[list], concurrency: int) -> int:
+    """``sweep``: claim Virus/Stars left in every (selected) account's inventory."""
+    async with one_shot():
+        selected = select_accounts(names)
+        ready = await start_selected_accounts(selected, concurrency)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def sweep(account_name: str, account_data: AccountData) -> bool:
+            async with semaphore:
+                return await sweep_account_inventory(account_name, account_data)
+
+        results = await asyncio.gather(*(sweep(name, account_data) for name, account_data in ready.items()))
+        await logger.complete()
+    print(
+        f"Swept {len(ready)}/{len(selected)} account(s): {sum(results)} with claims, "
+        f"{len(selected) - len(ready)} not started"
+    )
+    return 0 if len(ready) == len(selected) else 1
+
+
+async def run_status(names: Optional[list], live: bool, concurrency: int) -> int:
+    """``status``: balances and timers from the state store, or fetched from the API with ``--live``."""
+    async with one_shot():
+        selected = select_accounts(names)
+        if live:
+            ready = await start_selected_accounts(selected, concurrency)
+            await asyncio.gather(
+                *(update_single_account_status(name, account_data) for name, account_data in ready.items()),
+                return_exceptions=True,
+            )
+        accounts = {}
+        for account_name in selected:
+            account_data = account_manager.accounts.get(account_name)
+            if account_data is None:
+                account_data = AccountData(
+                    name=account_name,
+                    username="",
+                    balance=0,
+                    next_roulette_time="Unknown",
+                    bearer_token=None,
+                    client=None,
+                    subscribed_channels=set(),
+                    interacted_bots=set(),
+                )
+                state_store.restore(account_data)
+            accounts[account_name] = account_data
+        await logger.complete()
+    now = server_clock.now()
+    for account_name, account_data in accounts.items():
+        line = markdown_v2_to_plain(render_account_status_line(account_name, account_data, now)).rstrip()
+        print(f"{account_name:<12} {line}")
+    return 0
+
+
+async def run_spin(account_name: str, case: bool, force: bool = False) -> int:
+    """``spin ACCOUNT``: run one roulette spin (or free case) for a single account now.
+
+    Refuses while the free spin / case is still locked, since the flow would otherwise pay or
+    burn an attempt and move the account to the fallback schedule; ``force`` skips the check.
+    """
+    async with one_shot():
+        select_accounts([account_name])
+        ready = await start_selected_accounts([account_name], 1)
+        account_data = ready.get(account_name)
+        if account_data is None:
+            logger.error(f"[{account_name}] Not started (see above); nothing to do")
+            return 1
+        timers = await get_me_free_timers(account_data.bearer_token)
+        next_time = timers.get('next_case_free_spin' if case else 'next_free_spin')
+        if next_time is not None:
+            if case:
+                account_data.next_case_free_spin = next_time
+            else:
+                account_data.next_roulette_time = next_time
+        if not force and not is_free_reward_ready(next_time):
+            await logger.complete()
+            print(
+                f"{account_name}: free {'case' if case else 'spin'} not ready until {next_time} "
+                f"(in {format_status_countdown(next_time, server_clock.now())}); pass --force to run it anyway"
+            )
+            return 1
+        if case:
+            success = await process_account_free_case(account_name, account_data)
+        else:
+            success = await process_account_roulette(account_name, account_data)
+        # Story bonuses are claimed in the background; wait for them before exiting
+        await story_rewards.join()
+    return 0 if success else 1
+
+
+def build_cli_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="main.py", description="VirusGift roulette spinner")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.add_parser("run", help="start the bot, dashboard and scheduler (default)")
+
+    sweep = commands.add_parser("sweep", help="claim Virus/Stars left in inventory, then exit")
+    sweep.add_argument("--account", action="append", dest="accounts", metavar="NAME", help="only this account (repeatable)")
+    sweep.add_argument("--concurrency", type=int, default=5, help="accounts started and swept at once")
+
+    status = commands.add_parser("status", help="print balances and timers, then exit")
+    status.add_argument("--account", action="append", dest="accounts", metavar="NAME", help="only this account (repeatable)")
+    status.add_argument("--live", action="store_true", help="log in and fetch from the API instead of the state store")
+    status.add_argument("--concurrency", type=int, default=5, help="accounts started at once with --live")
+
+    spin = commands.add_parser("spin", help="spin the roulette for one account now, then exit")
+    spin.add_argument("account", metavar="ACCOUNT", help="configured account name, e.g. account3")
+    spin.add_argument("--case", action="store_true", help="open the free case instead")
+    spin.add_argument("--force", action="store_true", help="run even if the free spin / case is not ready yet")
+
+    commands.add_parser("bench", help="run bench/run_bench.py (remaining arguments are passed through)", add_help=False)
+    return parser
+
+
+def cli(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "bench":
+        from bench.run_bench import main as bench_main
+
+        bench_main(argv[1:])
+        return 0
+
+    args = build_cli_parser().parse_args(argv)
+    configure_logging(shard=SHARD_INDEX)
+    if args.command in (None, "run"):
+        run_service()
+        return 0
+    install_fast_runtime()
+    if args.command == "sweep":
+        return asyncio.run(run_sweep(args.accounts, args.concurrency))
+    if args.command == "status":
+        return asyncio.run(run_status(args.accounts, args.live, args.concurrency))
+    return asyncio.run(run_spin(args.account, args.case, args.force))
+
+
+if __name__ == "__main__":
+    sys.exit(cli())